@@ -2,29 +2,41 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_caching import Cache
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
-from flask_bcrypt import Bcrypt
 from flasgger import Swagger
+from werkzeug.middleware.proxy_fix import ProxyFix
+from app.utils.auth import init_auth
+from app.utils.metrics import Metrics
+from app.utils.database import RoutingSession, configure_database, install_sqlite_pragmas
+from app.utils.passwords import PasswordHasher
+from app.utils.ratelimit import InstrumentedLimiter, rate_limit_key
 from config import Config
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 jwt = JWTManager()
 cache = Cache()
-limiter = Limiter(key_func=get_remote_address)
-bcrypt = Bcrypt()
+limiter = InstrumentedLimiter(key_func=rate_limit_key)
+metrics = Metrics()
+passwords = PasswordHasher()
 swagger = Swagger()
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    
+    if app.config['PROXY_FIX_X_FOR']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
 
     # Initialize extensions
+    configure_database(app)
     db.init_app(app)
+    with app.app_context():
+        install_sqlite_pragmas(app, [*db.engines.values(), app.extensions['database_replica']])
+    metrics.init_app(app)
     jwt.init_app(app)
+    init_auth(app)
     cache.init_app(app)
     limiter.init_app(app)
-    bcrypt.init_app(app)
+    passwords.init_app(app)
     swagger.init_app(app)
 
     # Register blueprints
@@ -32,10 +44,36 @@ def create_app(config_class=Config):
     from app.routes.product_routes import product_bp
     from app.routes.order_routes import order_bp
     from app.routes.auth_routes import auth_bp
+    from app.routes.reservation_routes import reservation_bp
+    from app.routes.analytics_routes import analytics_bp
 
     app.register_blueprint(customer_bp)
     app.register_blueprint(product_bp)
     app.register_blueprint(order_bp)
     app.register_blueprint(auth_bp)
+    app.register_blueprint(reservation_bp)
+    app.register_blueprint(analytics_bp)
+    
+    from app.services.search import product_search
+    product_search.init_app(app)
+    
+    from app.services.reservations import reservations_cli
+    app.cli.add_command(reservations_cli)
+    
+    from app.utils.idempotency import idempotency_cli
+    app.cli.add_command(idempotency_cli)
+    
+    from app.services.analytics import analytics_cli
+    app.cli.add_command(analytics_cli)
+    
+    from app.services.catalog import catalog_cli
+    app.cli.add_command(catalog_cli)
+    
+    from app.services.jobs import job_queue
+    from app import tasks  # noqa: F401 -- registers the job handlers
+    job_queue.init_app(app)
+    
+    from app.utils.serializers import init_json
+    init_json(app)
 
     return app
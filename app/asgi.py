@@ -0,0 +1,230 @@
+import io
+import sys
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi
+from flask import abort, jsonify
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.exceptions import HTTPException
+from werkzeug.middleware.proxy_fix import ProxyFix
+from app import create_app, db, limiter
+from app.models.models import Order, OrderItem, Product
+from app.routes.product_routes import (
+    keyset_bound, page_columns, product_criteria, product_list_params, product_page_response, sort_keyset
+)
+from app.utils.auth import check_auth
+from app.utils.database import READ_METHODS, engine_options, install_sqlite_pragmas
+from app.utils.pagination import keyset_page, split_page
+from app.utils.serializers import (
+    ORDER_FIELDS, ORDER_ITEM_FIELDS, ORDER_ITEM_VERSION_COLUMNS, ORDER_VERSION_COLUMNS, PRODUCT_FIELDS,
+    PRODUCT_VERSION_COLUMNS, json_response, order_etag, product_etag
+)
+from config import Config
+
+# The async driver used for each backend when ASYNC_DATABASE_URL is unset
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg', 'mysql': 'aiomysql'}
+
+
+def async_database_url(url):
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f'No async driver known for {backend}; set ASYNC_DATABASE_URL')
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+
+def _environ(scope):
+    """A WSGI environ for an ASGI ``http`` scope whose body is not needed."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1').upper().replace('-', '_'), value.decode('latin-1')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def _unchanged(environ, start_response):
+    return environ
+
+
+def blocking(fn, *args):
+    """Await the synchronous ``fn`` on asgiref's thread pool, off the event loop.
+
+    For the Flask hooks, token check and rate limiter, whose cache,
+    limiter storage and database calls would otherwise stall every other
+    request on the loop. The request context follows the call into the
+    thread (it lives in context variables).
+    """
+    return sync_to_async(fn, thread_sensitive=False)(*args)
+
+
+def authorize():
+    """The token check, then the route's rate limit; returns the 401 response or None."""
+    denied = check_auth()
+    if denied is None:
+        limiter.check()
+    return denied
+
+
+async def get_product(engine, id):
+    denied = await blocking(authorize)
+    if denied is not None:
+        return denied
+    async with engine.connect() as conn:
+        product = (await conn.execute(
+            select(*PRODUCT_FIELDS.columns, *PRODUCT_VERSION_COLUMNS).where(Product.id == id)
+        )).first()
+    if product is None:
+        abort(404)
+    return json_response(PRODUCT_FIELDS.dump(product), etag=product_etag(product), last_modified=product.updated_at)
+
+
+async def list_products(engine):
+    denied = await blocking(authorize)
+    if denied is not None:
+        return denied
+    try:
+        params = product_list_params()
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    column, columns, descending = sort_keyset(params.get('sort', 'id'))
+    cursor = keyset_bound(params.get('after'), column)
+    query = select(*page_columns(column)).where(*product_criteria(params))
+    async with engine.connect() as conn:
+        rows = (await conn.execute(keyset_page(query, columns, cursor, params['limit'], descending))).all()
+    products, has_more = split_page(rows, params['limit'])
+    return product_page_response(products, has_more, params['limit'], column)
+
+
+async def get_order(engine, id):
+    denied = await blocking(authorize)
+    if denied is not None:
+        return denied
+    async with engine.connect() as conn:
+        order = (await conn.execute(select(*ORDER_FIELDS.columns, *ORDER_VERSION_COLUMNS).where(Order.id == id))).first()
+        if order is None:
+            abort(404)
+        if order.customer_id != get_jwt_identity():
+            return jsonify({'message': 'Unauthorized'}), 403
+        items = (await conn.execute(
+            select(*ORDER_ITEM_FIELDS.columns, *ORDER_ITEM_VERSION_COLUMNS).select_from(OrderItem).join(OrderItem.product)
+            .where(OrderItem.order_id == id).order_by(OrderItem.id)
+        )).all()
+    return json_response(
+        dict(ORDER_FIELDS.dump(order), items=ORDER_ITEM_FIELDS.dump_many(items)), etag=order_etag(order, items)
+    )
+
+
+class AsyncReadApp:
+    """ASGI front for the Flask app: hot reads on the async engine.
+
+    ``GET``/``HEAD`` requests for ``get_product``, ``list_products`` and
+    ``get_order`` run as coroutines that query through SQLAlchemy's async
+    engine, so a slow database or client costs a suspended task rather
+    than a worker thread. They still go through the Flask app's own
+    request context and hooks -- token check, rate limits, metrics, JSON
+    provider and ETag revalidation are shared, run on the thread pool --
+    but skip the view cache.
+    Everything else (writes, streamed lists, the remaining reads) is
+    handed to the WSGI app on asgiref's thread pool.
+    """
+
+    def __init__(self, app, engine):
+        self.app = app
+        self.engine = engine
+        self.fallback = WsgiToAsgi(app)
+        self.views = {
+            'product.get_product': get_product,
+            'product.list_products': list_products,
+            'order.get_order': get_order,
+        }
+        x_for = app.config['PROXY_FIX_X_FOR']
+        self._proxy_fix = ProxyFix(_unchanged, x_for=x_for) if x_for else None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http' or scope['method'] not in READ_METHODS:
+            return await self.fallback(scope, receive, send)
+
+        environ = _environ(scope)
+        try:
+            endpoint, args = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            endpoint = None
+        view = self.views.get(endpoint)
+        if view is None or 'stream' in parse_qs(environ['QUERY_STRING']):
+            return await self.fallback(scope, receive, send)
+        if self._proxy_fix is not None:
+            environ = self._proxy_fix(environ, None)
+
+        with self.app.request_context(environ):
+            try:
+                try:
+                    rv = await blocking(self.app.preprocess_request)
+                    if rv is None:
+                        rv = await view(self.engine, **args)
+                except Exception as e:
+                    rv = self.app.handle_user_exception(e)
+                response = await blocking(self.app.finalize_request, rv)
+            except Exception as e:
+                response = self.app.handle_exception(e)
+            # Lets werkzeug drop the body of HEAD, 204 and 304 answers
+            body, status, headers = response.get_wsgi_response(environ)
+            body = b''.join(body)
+
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_asgi_app(config_class=Config):
+    """Build the Flask app with ``create_app`` and wrap it for ASGI servers.
+
+    The async engine reads from ``ASYNC_DATABASE_URL`` when set, otherwise
+    from the replica (``DATABASE_REPLICA_URL``) or primary database with
+    its driver swapped for the async one (aiosqlite for SQLite), using the
+    same pool and SQLite settings as the sync engines.
+    """
+    app = create_app(config_class)
+    config = app.config
+    with app.app_context():
+        replica = app.extensions['database_replica']
+        url = config.get('ASYNC_DATABASE_URL') or async_database_url((replica or db.engine).url)
+    engine = create_async_engine(url, **engine_options(url, config))
+    install_sqlite_pragmas(app, [engine.sync_engine])
+    return AsyncReadApp(app, engine)
@@ -1,5 +1,8 @@
 from app import db
+from sqlalchemy import inspect
+from app.utils.cache import entity_tag
 from datetime import datetime
+import uuid
 
 class Customer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -7,9 +10,13 @@ class Customer(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     phone = db.Column(db.String(20))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     account = db.relationship('CustomerAccount', backref='customer', uselist=False)
     orders = db.relationship('Order', backref='customer', lazy=True)
 
+    def cache_tags(self):
+        return (entity_tag('customer', self.id),)
+
 class CustomerAccount(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -18,26 +25,179 @@ class CustomerAccount(db.Model):
     is_admin = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    def cache_tags(self):
+        return (entity_tag('customer', self.customer_id),)
+
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    price = db.Column(db.Float, nullable=False)
-    stock = db.Column(db.Integer, default=0)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    orders = db.relationship('OrderItem', backref='product', lazy=True)
+    price = db.Column(db.Float, nullable=False, index=True)
+    stock = db.Column(db.Integer, default=0, index=True)
+    # Units held by open reservations, kept in step with them by
+    # services.inventory so availability never needs a scan of the holds
+    reserved = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Optimistic locking for edits to the product itself: ORM flushes check
+    # and bump it, and Core edits (services.catalog) bump it themselves.
+    # Stock movements (services.inventory) are guarded on stock instead.
+    version_id = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    orders = db.relationship('OrderItem', back_populates='product', lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_product_available', stock - reserved),
+    )
+    __mapper_args__ = {'version_id_col': version_id}
+
+    @property
+    def available(self):
+        return (self.stock or 0) - (self.reserved or 0)
+
+    def cache_tags(self):
+        tags = (entity_tag('product', self.id), 'products')
+        # Order documents embed product names
+        if inspect(self).attrs.name.history.deleted:
+            tags += ('product-names',)
+        return tags
 
 class Order(db.Model):
+    # Serves per-customer history pages, keyset-ordered by (order_date, id)
+    __table_args__ = (
+        db.Index('ix_order_customer_id_order_date_id', 'customer_id', 'order_date', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
     order_date = db.Column(db.DateTime, default=datetime.utcnow)
     total_amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='pending')
-    items = db.relationship('OrderItem', backref='order', lazy=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version_id = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Lazy by default; read paths select plain columns (see
+    # utils.serializers) so detail stays a fixed number of queries
+    items = db.relationship('OrderItem', back_populates='order', lazy=True, order_by='OrderItem.id')
+
+    __mapper_args__ = {'version_id_col': version_id}
+
+    def cache_tags(self):
+        return (entity_tag('order', self.id), entity_tag('customer-orders', self.customer_id))
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
+    order = db.relationship('Order', back_populates='items')
+    product = db.relationship('Product', back_populates='orders')
+
+    def cache_tags(self):
+        return (entity_tag('order', self.order_id),)
+
+class Reservation(db.Model):
+    # The sweeper looks for held reservations past their expiry
+    __table_args__ = (
+        db.Index('ix_reservation_status_expires_at', 'status', 'expires_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False, index=True)
+    # held -> confirmed | released | expired
+    status = db.Column(db.String(20), nullable=False, default='held')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'))
+    items = db.relationship('ReservationItem', back_populates='reservation', lazy=True,
+                            order_by='ReservationItem.id')
+    order = db.relationship('Order')
+
+    def cache_tags(self):
+        return (entity_tag('reservation', self.id),)
+
+class ReservationItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    reservation_id = db.Column(db.Integer, db.ForeignKey('reservation.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    # Price at the time of the hold; confirming charges this
+    price = db.Column(db.Float, nullable=False)
+    reservation = db.relationship('Reservation', back_populates='items')
+    product = db.relationship('Product')
+
+    def cache_tags(self):
+        return (entity_tag('reservation', self.reservation_id),)
+
+class Job(db.Model):
+    # Workers poll for due jobs in run_at order
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    # pending -> running -> done | failed (running -> pending to retry)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    idempotency_key = db.Column(db.String(200), unique=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class IdempotencyRecord(db.Model):
+    # One record per (caller, Idempotency-Key); expired ones are purged
+    __table_args__ = (
+        db.UniqueConstraint('principal', 'key', name='uq_idempotency_principal_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    principal = db.Column(db.String(100), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    # Set by the attempt that inserted the record, which alone may complete
+    # or discard it; a takeover after IDEMPOTENCY_LOCK_TIMEOUT gets a new one
+    token = db.Column(db.String(32), nullable=False, default=lambda: uuid.uuid4().hex)
+    # in_progress -> completed
+    status = db.Column(db.String(20), nullable=False, default='in_progress')
+    response_status = db.Column(db.Integer)
+    response_headers = db.Column(db.JSON)
+    response_body = db.Column(db.LargeBinary)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+# Sales rollups, maintained incrementally by app.services.analytics
+
+class RolledUpOrder(db.Model):
+    # Orders already counted in the rollups, so each is counted once
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id', ondelete='CASCADE'), primary_key=True)
+
+class ProductSalesDaily(db.Model):
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True, index=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+class ProductSales(db.Model):
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0, index=True)
+    revenue = db.Column(db.Float, nullable=False, default=0.0, index=True)
+
+class DailySales(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+class CustomerValue(db.Model):
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id', ondelete='CASCADE'), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0, index=True)
+    first_order_at = db.Column(db.DateTime)
+    last_order_at = db.Column(db.DateTime)
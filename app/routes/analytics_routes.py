@@ -0,0 +1,240 @@
+from datetime import date
+from flask import Blueprint, abort, current_app, request, jsonify
+from sqlalchemy import func
+from app.models.models import Customer, CustomerValue, DailySales, Product, ProductSales, ProductSalesDaily
+from app.utils.auth import auth_required
+from app.utils.pagination import page_args
+from app.utils.serializers import (
+    CUSTOMER_VALUE_FIELDS, DAILY_SALES_FIELDS, LOW_STOCK_FIELDS, PRODUCT_SALES_FIELDS,
+    PRODUCT_SALES_RANGE_FIELDS, json_response
+)
+from app import db, limiter
+
+analytics_bp = Blueprint('analytics', __name__)
+
+# Reports read the rollups kept by app.services.analytics, never the
+# order history, so none of them grows with the number of orders. Most
+# cost O(rows returned), revenue O(days in range); top products for a
+# date range is the exception: it sums every (product, day) row in the
+# range, O(products sold x days), before ranking.
+
+def date_range():
+    """Parse the optional ``since``/``until`` days (inclusive); raises ValueError."""
+    bounds = []
+    for name in ('since', 'until'):
+        value = request.args.get(name)
+        if value:
+            try:
+                value = date.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f'{name} must be an ISO 8601 date (YYYY-MM-DD)')
+        bounds.append(value or None)
+    return bounds
+
+def day_criteria(column, since, until):
+    criteria = []
+    if since is not None:
+        criteria.append(column >= since)
+    if until is not None:
+        criteria.append(column <= until)
+    return criteria
+
+@analytics_bp.route('/analytics/top-products', methods=['GET'])
+@auth_required(admin=True)
+@limiter.limit("100 per day")
+def top_products():
+    """
+    Best-selling products
+    ---
+    tags:
+      - Analytics
+    parameters:
+      - name: by
+        in: query
+        type: string
+        enum: [units, revenue]
+        default: units
+      - name: since
+        in: query
+        type: string
+        format: date
+        description: First day counted (inclusive); all time when since and until are omitted. Ranges sum daily rollups, so long ones over a large catalog are slower than all-time
+      - name: until
+        in: query
+        type: string
+        format: date
+        description: Last day counted (inclusive)
+      - name: limit
+        in: query
+        type: integer
+    responses:
+      200:
+        description: Products with their order count, units sold and revenue, best first
+      400:
+        description: Invalid by, since or until
+      403:
+        description: Admin access required
+    """
+    by = request.args.get('by', 'units')
+    if by not in ('units', 'revenue'):
+        return jsonify({'message': 'by must be one of: units, revenue'}), 400
+    try:
+        since, until = date_range()
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    limit, _ = page_args()
+    
+    if since is None and until is None:
+        # All-time totals: a walk down the units/revenue index
+        products = db.session.query(*PRODUCT_SALES_FIELDS.columns).join(
+            Product, Product.id == ProductSales.product_id
+        ).order_by(getattr(ProductSales, by).desc(), ProductSales.product_id).limit(limit).all()
+        return json_response({'products': PRODUCT_SALES_FIELDS.dump_many(products)})
+    
+    # A range has no precomputed ranking: group and sum every product's
+    # days in it, O(products sold x days in range), then take the top
+    metric = func.sum(getattr(ProductSalesDaily, by))
+    products = db.session.query(*PRODUCT_SALES_RANGE_FIELDS.columns).join(
+        Product, Product.id == ProductSalesDaily.product_id
+    ).filter(
+        *day_criteria(ProductSalesDaily.day, since, until)
+    ).group_by(
+        ProductSalesDaily.product_id, Product.name
+    ).order_by(metric.desc(), ProductSalesDaily.product_id).limit(limit).all()
+    return json_response({'products': PRODUCT_SALES_RANGE_FIELDS.dump_many(products)})
+
+@analytics_bp.route('/analytics/revenue', methods=['GET'])
+@auth_required(admin=True)
+@limiter.limit("100 per day")
+def revenue():
+    """
+    Revenue per day
+    ---
+    tags:
+      - Analytics
+    parameters:
+      - name: since
+        in: query
+        type: string
+        format: date
+        description: First day listed (inclusive)
+      - name: until
+        in: query
+        type: string
+        format: date
+        description: Last day listed (inclusive)
+    responses:
+      200:
+        description: Orders, units and revenue for each day with sales, oldest first, and their totals
+      400:
+        description: Invalid since or until
+      403:
+        description: Admin access required
+    """
+    try:
+        since, until = date_range()
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    days = DAILY_SALES_FIELDS.dump_many(
+        db.session.query(*DAILY_SALES_FIELDS.columns).filter(
+            *day_criteria(DailySales.day, since, until)
+        ).order_by(DailySales.day).all()
+    )
+    totals = {name: sum(day[name] for day in days) for name in ('orders', 'units', 'revenue')}
+    return json_response({'days': days, 'totals': totals})
+
+@analytics_bp.route('/analytics/low-stock', methods=['GET'])
+@auth_required(admin=True)
+@limiter.limit("100 per day")
+def low_stock():
+    """
+    Products running out of stock
+    ---
+    tags:
+      - Analytics
+    parameters:
+      - name: threshold
+        in: query
+        type: integer
+        description: List products with at most this many units available (stock less reservations)
+      - name: limit
+        in: query
+        type: integer
+    responses:
+      200:
+        description: Products at or below the threshold, least available first
+      403:
+        description: Admin access required
+    """
+    threshold = request.args.get('threshold', current_app.config['ANALYTICS_LOW_STOCK_THRESHOLD'], type=int)
+    limit, _ = page_args()
+    
+    # Ordered by the indexed available expression, so the scan stops at limit
+    available = Product.stock - Product.reserved
+    products = db.session.query(*LOW_STOCK_FIELDS.columns).filter(
+        available <= threshold
+    ).order_by(available, Product.id).limit(limit).all()
+    return json_response({'threshold': threshold, 'products': LOW_STOCK_FIELDS.dump_many(products)})
+
+@analytics_bp.route('/analytics/customers/top', methods=['GET'])
+@auth_required(admin=True)
+@limiter.limit("100 per day")
+def top_customers():
+    """
+    Customers with the highest lifetime value
+    ---
+    tags:
+      - Analytics
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+    responses:
+      200:
+        description: Customers with their order count, revenue and first/last order dates, best first
+      403:
+        description: Admin access required
+    """
+    limit, _ = page_args()
+    customers = db.session.query(*CUSTOMER_VALUE_FIELDS.columns).join(
+        Customer, Customer.id == CustomerValue.customer_id
+    ).order_by(CustomerValue.revenue.desc(), CustomerValue.customer_id).limit(limit).all()
+    return json_response({'customers': CUSTOMER_VALUE_FIELDS.dump_many(customers)})
+
+@analytics_bp.route('/analytics/customers/<int:id>', methods=['GET'])
+@auth_required(admin=True)
+@limiter.limit("100 per day")
+def customer_value(id):
+    """
+    A customer's lifetime value
+    ---
+    tags:
+      - Analytics
+    parameters:
+      - name: id
+        in: path
+        type: integer
+        required: true
+    responses:
+      200:
+        description: The customer's order count, revenue and first/last order dates
+      403:
+        description: Admin access required
+      404:
+        description: Customer not found
+    """
+    customer = db.session.query(*CUSTOMER_VALUE_FIELDS.columns).join(
+        Customer, Customer.id == CustomerValue.customer_id
+    ).filter(CustomerValue.customer_id == id).first()
+    if customer is not None:
+        return json_response(CUSTOMER_VALUE_FIELDS.dump(customer))
+    
+    # No orders counted yet
+    name = db.session.query(Customer.name).filter(Customer.id == id).scalar()
+    if name is None:
+        abort(404)
+    return json_response({
+        'customer_id': id, 'name': name, 'orders': 0, 'revenue': 0.0,
+        'first_order_at': None, 'last_order_at': None
+    })
@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token
 from app.models.models import CustomerAccount
-from app import bcrypt, db, limiter
+from app.utils.passwords import PasswordHasherBusy
+from app import passwords, db, limiter
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -29,13 +30,26 @@ def login():
         description: Login successful
       401:
         description: Invalid credentials
+      503:
+        description: Password hashing is saturated, retry later
     """
     data = request.get_json()
     username = data.get('username')
     password = data.get('password')
 
     account = CustomerAccount.query.filter_by(username=username).first()
-    if account and bcrypt.check_password_hash(account.password, password):
+    try:
+        if account is None:
+            valid = passwords.verify_unknown(password)
+        else:
+            valid = passwords.verify(account.password, password)
+        if valid and passwords.needs_rehash(account.password):
+            account.password = passwords.hash(password)
+            db.session.commit()
+    except PasswordHasherBusy:
+        return jsonify({'message': 'Too many login attempts in progress, please retry'}), 503, {'Retry-After': '1'}
+    
+    if valid:
         access_token = create_access_token(
             identity=account.id,
             additional_claims={'is_admin': account.is_admin}
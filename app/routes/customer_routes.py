@@ -1,23 +1,16 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt
+from flask import Blueprint, abort, request, jsonify
 from app.models.models import Customer, CustomerAccount
-from app import db, bcrypt, cache, limiter
+from app.utils.auth import auth_required
+from app.utils.cache import cached_view, entity_tag, vary_cache_on
+from app.utils.passwords import PasswordHasherBusy
+from app.utils.serializers import CUSTOMER_FIELDS, json_response
+from app import db, passwords, limiter
 
 customer_bp = Blueprint('customer', __name__)
-
-def admin_required():
-    def wrapper(fn):
-        @jwt_required()
-        def decorator(*args, **kwargs):
-            claims = get_jwt()
-            if not claims.get('is_admin', False):
-                return jsonify({'message': 'Admin access required'}), 403
-            return fn(*args, **kwargs)
-        return decorator
-    return wrapper
+vary_cache_on(customer_bp, 'roles')
 
 @customer_bp.route('/customers', methods=['POST'])
-@admin_required()
+@auth_required(admin=True)
 @limiter.limit("100 per day")
 def create_customer():
     """
@@ -47,9 +40,16 @@ def create_customer():
         description: Customer created successfully
       400:
         description: Invalid request data
+      503:
+        description: Password hashing is saturated, retry later
     """
     data = request.get_json()
     
+    try:
+        password_hash = passwords.hash(data['password'])
+    except PasswordHasherBusy:
+        return jsonify({'message': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
+    
     customer = Customer(
         name=data['name'],
         email=data['email'],
@@ -58,7 +58,7 @@ def create_customer():
     
     account = CustomerAccount(
         username=data['username'],
-        password=bcrypt.generate_password_hash(data['password']).decode('utf-8')
+        password=password_hash
     )
     
     customer.account = account
@@ -69,9 +69,9 @@ def create_customer():
     return jsonify({'message': 'Customer created successfully', 'id': customer.id}), 201
 
 @customer_bp.route('/customers/<int:id>', methods=['GET'])
-@admin_required()
+@auth_required(admin=True)
 @limiter.limit("100 per day")
-@cache.cached(timeout=300)
+@cached_view(lambda id: [entity_tag('customer', id)])
 def get_customer(id):
     """
     Get customer details
@@ -86,20 +86,22 @@ def get_customer(id):
     responses:
       200:
         description: Customer details retrieved successfully
+      304:
+        description: Not modified since the ETag or date the client holds
       404:
         description: Customer not found
     """
-    customer = Customer.query.get_or_404(id)
-    return jsonify({
-        'id': customer.id,
-        'name': customer.name,
-        'email': customer.email,
-        'phone': customer.phone,
-        'username': customer.account.username if customer.account else None
-    })
+    customer = db.session.query(*CUSTOMER_FIELDS.columns).outerjoin(Customer.account).filter(
+        Customer.id == id
+    ).first()
+    if customer is None:
+        abort(404)
+    # The account's username is embedded and its edits leave the customer
+    # row alone, so the ETag hashes the document rather than row versions
+    return json_response(CUSTOMER_FIELDS.dump(customer))
 
 @customer_bp.route('/customers/<int:id>', methods=['PUT'])
-@admin_required()
+@auth_required(admin=True)
 @limiter.limit("100 per day")
 def update_customer(id):
     """
@@ -138,12 +140,11 @@ def update_customer(id):
     customer.phone = data.get('phone', customer.phone)
     
     db.session.commit()
-    cache.delete_memoized(get_customer, id)
     
     return jsonify({'message': 'Customer updated successfully'})
 
 @customer_bp.route('/customers/<int:id>', methods=['DELETE'])
-@admin_required()
+@auth_required(admin=True)
 @limiter.limit("100 per day")
 def delete_customer(id):
     """
@@ -165,6 +166,5 @@ def delete_customer(id):
     customer = Customer.query.get_or_404(id)
     db.session.delete(customer)
     db.session.commit()
-    cache.delete_memoized(get_customer, id)
     
     return jsonify({'message': 'Customer deleted successfully'})
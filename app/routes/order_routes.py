@@ -1,13 +1,51 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.models import Order, OrderItem, Product
-from app import db, cache, limiter
+from datetime import datetime
+from flask import Blueprint, abort, current_app, request, jsonify
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from sqlalchemy import func, insert
+from app.models.models import Customer, Order, OrderItem
+from app.tasks import enqueue_order_created
+from app.services.inventory import merge_quantities, load_products, decrement_stock, conflict_backoff
+from app.utils.auth import auth_required
+from app.utils.cache import cached_view, entity_tag, mark_stale, vary_cache_on
+from app.utils.database import insert_ids
+from app.utils.idempotency import idempotent
+from app.utils.pagination import page_args, encode_cursor, decode_cursor, keyset_rows, next_link
+from app.utils.serializers import (
+    ORDER_FIELDS, ORDER_ITEM_FIELDS, ORDER_ITEM_VERSION_COLUMNS, ORDER_SUMMARY_FIELDS, ORDER_VERSION_COLUMNS,
+    conditional, json_response, order_etag
+)
+from app import db, limiter
 
 order_bp = Blueprint('order', __name__)
+vary_cache_on(order_bp, 'identity', 'roles')
+
+def insufficient_stock(product):
+    return jsonify({'message': f'Insufficient stock for product {product.name}'}), 400
+
+def valid_items(items):
+    return bool(items) and isinstance(items, list) and all(
+        isinstance(item, dict)
+        and isinstance(item.get('product_id'), int)
+        and isinstance(item.get('quantity'), int)
+        and item['quantity'] > 0
+        for item in items
+    )
+
+def owned_order_version(id):
+    # Never vouch for someone else's order; the view answers those with 403.
+    # One row per item, each with its product's version. No Last-Modified:
+    # renaming a product changes the document but not the order's updated_at.
+    rows = db.session.query(
+        Order.customer_id, Order.version_id, Order.updated_at, *ORDER_ITEM_VERSION_COLUMNS
+    ).outerjoin(Order.items).outerjoin(OrderItem.product).filter(Order.id == id).order_by(OrderItem.id).all()
+    if not rows or rows[0].customer_id != get_jwt_identity():
+        return None
+    return order_etag(rows[0], [row for row in rows if row.product_version is not None]), None
 
 @order_bp.route('/orders', methods=['POST'])
-@jwt_required()
+@auth_required()
 @limiter.limit("100 per day")
+@idempotent
 def create_order():
     """
     Create a new order
@@ -15,6 +53,10 @@ def create_order():
     tags:
       - Orders
     parameters:
+      - name: Idempotency-Key
+        in: header
+        type: string
+        description: Retries with the same key return the first response instead of repeating the request
       - name: body
         in: body
         required: true
@@ -37,52 +79,209 @@ def create_order():
         description: Invalid request data
       404:
         description: Product not found
+      409:
+        description: Stock kept being taken by concurrent checkouts; retry later
     """
     data = request.get_json()
     customer_id = get_jwt_identity()
     
-    # Calculate total amount and validate products
-    total_amount = 0
-    order_items = []
+    if not valid_items(data.get('items')):
+        return jsonify({'message': 'Items need a product_id and a positive integer quantity'}), 400
     
-    for item in data['items']:
-        product = Product.query.get_or_404(item['product_id'])
-        if product.stock < item['quantity']:
-            return jsonify({'message': f'Insufficient stock for product {product.name}'}), 400
-            
-        total_amount += product.price * item['quantity']
-        order_items.append({
-            'product': product,
-            'quantity': item['quantity'],
-            'price': product.price
-        })
+    quantities = merge_quantities(data['items'])
+    attempts = current_app.config['ORDER_RETRY_ATTEMPTS']
+    for attempt in range(attempts + 1):
+        if attempt:
+            conflict_backoff(attempt - 1)
+        
+        # Fetch every product in one round trip, without locking
+        products = load_products(quantities)
+        if len(products) != len(quantities):
+            abort(404)
+        
+        # Calculate total amount and validate products
+        total_amount = 0
+        order_items = []
+        
+        for product_id, quantity in quantities.items():
+            if products[product_id].available < quantity:
+                return insufficient_stock(products[product_id])
+        
+        for item in data['items']:
+            product = products[item['product_id']]
+            total_amount += product.price * item['quantity']
+            order_items.append({
+                'product': product,
+                'quantity': item['quantity'],
+                'price': product.price
+            })
+        
+        # Create order
+        order = Order(
+            customer_id=customer_id,
+            total_amount=total_amount
+        )
+        db.session.add(order)
+        
+        # Create order items
+        for item in order_items:
+            order_item = OrderItem(
+                order=order,
+                product=item['product'],
+                quantity=item['quantity'],
+                price=item['price']
+            )
+            db.session.add(order_item)
+        
+        # Update stock with a single UPDATE guarded by available stock and
+        # the prices charged; if other checkouts took the stock or a price
+        # was edited meanwhile, start over from fresh rows
+        if decrement_stock(quantities, {product_id: products[product_id].price for product_id in quantities}):
+            # Downstream work is queued in the same transaction (outbox)
+            enqueue_order_created(order.id)
+            db.session.commit()
+            break
+        db.session.rollback()
+    else:
+        return jsonify({'message': 'Stock changed during checkout, please retry'}), 409
     
-    # Create order
-    order = Order(
-        customer_id=customer_id,
-        total_amount=total_amount
-    )
-    db.session.add(order)
+    return jsonify({'message': 'Order created successfully', 'id': order.id}), 201
+
+@order_bp.route('/orders/batch', methods=['POST'])
+@auth_required()
+@limiter.limit("100 per day")
+@idempotent
+def create_orders_batch():
+    """
+    Create many orders in one request
+    ---
+    tags:
+      - Orders
+    parameters:
+      - name: Idempotency-Key
+        in: header
+        type: string
+        description: Retries with the same key return the first response instead of repeating the request
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            orders:
+              type: array
+              items:
+                type: object
+                properties:
+                  customer_id:
+                    type: integer
+                    description: Admin only; defaults to the caller
+                  items:
+                    type: array
+                    items:
+                      type: object
+                      properties:
+                        product_id:
+                          type: integer
+                        quantity:
+                          type: integer
+    responses:
+      200:
+        description: Per-order results, in request order
+      400:
+        description: Invalid request data or unknown customer_id
+      409:
+        description: Stock or prices changed while the batch was being written
+    """
+    data = request.get_json()
+    orders = data.get('orders') if isinstance(data, dict) else None
+    if not isinstance(orders, list) or not orders:
+        return jsonify({'message': 'orders must be a non-empty list'}), 400
+    if len(orders) > current_app.config['ORDER_BATCH_MAX']:
+        return jsonify({'message': f"At most {current_app.config['ORDER_BATCH_MAX']} orders per batch"}), 400
     
-    # Create order items and update stock
-    for item in order_items:
-        order_item = OrderItem(
-            order=order,
-            product=item['product'],
-            quantity=item['quantity'],
-            price=item['price']
-        )
-        item['product'].stock -= item['quantity']
-        db.session.add(order_item)
+    caller_id = get_jwt_identity()
+    is_admin = get_jwt().get('is_admin', False)
     
-    db.session.commit()
+    # Validate every order against one snapshot of the products involved
+    orders = [order if isinstance(order, dict) else {} for order in orders]
+    if is_admin:
+        customer_ids = {order['customer_id'] for order in orders if 'customer_id' in order}
+        if any(isinstance(value, bool) or not isinstance(value, int) for value in customer_ids):
+            return jsonify({'message': 'customer_id must be an integer'}), 400
+        known = {row.id for row in db.session.query(Customer.id).filter(Customer.id.in_(customer_ids))}
+        unknown = sorted(customer_ids - known)
+        if unknown:
+            return jsonify({'message': f'Customer {unknown[0]} not found'}), 400
+    product_ids = {
+        item['product_id'] for order in orders if valid_items(order.get('items'))
+        for item in order['items']
+    }
+    products = load_products(product_ids)
+    remaining = {product_id: product.available for product_id, product in products.items()}
     
-    return jsonify({'message': 'Order created successfully', 'id': order.id}), 201
+    results = []
+    accepted = []
+    taken = {}
+    for index, order in enumerate(orders):
+        items = order.get('items')
+        message = None
+        if not valid_items(items):
+            message = 'Each order needs items with a product_id and a positive integer quantity'
+        elif 'customer_id' in order and not is_admin:
+            message = 'Admin access required to order for another customer'
+        if message is None:
+            quantities = merge_quantities(items)
+            missing = [product_id for product_id in quantities if product_id not in products]
+            short = [product_id for product_id, quantity in quantities.items()
+                     if product_id in products and remaining[product_id] < quantity]
+            if missing:
+                message = f'Product {missing[0]} not found'
+            elif short:
+                message = f'Insufficient stock for product {products[short[0]].name}'
+        if message is not None:
+            results.append({'index': index, 'status': 'rejected', 'message': message})
+            continue
+        
+        for product_id, quantity in quantities.items():
+            remaining[product_id] -= quantity
+            taken[product_id] = taken.get(product_id, 0) + quantity
+        accepted.append((index, order.get('customer_id', caller_id), items))
+        results.append({'index': index, 'status': 'created'})
+    
+    if accepted:
+        if not decrement_stock(taken, {product_id: products[product_id].price for product_id in taken}):
+            db.session.rollback()
+            return jsonify({'message': 'Stock or prices changed during checkout, please retry'}), 409
+        
+        order_ids = insert_ids(db.session, Order.__table__, [{
+            'customer_id': customer_id,
+            'total_amount': sum(products[item['product_id']].price * item['quantity'] for item in items)
+        } for _, customer_id, items in accepted])
+        db.session.execute(insert(OrderItem), [{
+            'order_id': order_id,
+            'product_id': item['product_id'],
+            'quantity': item['quantity'],
+            'price': products[item['product_id']].price
+        } for order_id, (_, _, items) in zip(order_ids, accepted) for item in items])
+        mark_stale(db.session, *{entity_tag('customer-orders', customer_id) for _, customer_id, _ in accepted})
+        enqueue_order_created(*order_ids)
+        db.session.commit()
+        
+        for order_id, (index, _, _) in zip(order_ids, accepted):
+            results[index]['id'] = order_id
+    
+    return jsonify({
+        'created': len(accepted),
+        'rejected': len(orders) - len(accepted),
+        'results': results
+    }), 200
 
 @order_bp.route('/orders/<int:id>', methods=['GET'])
-@jwt_required()
+@auth_required()
 @limiter.limit("100 per day")
-@cache.cached(timeout=300)
+@conditional(owned_order_version)
+@cached_view(lambda id: [entity_tag('order', id), 'product-names'])
 def get_order(id):
     """
     Get order details
@@ -97,26 +296,172 @@ def get_order(id):
     responses:
       200:
         description: Order details retrieved successfully
+      304:
+        description: Not modified since the ETag or date the client holds
       404:
         description: Order not found
     """
-    order = Order.query.get_or_404(id)
+    order = db.session.query(*ORDER_FIELDS.columns, *ORDER_VERSION_COLUMNS).filter(Order.id == id).first()
+    if order is None:
+        abort(404)
     customer_id = get_jwt_identity()
     
     # Only allow customers to view their own orders
     if order.customer_id != customer_id:
         return jsonify({'message': 'Unauthorized'}), 403
     
-    return jsonify({
-        'id': order.id,
-        'customer_id': order.customer_id,
-        'order_date': order.order_date.isoformat(),
-        'total_amount': order.total_amount,
-        'status': order.status,
-        'items': [{
-            'product_id': item.product_id,
-            'product_name': item.product.name,
-            'quantity': item.quantity,
-            'price': item.price
-        } for item in order.items]
-    })
+    # One query for the order, one for its items joined to their product
+    # names, however many lines the order has
+    items = db.session.query(*ORDER_ITEM_FIELDS.columns, *ORDER_ITEM_VERSION_COLUMNS).join(OrderItem.product).filter(
+        OrderItem.order_id == id
+    ).order_by(OrderItem.id).all()
+    return json_response(
+        dict(ORDER_FIELDS.dump(order), items=ORDER_ITEM_FIELDS.dump_many(items)), etag=order_etag(order, items)
+    )
+
+def parse_history_filters():
+    criteria = []
+    if request.args.get('status'):
+        criteria.append(Order.status == request.args['status'])
+    for name, op in (('since', '__ge__'), ('until', '__lt__')):
+        if request.args.get(name):
+            try:
+                bound = datetime.fromisoformat(request.args[name])
+            except ValueError:
+                raise ValueError(f'{name} must be an ISO 8601 date')
+            criteria.append(getattr(Order.order_date, op)(bound))
+    return criteria
+
+def order_history(customer_id):
+    try:
+        criteria = [Order.customer_id == customer_id, *parse_history_filters()]
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    if request.args.get('summary', '').lower() in ('1', 'true', 'yes'):
+        # Aggregate in SQL; one row per status however long the history is
+        rows = db.session.query(
+            Order.status,
+            func.count(Order.id),
+            func.coalesce(func.sum(Order.total_amount), 0),
+            func.min(Order.order_date),
+            func.max(Order.order_date)
+        ).filter(*criteria).group_by(Order.status).all()
+        first = min((row[3] for row in rows), default=None)
+        last = max((row[4] for row in rows), default=None)
+        return jsonify({
+            'customer_id': customer_id,
+            'order_count': sum(row[1] for row in rows),
+            'total_amount': sum(row[2] for row in rows),
+            'first_order_date': first.isoformat() if first else None,
+            'last_order_date': last.isoformat() if last else None,
+            'by_status': {row[0]: {'order_count': row[1], 'total_amount': row[2]} for row in rows}
+        })
+    
+    limit, _ = page_args()
+    after = request.args.get('after')
+    if after is not None:
+        try:
+            order_date, order_id = decode_cursor(after)
+            after = (datetime.fromisoformat(order_date), int(order_id))
+        except (ValueError, TypeError):
+            return jsonify({'message': 'Invalid cursor'}), 400
+    
+    query = db.session.query(*ORDER_SUMMARY_FIELDS.columns).filter(*criteria)
+    orders, has_more = keyset_rows(query, (Order.order_date, Order.id), after, limit, descending=True)
+    response = json_response(ORDER_SUMMARY_FIELDS.dump_many(orders))
+    if has_more:
+        next_after = encode_cursor(orders[-1].order_date, orders[-1].id)
+        response.headers['Link'] = next_link(next_after, limit)
+        response.headers['X-Next-After'] = next_after
+    return response
+
+@order_bp.route('/customers/<int:id>/orders', methods=['GET'])
+@auth_required()
+@limiter.limit("100 per day")
+@cached_view(lambda id: [entity_tag('customer-orders', id)], query_string=True)
+def list_customer_orders(id):
+    """
+    List a customer's orders, newest first
+    ---
+    tags:
+      - Orders
+    parameters:
+      - name: id
+        in: path
+        type: integer
+        required: true
+      - name: limit
+        in: query
+        type: integer
+      - name: after
+        in: query
+        type: string
+        description: Opaque cursor from the previous page's X-Next-After header
+      - name: status
+        in: query
+        type: string
+      - name: since
+        in: query
+        type: string
+        format: date-time
+      - name: until
+        in: query
+        type: string
+        format: date-time
+      - name: summary
+        in: query
+        type: boolean
+        description: Return order count and totals instead of a page of orders
+    responses:
+      200:
+        description: Orders retrieved successfully
+      400:
+        description: Invalid filter or cursor
+      403:
+        description: Only admins may list another customer's orders
+    """
+    if id != get_jwt_identity() and not get_jwt().get('is_admin', False):
+        return jsonify({'message': 'Unauthorized'}), 403
+    return order_history(id)
+
+@order_bp.route('/me/orders', methods=['GET'])
+@auth_required()
+@limiter.limit("100 per day")
+@cached_view(lambda: [entity_tag('customer-orders', get_jwt_identity())], query_string=True)
+def list_my_orders():
+    """
+    List the caller's orders, newest first
+    ---
+    tags:
+      - Orders
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+      - name: after
+        in: query
+        type: string
+        description: Opaque cursor from the previous page's X-Next-After header
+      - name: status
+        in: query
+        type: string
+      - name: since
+        in: query
+        type: string
+        format: date-time
+      - name: until
+        in: query
+        type: string
+        format: date-time
+      - name: summary
+        in: query
+        type: boolean
+        description: Return order count and totals instead of a page of orders
+    responses:
+      200:
+        description: Orders retrieved successfully
+      400:
+        description: Invalid filter or cursor
+    """
+    return order_history(get_jwt_identity())
@@ -1,13 +1,174 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required
+import json
+from datetime import datetime
+from flask import Blueprint, Response, abort, current_app, request, jsonify, stream_with_context
+from sqlalchemy import update
+from sqlalchemy.orm.exc import StaleDataError
 from app.models.models import Product
-from app import db, cache, limiter
+from app.services.catalog import FORMATS as CATALOG_FORMATS, export_products, import_products
+from app.services.search import product_search, reindex_on_commit
+from app.utils.auth import auth_required
+from app.utils.cache import cached_view, entity_tag, mark_stale
+from app.utils.idempotency import idempotent
+from app.utils.pagination import page_args, decode_cursor, encode_cursor, keyset_rows, next_link
+from app.utils.serializers import (
+    PRODUCT_FIELDS, PRODUCT_VERSION_COLUMNS, conditional, json_response, precondition_failed, product_etag
+)
+from app import db, limiter
 
 product_bp = Blueprint('product', __name__)
 
+STREAM_FORMATS = {'ndjson': 'application/x-ndjson', 'json': 'application/json'}
+SORT_COLUMNS = {'id': Product.id, 'price': Product.price, 'created_at': Product.created_at}
+TRUTHY = ('1', 'true', 'yes')
+
+def product_list_params():
+    """Parse the list filters into canonical values; raises ValueError.
+
+    Defaults are dropped and values normalized (``min_price=5`` and
+    ``min_price=5.00`` agree), so the result doubles as the cache key.
+    """
+    args = request.args
+    params = {}
+    for name in ('min_price', 'max_price'):
+        if args.get(name):
+            try:
+                params[name] = float(args[name])
+            except ValueError:
+                raise ValueError(f'{name} must be a number')
+    if args.get('in_stock', '').lower() in TRUTHY:
+        params['in_stock'] = True
+    if args.get('created_since'):
+        try:
+            params['created_since'] = datetime.fromisoformat(args['created_since']).isoformat()
+        except ValueError:
+            raise ValueError('created_since must be an ISO 8601 date')
+    sort = args.get('sort', 'id')
+    if sort.lstrip('-') not in SORT_COLUMNS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_COLUMNS)} (prefix - for descending)")
+    if sort != 'id':
+        params['sort'] = sort
+    params['limit'], after = page_args()
+    if after is not None:
+        # Streams ignore sort and always run in id order
+        column = Product.id if 'stream' in args else SORT_COLUMNS[sort.lstrip('-')]
+        params['after'] = parse_after(after, column)
+    return params
+
+def parse_after(token, column):
+    """Decode an ``after`` cursor for a keyset on ``column``; raises ValueError.
+
+    Id order takes a plain product id. Other sorts take the opaque
+    ``(sort value, id)`` token of X-Next-After, so the next page never
+    depends on the last product still existing or keeping its value.
+    """
+    try:
+        if column is Product.id:
+            return [int(token)]
+        value, product_id = decode_cursor(token)
+        if isinstance(product_id, bool) or not isinstance(product_id, int) or isinstance(value, bool):
+            raise ValueError
+        if column is Product.created_at:
+            return [datetime.fromisoformat(value).isoformat(), product_id]
+        return [float(value), product_id]
+    except (TypeError, ValueError):
+        raise ValueError('after must be the X-Next-After value of the previous page')
+
+def keyset_bound(after, column):
+    """The keyset tuple for a parsed ``after`` cursor, or None."""
+    if after is None:
+        return None
+    if column is Product.created_at:
+        return datetime.fromisoformat(after[0]), after[1]
+    return tuple(after)
+
+def page_columns(column):
+    """The columns to select for a page sorted on ``column``.
+
+    Other sorts carry their value as a trailing ``sort_key`` for the next
+    cursor; the FieldPlan dump leaves it out.
+    """
+    if column is Product.id:
+        return PRODUCT_FIELDS.columns
+    return (*PRODUCT_FIELDS.columns, column.label('sort_key'))
+
+def product_list_variant():
+    try:
+        return json.dumps(product_list_params(), sort_keys=True)
+    except ValueError:
+        # Rejected by the view with a 400, which is never cached
+        return 'invalid'
+
+def product_criteria(params):
+    criteria = []
+    if 'min_price' in params:
+        criteria.append(Product.price >= params['min_price'])
+    if 'max_price' in params:
+        criteria.append(Product.price <= params['max_price'])
+    if params.get('in_stock'):
+        criteria.append(Product.stock - Product.reserved > 0)
+    if 'created_since' in params:
+        criteria.append(Product.created_at >= datetime.fromisoformat(params['created_since']))
+    return criteria
+
+def sort_keyset(sort):
+    """The keyset columns for a ``sort`` parameter, and whether it descends."""
+    column = SORT_COLUMNS[sort.lstrip('-')]
+    columns = (Product.id,) if column is Product.id else (column, Product.id)
+    return column, columns, sort.startswith('-')
+
+def product_page_response(products, has_more, limit, column=Product.id):
+    response = json_response(PRODUCT_FIELDS.dump_many(products))
+    if has_more:
+        last = products[-1]
+        next_after = str(last.id) if column is Product.id else encode_cursor(last.sort_key, last.id)
+        response.headers['Link'] = next_link(next_after, limit)
+        response.headers['X-Next-After'] = next_after
+    return response
+
+def product_version(id):
+    row = db.session.query(
+        Product.version_id, Product.stock, Product.reserved, Product.updated_at
+    ).filter(Product.id == id).first()
+    return None if row is None else (product_etag(row), row.updated_at)
+
+def precondition_response():
+    return jsonify({'message': 'Product has changed; fetch it again and retry'}), 412
+
+def stock_on_hold_response(reserved):
+    db.session.rollback()
+    return jsonify({'message': f'Stock cannot drop below the {reserved} units on hold'}), 400
+
+def concurrent_write_response():
+    db.session.rollback()
+    return jsonify({'message': 'Product was modified concurrently, please retry'}), 409
+
+def stream_products(fmt, after=None, criteria=()):
+    # Plain column rows read through a server-side cursor in yield_per
+    # batches, so memory stays flat regardless of catalog size.
+    query = db.session.query(*PRODUCT_FIELDS.columns).filter(*criteria).order_by(Product.id)
+    if after is not None:
+        query = query.filter(Product.id > after)
+    query = query.execution_options(yield_per=current_app.config['STREAM_BATCH_SIZE'])
+    dumps, dump = current_app.json.dumps, PRODUCT_FIELDS.dump
+
+    def generate():
+        if fmt == 'ndjson':
+            for p in query:
+                yield dumps(dump(p)) + '\n'
+            return
+        yield '['
+        separator = ''
+        for p in query:
+            yield separator + dumps(dump(p))
+            separator = ','
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype=STREAM_FORMATS[fmt])
+
 @product_bp.route('/products', methods=['POST'])
-@jwt_required()
+@auth_required()
 @limiter.limit("100 per day")
+@idempotent
 def create_product():
     """
     Create a new product
@@ -15,6 +176,10 @@ def create_product():
     tags:
       - Products
     parameters:
+      - name: Idempotency-Key
+        in: header
+        type: string
+        description: Retries with the same key return the first response instead of repeating the request
       - name: body
         in: body
         required: true
@@ -50,9 +215,10 @@ def create_product():
     return jsonify({'message': 'Product created successfully', 'id': product.id}), 201
 
 @product_bp.route('/products/<int:id>', methods=['GET'])
-@jwt_required()
+@auth_required()
 @limiter.limit("100 per day")
-@cache.cached(timeout=300)
+@conditional(product_version)
+@cached_view(lambda id: [entity_tag('product', id)])
 def get_product(id):
     """
     Get product details
@@ -67,43 +233,204 @@ def get_product(id):
     responses:
       200:
         description: Product details retrieved successfully
+      304:
+        description: Not modified since the ETag or date the client holds
       404:
         description: Product not found
     """
-    product = Product.query.get_or_404(id)
-    return jsonify({
-        'id': product.id,
-        'name': product.name,
-        'description': product.description,
-        'price': product.price,
-        'stock': product.stock
-    })
+    product = db.session.query(*PRODUCT_FIELDS.columns, *PRODUCT_VERSION_COLUMNS).filter(Product.id == id).first()
+    if product is None:
+        abort(404)
+    return json_response(PRODUCT_FIELDS.dump(product), etag=product_etag(product), last_modified=product.updated_at)
 
 @product_bp.route('/products', methods=['GET'])
-@jwt_required()
+@auth_required()
 @limiter.limit("100 per day")
-@cache.cached(timeout=300)
+@cached_view(lambda: ['products'], variant=product_list_variant, unless=lambda: 'stream' in request.args)
 def list_products():
     """
-    List all products
+    List products, one keyset page at a time
     ---
     tags:
       - Products
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        description: Page size (capped by PAGE_SIZE_MAX)
+      - name: after
+        in: query
+        type: string
+        description: Cursor from the previous page's X-Next-After header (a product id when sorted by id)
+      - name: min_price
+        in: query
+        type: number
+      - name: max_price
+        in: query
+        type: number
+      - name: in_stock
+        in: query
+        type: boolean
+        description: Only products with unreserved stock left
+      - name: created_since
+        in: query
+        type: string
+        format: date-time
+      - name: sort
+        in: query
+        type: string
+        enum: [id, -id, price, -price, created_at, -created_at]
+        default: id
+      - name: stream
+        in: query
+        type: string
+        enum: [ndjson, json]
+        description: Stream every matching product (in id order) after the cursor instead of a single page
     responses:
       200:
         description: List of products retrieved successfully
+      400:
+        description: Invalid filter, sort or cursor
     """
-    products = Product.query.all()
-    return jsonify([{
-        'id': p.id,
-        'name': p.name,
-        'description': p.description,
-        'price': p.price,
-        'stock': p.stock
-    } for p in products])
+    try:
+        params = product_list_params()
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    criteria = product_criteria(params)
+    after = params.get('after')
+    
+    stream = request.args.get('stream')
+    if stream is not None:
+        if stream not in STREAM_FORMATS:
+            return jsonify({'message': 'stream must be one of: ndjson, json'}), 400
+        return stream_products(stream, after and after[0], criteria)
+    
+    # Keyset on (sort column, id), bounded by the values in the cursor
+    column, columns, descending = sort_keyset(params.get('sort', 'id'))
+    query = db.session.query(*page_columns(column)).filter(*criteria)
+    products, has_more = keyset_rows(query, columns, keyset_bound(after, column), params['limit'], descending)
+    return product_page_response(products, has_more, params['limit'], column)
+
+@product_bp.route('/products/import', methods=['POST'])
+@auth_required(admin=True)
+@limiter.limit("100 per day")
+def import_catalog():
+    """
+    Create or update products in bulk from a CSV or NDJSON upload
+    ---
+    tags:
+      - Products
+    consumes:
+      - text/csv
+      - application/x-ndjson
+    parameters:
+      - name: format
+        in: query
+        type: string
+        enum: [csv, ndjson]
+        description: Defaults to the request Content-Type
+      - name: body
+        in: body
+        required: true
+        description: >
+          Records with id, name, description, price and stock (a CSV header
+          row names the columns). A record with an id updates that product,
+          or creates it under that id; blank fields are left unchanged.
+        schema:
+          type: string
+    responses:
+      200:
+        description: Counts of inserted, updated and rejected products, with the first rejections
+      400:
+        description: Unknown format
+      403:
+        description: Admin access required
+    """
+    mimetypes = {mimetype: fmt for fmt, mimetype in CATALOG_FORMATS.items()}
+    fmt = request.args.get('format') or mimetypes.get(request.mimetype)
+    if fmt not in CATALOG_FORMATS:
+        return jsonify({'message': 'format must be one of: csv, ndjson'}), 400
+    
+    # Read from the socket as it is parsed; the upload is never buffered
+    report = import_products(request.stream, fmt)
+    return jsonify(report.to_dict())
+
+@product_bp.route('/products/export', methods=['GET'])
+@auth_required(admin=True)
+@limiter.limit("100 per day")
+def export_catalog():
+    """
+    Stream the whole catalog as CSV or NDJSON
+    ---
+    tags:
+      - Products
+    parameters:
+      - name: format
+        in: query
+        type: string
+        enum: [csv, ndjson]
+        default: csv
+    responses:
+      200:
+        description: Every product (id, name, description, price, stock) in id order, importable as is
+      400:
+        description: Unknown format
+      403:
+        description: Admin access required
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in CATALOG_FORMATS:
+        return jsonify({'message': 'format must be one of: csv, ndjson'}), 400
+    return Response(
+        stream_with_context(export_products(fmt)), mimetype=CATALOG_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename=products.{fmt}'}
+    )
+
+@product_bp.route('/products/search', methods=['GET'])
+@auth_required()
+@limiter.limit("100 per day")
+@cached_view(lambda: ['products'], query_string=True)
+def search_products():
+    """
+    Full-text search over product names and descriptions
+    ---
+    tags:
+      - Products
+    parameters:
+      - name: q
+        in: query
+        type: string
+        required: true
+        description: Search terms; every term must match, each as a prefix
+      - name: limit
+        in: query
+        type: integer
+      - name: offset
+        in: query
+        type: integer
+    responses:
+      200:
+        description: Matching products, best match first
+      400:
+        description: Missing search terms
+    """
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'message': 'q is required'}), 400
+    limit, _ = page_args()
+    offset = max(0, request.args.get('offset', 0, type=int))
+    
+    ranked = product_search.search(q, limit, offset)
+    rows = {p.id: p for p in db.session.query(*PRODUCT_FIELDS.columns).filter(
+        Product.id.in_([product_id for product_id, _ in ranked])
+    )}
+    return json_response([
+        dict(PRODUCT_FIELDS.dump(rows[product_id]), score=round(score, 4))
+        for product_id, score in ranked if product_id in rows
+    ])
 
 @product_bp.route('/products/<int:id>', methods=['PUT'])
-@jwt_required()
+@auth_required()
 @limiter.limit("100 per day")
 def update_product(id):
     """
@@ -116,6 +443,10 @@ def update_product(id):
         in: path
         type: integer
         required: true
+      - name: If-Match
+        in: header
+        type: string
+        description: ETag from a previous GET; the update only applies if the product is unchanged
       - name: body
         in: body
         required: true
@@ -133,25 +464,61 @@ def update_product(id):
     responses:
       200:
         description: Product updated successfully
+      400:
+        description: Stock would drop below the units held by reservations
       404:
         description: Product not found
+      409:
+        description: Product was modified concurrently
+      412:
+        description: Product no longer matches If-Match
     """
     product = Product.query.get_or_404(id)
+    if precondition_failed(product_etag(product)):
+        return precondition_response()
     data = request.get_json()
     
-    product.name = data.get('name', product.name)
-    product.description = data.get('description', product.description)
-    product.price = data.get('price', product.price)
-    product.stock = data.get('stock', product.stock)
+    values = {name: data[name] for name in ('name', 'description', 'price', 'stock') if name in data}
+    if 'stock' in values and values['stock'] < product.reserved:
+        return stock_on_hold_response(product.reserved)
+    
+    # Guarded on the row read above: its version for edits and, as stock
+    # movements leave the version alone, the holds a new stock level must
+    # cover and, under If-Match, the stock and holds the ETag vouched for
+    guards = [Product.id == id, Product.version_id == product.version_id]
+    if 'stock' in values:
+        guards.append(Product.reserved <= values['stock'])
+    if request.if_match:
+        guards += [Product.stock == product.stock, Product.reserved == product.reserved]
+    result = db.session.execute(
+        update(Product).where(*guards).values(**values, version_id=Product.version_id + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        db.session.rollback()
+        current = db.session.get(Product, id, populate_existing=True)
+        if current is None:
+            abort(404)
+        if precondition_failed(product_etag(current)):
+            return precondition_response()
+        if 'stock' in values and values['stock'] < current.reserved:
+            return stock_on_hold_response(current.reserved)
+        return concurrent_write_response()
     
+    tags = [entity_tag('product', id)]
+    if values.get('name', product.name) != product.name:
+        # Order documents embed product names
+        tags.append('product-names')
+    mark_stale(db.session, 'products', *tags)
+    if 'name' in values or 'description' in values:
+        reindex_on_commit(db.session, [(id, values.get('name', product.name),
+                                        values.get('description', product.description))])
     db.session.commit()
-    cache.delete_memoized(get_product, id)
-    cache.delete_memoized(list_products)
     
     return jsonify({'message': 'Product updated successfully'})
 
 @product_bp.route('/products/<int:id>', methods=['DELETE'])
-@jwt_required()
+@auth_required()
 @limiter.limit("100 per day")
 def delete_product(id):
     """
@@ -164,16 +531,27 @@ def delete_product(id):
         in: path
         type: integer
         required: true
+      - name: If-Match
+        in: header
+        type: string
+        description: ETag from a previous GET; the delete only applies if the product is unchanged
     responses:
       200:
         description: Product deleted successfully
       404:
         description: Product not found
+      409:
+        description: Product was modified concurrently
+      412:
+        description: Product no longer matches If-Match
     """
     product = Product.query.get_or_404(id)
+    if precondition_failed(product_etag(product)):
+        return precondition_response()
     db.session.delete(product)
-    db.session.commit()
-    cache.delete_memoized(get_product, id)
-    cache.delete_memoized(list_products)
+    try:
+        db.session.commit()
+    except StaleDataError:
+        return concurrent_write_response()
     
     return jsonify({'message': 'Product deleted successfully'})
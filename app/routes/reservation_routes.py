@@ -0,0 +1,230 @@
+from datetime import datetime, timedelta
+from flask import Blueprint, abort, current_app, request, jsonify
+from flask_jwt_extended import get_jwt_identity
+from app.models.models import Order, OrderItem, Reservation, ReservationItem
+from app.routes.order_routes import valid_items
+from app.services.inventory import merge_quantities, load_products, reserve_stock, release_stock, commit_reserved_stock
+from app.services.reservations import claim, expire_reservations
+from app.tasks import enqueue_order_created
+from app.utils.auth import auth_required
+from app.utils.serializers import RESERVATION_FIELDS, RESERVATION_ITEM_FIELDS, json_response
+from app import db, limiter
+
+reservation_bp = Blueprint('reservation', __name__)
+
+def held_quantities(reservation_id):
+    items = db.session.query(*RESERVATION_ITEM_FIELDS.columns).filter(
+        ReservationItem.reservation_id == reservation_id
+    ).order_by(ReservationItem.id).all()
+    return items, merge_quantities({'product_id': i.product_id, 'quantity': i.quantity} for i in items)
+
+def closed_response(reservation_id):
+    # Lost the claim: report what the reservation became instead
+    db.session.rollback()
+    status = db.session.query(Reservation.status).filter(Reservation.id == reservation_id).scalar()
+    if status == 'held':
+        status = 'expired'
+    return jsonify({'message': f'Reservation is {status}'}), 409
+
+@reservation_bp.route('/reservations', methods=['POST'])
+@auth_required()
+@limiter.limit("100 per day")
+def create_reservation():
+    """
+    Hold stock for a checkout
+    ---
+    tags:
+      - Reservations
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            items:
+              type: array
+              items:
+                type: object
+                properties:
+                  product_id:
+                    type: integer
+                  quantity:
+                    type: integer
+    responses:
+      201:
+        description: Stock held until expires_at
+      400:
+        description: Invalid request data or insufficient stock
+      404:
+        description: Product not found
+      409:
+        description: Stock changed while reserving; retry
+    """
+    data = request.get_json()
+    
+    if not valid_items(data.get('items')):
+        return jsonify({'message': 'Items need a product_id and a positive integer quantity'}), 400
+    
+    quantities = merge_quantities(data['items'])
+    products = load_products(quantities)
+    if len(products) != len(quantities):
+        abort(404)
+    
+    # One guarded UPDATE holds everything or nothing; if stock is short,
+    # free whatever expired holds are still waiting for the sweeper and
+    # try once more
+    held = reserve_stock(quantities)
+    if not held:
+        db.session.rollback()
+        if expire_reservations():
+            db.session.commit()
+            held = reserve_stock(quantities)
+    if not held:
+        db.session.rollback()
+        short = next((p for pid, p in load_products(quantities).items() if p.available < quantities[pid]), None)
+        if short is None:
+            # Stock was freed again between the failed hold and this read
+            return jsonify({'message': 'Stock changed while reserving, please retry'}), 409
+        return jsonify({'message': f'Insufficient stock for product {short.name}'}), 400
+    
+    reservation = Reservation(
+        customer_id=get_jwt_identity(),
+        expires_at=datetime.utcnow() + timedelta(seconds=current_app.config['RESERVATION_TTL'])
+    )
+    db.session.add(reservation)
+    for product_id, quantity in quantities.items():
+        db.session.add(ReservationItem(
+            reservation=reservation,
+            product_id=product_id,
+            quantity=quantity,
+            price=products[product_id].price
+        ))
+    db.session.commit()
+    
+    return jsonify({
+        'message': 'Stock reserved',
+        'id': reservation.id,
+        'expires_at': reservation.expires_at.isoformat()
+    }), 201
+
+@reservation_bp.route('/reservations/<int:id>', methods=['GET'])
+@auth_required()
+@limiter.limit("100 per day")
+def get_reservation(id):
+    """
+    Get a reservation and its held items
+    ---
+    tags:
+      - Reservations
+    parameters:
+      - name: id
+        in: path
+        type: integer
+        required: true
+    responses:
+      200:
+        description: Reservation retrieved successfully
+      403:
+        description: Not the caller's reservation
+      404:
+        description: Reservation not found
+    """
+    reservation = db.session.query(*RESERVATION_FIELDS.columns).filter(Reservation.id == id).first()
+    if reservation is None:
+        abort(404)
+    if reservation.customer_id != get_jwt_identity():
+        return jsonify({'message': 'Unauthorized'}), 403
+    
+    items, _ = held_quantities(id)
+    return json_response(dict(RESERVATION_FIELDS.dump(reservation), items=RESERVATION_ITEM_FIELDS.dump_many(items)))
+
+@reservation_bp.route('/reservations/<int:id>/confirm', methods=['POST'])
+@auth_required()
+@limiter.limit("100 per day")
+def confirm_reservation(id):
+    """
+    Turn a held reservation into an order at the held prices
+    ---
+    tags:
+      - Reservations
+    parameters:
+      - name: id
+        in: path
+        type: integer
+        required: true
+    responses:
+      201:
+        description: Order created successfully
+      403:
+        description: Not the caller's reservation
+      404:
+        description: Reservation not found
+      409:
+        description: Reservation already confirmed, released or expired
+    """
+    reservation = Reservation.query.get_or_404(id)
+    if reservation.customer_id != get_jwt_identity():
+        return jsonify({'message': 'Unauthorized'}), 403
+    if not claim(id, 'confirmed'):
+        return closed_response(id)
+    
+    items, quantities = held_quantities(id)
+    if not commit_reserved_stock(quantities):
+        db.session.rollback()
+        return jsonify({'message': 'Held stock is no longer available'}), 409
+    
+    order = Order(
+        customer_id=reservation.customer_id,
+        total_amount=sum(item.price * item.quantity for item in items)
+    )
+    db.session.add(order)
+    for item in items:
+        db.session.add(OrderItem(
+            order=order,
+            product_id=item.product_id,
+            quantity=item.quantity,
+            price=item.price
+        ))
+    reservation.order = order
+    db.session.flush()
+    enqueue_order_created(order.id)
+    db.session.commit()
+    
+    return jsonify({'message': 'Order created successfully', 'id': order.id}), 201
+
+@reservation_bp.route('/reservations/<int:id>', methods=['DELETE'])
+@auth_required()
+@limiter.limit("100 per day")
+def release_reservation(id):
+    """
+    Release a held reservation and return its stock
+    ---
+    tags:
+      - Reservations
+    parameters:
+      - name: id
+        in: path
+        type: integer
+        required: true
+    responses:
+      200:
+        description: Reservation released
+      403:
+        description: Not the caller's reservation
+      404:
+        description: Reservation not found
+      409:
+        description: Reservation already confirmed, released or expired
+    """
+    reservation = Reservation.query.get_or_404(id)
+    if reservation.customer_id != get_jwt_identity():
+        return jsonify({'message': 'Unauthorized'}), 403
+    if not claim(id, 'released', unexpired=False):
+        return closed_response(id)
+    
+    _, quantities = held_quantities(id)
+    release_stock(quantities)
+    db.session.commit()
+    
+    return jsonify({'message': 'Reservation released'})
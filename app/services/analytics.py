@@ -0,0 +1,140 @@
+from collections import defaultdict
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import case, delete, func, insert, select, update
+from app import db
+from app.models.models import (
+    CustomerValue, DailySales, Order, OrderItem, ProductSales, ProductSalesDaily, RolledUpOrder
+)
+
+# Reports read small rollup tables instead of grouping the order history:
+# per product per day, per product all-time, per day and per customer.
+# Each order is folded in once, by the order.created job in the same
+# transaction that marks the job done; RolledUpOrder records which orders
+# are in, so the job and a backfill never count an order twice.
+
+ROLLUPS = (ProductSalesDaily, ProductSales, DailySales, CustomerValue, RolledUpOrder)
+
+
+def _increment(model, key, counts, **extra):
+    """Add ``counts`` to the rollup row at ``key``, creating it if missing.
+
+    An UPDATE first, then an INSERT when no row matched: portable across
+    backends, and a concurrent INSERT of the same key fails the
+    transaction (the job is retried) rather than losing counts.
+    """
+    guards = [getattr(model, name) == value for name, value in key.items()]
+    values = {name: getattr(model, name) + amount for name, amount in counts.items()}
+    updates = {name: update_value for name, (update_value, _) in extra.items()}
+    result = db.session.execute(
+        update(model).where(*guards).values(**values, **updates)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        inserts = {name: insert_value for name, (_, insert_value) in extra.items()}
+        db.session.execute(insert(model).values(**key, **counts, **inserts))
+
+
+def apply_orders(order_ids):
+    """Fold the orders in ``order_ids`` that are not yet counted into the rollups.
+
+    Returns the number of orders added. Runs in the caller's transaction.
+    """
+    order_ids = set(order_ids)
+    if not order_ids:
+        return 0
+    counted = set(db.session.scalars(
+        select(RolledUpOrder.order_id).where(RolledUpOrder.order_id.in_(order_ids))
+    ))
+    order_ids -= counted
+    if not order_ids:
+        return 0
+
+    rows = db.session.execute(
+        select(Order.id, Order.customer_id, Order.order_date,
+               OrderItem.product_id, OrderItem.quantity, OrderItem.price)
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .where(Order.id.in_(order_ids))
+    ).all()
+
+    product_days = defaultdict(lambda: [set(), 0, 0.0])
+    products = defaultdict(lambda: [set(), 0, 0.0])
+    days = defaultdict(lambda: [set(), 0, 0.0])
+    customers = defaultdict(lambda: [set(), 0.0, None, None])
+    for order_id, customer_id, ordered_at, product_id, quantity, price in rows:
+        day, revenue = ordered_at.date(), quantity * price
+        for totals in (product_days[product_id, day], products[product_id], days[day]):
+            totals[0].add(order_id)
+            totals[1] += quantity
+            totals[2] += revenue
+        customer = customers[customer_id]
+        customer[0].add(order_id)
+        customer[1] += revenue
+        customer[2] = min(customer[2] or ordered_at, ordered_at)
+        customer[3] = max(customer[3] or ordered_at, ordered_at)
+
+    # The ledger goes first: a concurrent apply of the same order fails on
+    # its primary key instead of double counting
+    found = {row.id for row in rows}
+    db.session.execute(insert(RolledUpOrder), [{'order_id': order_id} for order_id in found])
+    for (product_id, day), (ids, units, revenue) in product_days.items():
+        _increment(ProductSalesDaily, {'product_id': product_id, 'day': day},
+                   {'orders': len(ids), 'units': units, 'revenue': revenue})
+    for product_id, (ids, units, revenue) in products.items():
+        _increment(ProductSales, {'product_id': product_id},
+                   {'orders': len(ids), 'units': units, 'revenue': revenue})
+    for day, (ids, units, revenue) in days.items():
+        _increment(DailySales, {'day': day}, {'orders': len(ids), 'units': units, 'revenue': revenue})
+    for customer_id, (ids, revenue, first, last) in customers.items():
+        _increment(
+            CustomerValue, {'customer_id': customer_id}, {'orders': len(ids), 'revenue': revenue},
+            first_order_at=(case((CustomerValue.first_order_at > first, first),
+                                 else_=func.coalesce(CustomerValue.first_order_at, first)), first),
+            last_order_at=(case((CustomerValue.last_order_at < last, last),
+                                else_=func.coalesce(CustomerValue.last_order_at, last)), last),
+        )
+    return len(found)
+
+
+def backfill(chunk_size=None, rebuild=False):
+    """Roll up every order not yet counted, ``chunk_size`` orders per transaction.
+
+    With ``rebuild`` the rollups are emptied first and rebuilt from the
+    whole order history. Yields the running total after each chunk.
+    """
+    chunk_size = chunk_size or current_app.config['ANALYTICS_BACKFILL_CHUNK']
+    if rebuild:
+        for model in ROLLUPS:
+            db.session.execute(delete(model))
+        db.session.commit()
+
+    total, after = 0, 0
+    while True:
+        # Keyset over order ids, skipping those the job already counted
+        order_ids = db.session.scalars(
+            select(Order.id)
+            .outerjoin(RolledUpOrder, RolledUpOrder.order_id == Order.id)
+            .where(Order.id > after, RolledUpOrder.order_id.is_(None))
+            .order_by(Order.id).limit(chunk_size)
+        ).all()
+        if not order_ids:
+            return
+        total += apply_orders(order_ids)
+        db.session.commit()
+        after = order_ids[-1]
+        yield total
+
+
+analytics_cli = AppGroup('analytics', help='Maintain the sales rollups.')
+
+
+@analytics_cli.command('backfill')
+@click.option('--chunk-size', type=int, default=None, help='Orders per transaction.')
+@click.option('--rebuild', is_flag=True, help='Empty the rollups and recount every order.')
+def backfill_command(chunk_size, rebuild):
+    """Add orders missing from the sales rollups (all of them with --rebuild)."""
+    total = 0
+    for total in backfill(chunk_size, rebuild):
+        click.echo(f'Rolled up {total} order(s)...')
+    click.echo(f'Rolled up {total} order(s).')
@@ -0,0 +1,293 @@
+import csv
+import io
+import json
+import os
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, func, insert, select, update
+from app import db
+from app.models.models import Product
+from app.services.search import reindex_on_commit
+from app.utils.cache import entity_tag, mark_stale
+from app.utils.database import insert_ids
+from app.utils.serializers import CATALOG_FIELDS
+
+# Bulk catalog sync: records are parsed one at a time from the upload and
+# written CATALOG_IMPORT_CHUNK at a time, each chunk one transaction of
+# executemany statements, so memory stays flat and a million products
+# cost a few hundred round trips rather than a million commits.
+
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+EXTENSIONS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+NUMBERS = (('id', int), ('price', float), ('stock', int))
+
+table = Product.__table__
+
+
+class InvalidRecord(ValueError):
+    def __init__(self, line, message):
+        super().__init__(message)
+        self.line = line
+
+
+def read_records(stream, fmt):
+    """Yield ``(line, record)`` for each record of the binary ``stream``.
+
+    Records are dicts; an NDJSON line that is not valid JSON yields None,
+    which :func:`parse_record` rejects.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line, raw in enumerate(stream, 1):
+        if not raw.strip():
+            continue
+        try:
+            yield line, json.loads(raw)
+        except ValueError:
+            yield line, None
+
+
+def parse_record(line, record):
+    """Validate ``record`` into product column values; raises InvalidRecord.
+
+    Blank and missing fields come back as None, which an update leaves
+    unchanged. New products need a name and price.
+    """
+    if not isinstance(record, dict):
+        raise InvalidRecord(line, 'expected a JSON object')
+    values = {}
+    for name, convert in NUMBERS:
+        value = record.get(name)
+        if value is None or value == '':
+            values[name] = None
+            continue
+        kind = 'an integer' if convert is int else 'a number'
+        # JSON true or 2.5 would convert quietly to 1 or 2
+        if isinstance(value, bool) or (convert is int and isinstance(value, float) and not value.is_integer()):
+            raise InvalidRecord(line, f'{name} must be {kind}')
+        try:
+            values[name] = convert(value)
+        except (TypeError, ValueError):
+            raise InvalidRecord(line, f'{name} must be {kind}')
+        if values[name] < 0:
+            raise InvalidRecord(line, f'{name} must not be negative')
+    for name in ('name', 'description'):
+        value = record.get(name)
+        if value is not None and not isinstance(value, str):
+            raise InvalidRecord(line, f'{name} must be a string')
+        values[name] = value or None
+    if values['name'] is not None and len(values['name']) > table.c.name.type.length:
+        raise InvalidRecord(line, f'name must be at most {table.c.name.type.length} characters')
+    return values
+
+
+def _keep(column):
+    """The bound value for ``column``, or its current value when the record left it blank."""
+    return func.coalesce(bindparam(f'b_{column.name}', type_=column.type), column)
+
+
+# Stock may not drop below the units held by reservations (checked against
+# the rows read for the chunk, and again by the guard for holds placed
+# since; write_chunk reports rows the guard skipped)
+UPDATE_PRODUCT = update(table).where(
+    table.c.id == bindparam('b_id'), table.c.reserved <= _keep(table.c.stock)
+).values(
+    name=_keep(table.c.name), description=_keep(table.c.description), price=_keep(table.c.price),
+    stock=_keep(table.c.stock), version_id=table.c.version_id + 1
+)
+
+
+def _skipped_updates(updates):
+    """The ``(id, reserved)`` of updated rows whose stock the guard left alone."""
+    stock = {row['b_id']: row['b_stock'] for row in updates if row['b_stock'] is not None}
+    if not stock:
+        return []
+    rows = db.session.execute(
+        select(table.c.id, table.c.stock, table.c.reserved).where(table.c.id.in_(list(stock)))
+    ).all()
+    return [(row.id, row.reserved) for row in rows if row.stock != stock[row.id]]
+
+
+def _advance_id_sequence():
+    """Move PostgreSQL's id sequence past ids inserted explicitly.
+
+    Otherwise the next product created without an id would be handed
+    one the import already used.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return
+    sequence = func.pg_get_serial_sequence(table.name, table.c.id.name)
+    db.session.execute(select(func.setval(
+        sequence, func.greatest(select(func.max(table.c.id)).scalar_subquery(), func.nextval(sequence))
+    )))
+
+
+def write_chunk(records, report):
+    """Upsert one chunk of ``(line, values)`` records and commit it.
+
+    Records with an id update that product, or create it under that id;
+    records without one always create a product. Cache entries are
+    evicted and the search index updated with the same commit.
+    """
+    by_id, new = {}, []
+    for line, values in records:
+        if values['id'] is None:
+            new.append((line, values))
+        else:
+            # A later record for the same id wins
+            by_id[values['id']] = (line, values)
+    reserved = dict(db.session.execute(
+        select(table.c.id, table.c.reserved).where(table.c.id.in_(list(by_id)))
+    ).all()) if by_id else {}
+
+    updates, inserts, created = [], [], []
+    for product_id, (line, values) in by_id.items():
+        if product_id in reserved:
+            if values['stock'] is not None and values['stock'] < reserved[product_id]:
+                report.reject(line, f'stock cannot drop below the {reserved[product_id]} units on hold')
+            else:
+                updates.append({f'b_{name}': value for name, value in values.items()})
+        else:
+            new.append((line, values))
+    for line, values in new:
+        if values['name'] is None or values['price'] is None:
+            report.reject(line, 'new products need a name and price')
+            continue
+        row = dict(values, description=values['description'] or '', stock=values['stock'] or 0)
+        if row['id'] is None:
+            del row['id']
+            created.append(row)
+        else:
+            inserts.append(row)
+
+    if updates:
+        db.session.execute(UPDATE_PRODUCT, updates)
+        # executemany has no per-row counts, so look for rows left as they were
+        skipped = dict(_skipped_updates(updates))
+        for product_id, held in skipped.items():
+            report.reject(by_id[product_id][0], f'stock cannot drop below the {held} units on hold')
+        updates = [row for row in updates if row['b_id'] not in skipped]
+    if inserts:
+        db.session.execute(insert(table), inserts)
+        _advance_id_sequence()
+    ids = [row['b_id'] for row in updates] + [row['id'] for row in inserts] + insert_ids(db.session, table, created)
+    if ids:
+        reindex_on_commit(db.session, db.session.execute(
+            select(table.c.id, table.c.name, table.c.description).where(table.c.id.in_(ids))
+        ).all())
+        mark_stale(db.session, 'products', *(entity_tag('product', product_id) for product_id in ids))
+        if any(row['b_name'] is not None for row in updates):
+            # Order documents embed product names
+            mark_stale(db.session, 'product-names')
+    db.session.commit()
+    report.updated += len(updates)
+    report.inserted += len(inserts) + len(created)
+
+
+class ImportReport:
+    """Counts for one import, and the first CATALOG_IMPORT_MAX_ERRORS rejected records."""
+
+    def __init__(self, max_errors):
+        self.inserted = self.updated = self.rejected = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'message': message})
+
+    def to_dict(self):
+        return {'inserted': self.inserted, 'updated': self.updated, 'rejected': self.rejected, 'errors': self.errors}
+
+
+def import_products(stream, fmt, chunk_size=None):
+    """Upsert every product record in the binary ``stream`` (``csv`` or ``ndjson``).
+
+    Invalid records are skipped and reported, not fatal. Each chunk
+    commits on its own, so an upload that breaks off keeps the chunks
+    before it; records carrying ids can simply be sent again.
+    Returns an :class:`ImportReport`.
+    """
+    chunk_size = chunk_size or current_app.config['CATALOG_IMPORT_CHUNK']
+    report = ImportReport(current_app.config['CATALOG_IMPORT_MAX_ERRORS'])
+    chunk = []
+    try:
+        for line, record in read_records(stream, fmt):
+            try:
+                chunk.append((line, parse_record(line, record)))
+            except InvalidRecord as e:
+                report.reject(e.line, str(e))
+            if len(chunk) >= chunk_size:
+                write_chunk(chunk, report)
+                chunk = []
+    except (csv.Error, UnicodeDecodeError) as e:
+        # The rest of the file can't be read; keep what came before
+        report.reject(None, f'unreadable input: {e}')
+    if chunk:
+        write_chunk(chunk, report)
+    return report
+
+
+def export_products(fmt):
+    """Yield the whole catalog as ``fmt`` text, a batch of rows per piece.
+
+    Rows are read through a server-side cursor in STREAM_BATCH_SIZE
+    batches, and the output is what :func:`import_products` accepts.
+    """
+    result = db.session.execute(
+        select(*CATALOG_FIELDS.columns).order_by(Product.id)
+        .execution_options(yield_per=current_app.config['STREAM_BATCH_SIZE'])
+    )
+    if fmt == 'ndjson':
+        dumps, dump = current_app.json.dumps, CATALOG_FIELDS.dump
+        for rows in result.partitions():
+            yield ''.join(dumps(dump(row)) + '\n' for row in rows)
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CATALOG_FIELDS.names)
+    for rows in result.partitions():
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # An empty catalog: just the header
+        yield buffer.getvalue()
+
+
+def file_format(filename, fmt):
+    fmt = fmt or EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+    if fmt is None:
+        raise click.UsageError('Cannot tell the format from the file name; pass --format')
+    return fmt
+
+
+catalog_cli = AppGroup('catalog', help='Bulk import and export the product catalog.')
+
+
+@catalog_cli.command('import')
+@click.argument('file', type=click.File('rb'))
+@click.option('--format', 'fmt', type=click.Choice(sorted(FORMATS)), help='Default: from the file extension.')
+@click.option('--chunk-size', type=int, default=None, help='Products per transaction.')
+def import_command(file, fmt, chunk_size):
+    """Create or update products from a CSV or NDJSON FILE (- for stdin)."""
+    report = import_products(file, file_format(getattr(file, 'name', ''), fmt), chunk_size)
+    for error in report.errors:
+        click.echo(f"line {error['line']}: {error['message']}", err=True)
+    click.echo(f'Inserted {report.inserted}, updated {report.updated}, rejected {report.rejected} product(s).')
+
+
+@catalog_cli.command('export')
+@click.argument('file', type=click.File('wb'), default='-')
+@click.option('--format', 'fmt', type=click.Choice(sorted(FORMATS)), help='Default: from the file extension, else csv.')
+def export_command(file, fmt):
+    """Write every product to a CSV or NDJSON FILE (default stdout)."""
+    fmt = fmt or EXTENSIONS.get(os.path.splitext(getattr(file, 'name', ''))[1].lower(), 'csv')
+    for piece in export_products(fmt):
+        file.write(piece.encode('utf-8'))
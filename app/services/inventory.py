@@ -0,0 +1,104 @@
+import random
+import time
+from flask import current_app
+from sqlalchemy import case, update
+from app import db
+from app.models.models import Product
+from app.utils.cache import entity_tag, mark_stale
+
+
+def merge_quantities(items):
+    """Collapse line items into ``{product_id: total_quantity}``."""
+    quantities = {}
+    for item in items:
+        quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+    return quantities
+
+
+def load_products(product_ids):
+    """Fetch every product in one ``IN (...)`` query, keyed by id.
+
+    No row locks are taken: :func:`decrement_stock` re-checks each row's
+    stock in its UPDATE, so hot products are never serialized behind a lock.
+    """
+    return {product.id: product for product in Product.query.filter(Product.id.in_(product_ids))}
+
+
+def _update_stock(quantities, guards, values):
+    """Apply ``values`` to every product in ``quantities`` in one UPDATE.
+
+    ``guards`` and ``values`` are built from ``delta``, a per-row CASE on
+    the quantity. Returns True when every row passed its guards.
+    ``version_id`` is left alone: it tracks edits to the product itself,
+    and bumping it on every stock movement would make concurrent
+    checkouts of one product conflict with each other.
+    """
+    if not quantities:
+        return True
+    ids = list(quantities)
+    delta = case(quantities, value=Product.id)
+    result = db.session.execute(
+        update(Product)
+        .where(Product.id.in_(ids), *guards(delta))
+        .values(**values(delta))
+        .execution_options(synchronize_session=False)
+    )
+    mark_stale(db.session, 'products', *(entity_tag('product', product_id) for product_id in ids))
+    return result.rowcount == len(ids)
+
+
+def decrement_stock(quantities, prices=None):
+    """Atomically take ``quantities`` out of available stock in a single UPDATE.
+
+    Every row is guarded by ``stock - reserved >= quantity`` and, with
+    ``prices`` (``{product_id: price}``), by still having the price the
+    order was priced at; if any guard fails the rowcount comes up short
+    and nothing should be committed. Returns True when every product was
+    decremented.
+    """
+    def guards(delta):
+        criteria = [Product.stock - Product.reserved >= delta]
+        if prices is not None:
+            criteria.append(Product.price == case(prices, value=Product.id))
+        return criteria
+
+    return _update_stock(quantities, guards, lambda delta: {'stock': Product.stock - delta})
+
+
+def reserve_stock(quantities):
+    """Hold ``quantities`` against available stock; True if all could be held."""
+    return _update_stock(
+        quantities,
+        lambda delta: [Product.stock - Product.reserved >= delta],
+        lambda delta: {'reserved': Product.reserved + delta}
+    )
+
+
+def release_stock(quantities):
+    """Return held ``quantities`` to available stock."""
+    return _update_stock(
+        quantities,
+        lambda delta: [Product.reserved >= delta],
+        lambda delta: {'reserved': Product.reserved - delta}
+    )
+
+
+def commit_reserved_stock(quantities):
+    """Turn held ``quantities`` into sold stock."""
+    return _update_stock(
+        quantities,
+        lambda delta: [Product.reserved >= delta, Product.stock >= delta],
+        lambda delta: {'stock': Product.stock - delta, 'reserved': Product.reserved - delta}
+    )
+
+
+def conflict_backoff(attempt):
+    """Sleep before retrying a checkout that lost a stock race, ``attempt`` (0-based).
+
+    Exponential with full jitter, capped by ``ORDER_RETRY_BACKOFF_MAX``, so
+    checkouts racing for the same product spread out instead of colliding
+    again in lockstep.
+    """
+    config = current_app.config
+    ceiling = min(config['ORDER_RETRY_BACKOFF_MAX'], config['ORDER_RETRY_BACKOFF'] * 2 ** attempt)
+    time.sleep(random.uniform(0, ceiling))
@@ -0,0 +1,377 @@
+import os
+import queue
+import signal
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+import click
+from flask import current_app, has_app_context
+from flask.cli import AppGroup
+from flask_sqlalchemy.session import Session
+from sqlalchemy import and_, delete, event, func, or_, select, update
+from app import db
+from app.models.models import Job
+
+# Jobs are rows in the job table, written in the same transaction as the
+# change that caused them (the outbox pattern): a rolled-back checkout
+# never emits its job, and a committed one always does. Workers claim due
+# rows with a guarded UPDATE that takes a time-limited lease, so several
+# worker processes (or threads) can share one table, and a worker that
+# dies mid-job only delays it until the lease runs out.
+
+
+class Task:
+    def __init__(self, name, fn, max_attempts=None, concurrency=None):
+        self.name = name
+        self.fn = fn
+        self.max_attempts = max_attempts
+        self.concurrency = concurrency
+
+
+_tasks = {}
+
+
+def task(name, max_attempts=None, concurrency=None):
+    """Register ``fn(payload)`` as the handler for jobs called ``name``.
+
+    ``max_attempts`` defaults to ``JOBS_MAX_ATTEMPTS``; ``concurrency``
+    caps how many jobs of this name may run at once across all workers.
+    Handlers run in their own transaction, committed together with the
+    job being marked done, and must tolerate being run again after a
+    crash.
+    """
+    def decorator(fn):
+        _tasks[name] = Task(name, fn, max_attempts, concurrency)
+        return fn
+    return decorator
+
+
+def enqueue(name, payload=None, key=None, delay=0):
+    """Add a job to the current transaction; it runs once the caller commits.
+
+    ``key`` makes the job idempotent: if a job with the same key already
+    exists (or was enqueued earlier in this transaction) nothing is added
+    and None is returned. Keys are unique in the table, so two
+    transactions racing to enqueue the same key cannot both commit.
+    """
+    jobs = enqueue_many(name, [payload or {}], None if key is None else [key], delay)
+    return jobs[0] if jobs else None
+
+
+def enqueue_many(name, payloads, keys=None, delay=0):
+    """:func:`enqueue` for many payloads, checking their keys in one query."""
+    if name not in _tasks:
+        raise KeyError(f'No task registered for {name!r}')
+    session = db.session
+    keys = list(keys) if keys is not None else [None] * len(payloads)
+    seen = session.info.setdefault('job_keys', set())
+    wanted = [key for key in keys if key is not None]
+    if wanted:
+        seen.update(session.scalars(select(Job.idempotency_key).where(Job.idempotency_key.in_(wanted))))
+    max_attempts = _tasks[name].max_attempts or current_app.config['JOBS_MAX_ATTEMPTS']
+    run_at = datetime.utcnow() + timedelta(seconds=delay)
+    jobs = []
+    for payload, key in zip(payloads, keys):
+        if key is not None:
+            if key in seen:
+                continue
+            seen.add(key)
+        jobs.append(Job(name=name, payload=payload, idempotency_key=key, max_attempts=max_attempts, run_at=run_at))
+    session.add_all(jobs)
+    return jobs
+
+
+def _due(now):
+    # Pending and due, or running on a lease that has run out
+    return or_(
+        and_(Job.status == 'pending', Job.run_at <= now),
+        and_(Job.status == 'running', Job.locked_until <= now)
+    )
+
+
+def claim(job_id, worker_id):
+    """Lease a due job to ``worker_id``; True if this worker got it.
+
+    Respects the task's concurrency limit. The caller commits so the
+    lease is visible to other workers before the job starts.
+    """
+    now = datetime.utcnow()
+    job = db.session.execute(select(Job.name).where(Job.id == job_id)).first()
+    if job is None:
+        return False
+    guards = [Job.id == job_id, _due(now), Job.attempts < Job.max_attempts]
+    spec = _tasks.get(job.name)
+    if spec is not None and spec.concurrency:
+        # Counted in a derived table: MySQL rejects an UPDATE whose WHERE
+        # reads the table being updated directly (error 1093), but
+        # materializes an aggregating derived table first
+        running = Job.__table__.alias('running')
+        counted = select(func.count().label('n')).select_from(running).where(
+            running.c.name == job.name,
+            running.c.status == 'running',
+            running.c.locked_until > now
+        ).subquery('running_count')
+        guards.append(select(counted.c.n).scalar_subquery() < spec.concurrency)
+    result = db.session.execute(
+        update(Job).where(*guards).values(
+            status='running',
+            attempts=Job.attempts + 1,
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=current_app.config['JOBS_LEASE_SECONDS'])
+        ).execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def claim_next(worker_id):
+    """Lease the next due job to ``worker_id`` and commit; returns its id or None."""
+    now = datetime.utcnow()
+    # Jobs whose last attempt died with its worker
+    db.session.execute(
+        update(Job).where(
+            Job.status == 'running', Job.locked_until <= now, Job.attempts >= Job.max_attempts
+        ).values(status='failed', last_error='Worker lease expired').execution_options(synchronize_session=False)
+    )
+    candidates = db.session.scalars(
+        select(Job.id).where(_due(now)).order_by(Job.run_at, Job.id).limit(current_app.config['JOBS_CLAIM_BATCH'])
+    ).all()
+    for job_id in candidates:
+        if claim(job_id, worker_id):
+            db.session.commit()
+            return job_id
+    db.session.commit()
+    return None
+
+
+def _finish(job_id, worker_id, **values):
+    # Only the lease holder may settle a job
+    result = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status == 'running', Job.locked_by == worker_id)
+        .values(locked_by=None, locked_until=None, **values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def retry_delay(attempts):
+    config = current_app.config
+    return min(config['JOBS_RETRY_BACKOFF_MAX'], config['JOBS_RETRY_BACKOFF'] * 2 ** (attempts - 1))
+
+
+def run_job(job_id, worker_id):
+    """Run a job leased to ``worker_id``; True if it completed.
+
+    A failure is retried after an exponential backoff until the job's
+    ``max_attempts`` are used up, after which it is marked failed.
+    """
+    job = db.session.get(Job, job_id)
+    name, payload, attempts, max_attempts = job.name, job.payload, job.attempts, job.max_attempts
+    try:
+        spec = _tasks.get(name)
+        if spec is None:
+            raise LookupError(f'No task registered for {name!r}')
+        spec.fn(payload)
+        if _finish(job_id, worker_id, status='done', last_error=None):
+            db.session.commit()
+            return True
+        # Our lease ran out and someone else has the job now
+        db.session.rollback()
+        return False
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc()
+        current_app.logger.warning('Job %s (%s) failed, attempt %s of %s', job_id, name, attempts, max_attempts)
+        if attempts >= max_attempts:
+            _finish(job_id, worker_id, status='failed', last_error=error)
+        else:
+            _finish(job_id, worker_id, status='pending', last_error=error,
+                    run_at=datetime.utcnow() + timedelta(seconds=retry_delay(attempts)))
+        db.session.commit()
+        return False
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}'
+
+
+class MemoryBroker:
+    """Runs committed jobs on a thread pool inside the web process.
+
+    For single-process deployments and development: no separate worker is
+    needed, and jobs start as soon as their transaction commits. Jobs
+    still live in the job table, so retries, idempotency keys and
+    concurrency limits behave exactly as with a worker, and anything left
+    pending by a restart is picked up by ``flask jobs work``.
+    """
+
+    def __init__(self, app):
+        self._app = app
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def dispatch(self, job_ids):
+        with self._lock:
+            if not self._threads:
+                for i in range(self._app.config['JOBS_WORKER_THREADS']):
+                    thread = threading.Thread(target=self._work, name=f'jobs-{i}', daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+        for job_id in job_ids:
+            self._queue.put(job_id)
+
+    def join(self):
+        """Block until every dispatched job has been attempted."""
+        self._queue.join()
+
+    def _work(self):
+        worker_id = worker_name()
+        while True:
+            job_id = self._queue.get()
+            try:
+                with self._app.app_context():
+                    try:
+                        if claim(job_id, worker_id):
+                            db.session.commit()
+                            run_job(job_id, worker_id)
+                        else:
+                            db.session.rollback()
+                        self._reschedule(job_id)
+                    finally:
+                        db.session.remove()
+            except Exception:
+                self._app.logger.exception('Job %s could not be dispatched', job_id)
+            finally:
+                self._queue.task_done()
+
+    def _reschedule(self, job_id):
+        # Retries and jobs held back by a concurrency limit come round again
+        job = db.session.execute(select(Job.status, Job.run_at).where(Job.id == job_id)).first()
+        if job is not None and job.status == 'pending':
+            delay = max((job.run_at - datetime.utcnow()).total_seconds(), self._app.config['JOBS_POLL_INTERVAL'])
+            timer = threading.Timer(delay, self.dispatch, [[job_id]])
+            timer.daemon = True
+            timer.start()
+
+
+class Worker:
+    """Polls the job table from a separate process (see ``worker.py``)."""
+
+    def __init__(self, app, threads=None, poll_interval=None):
+        self.app = app
+        self.threads = threads or app.config['JOBS_WORKER_THREADS']
+        self.poll_interval = poll_interval or app.config['JOBS_POLL_INTERVAL']
+        self._stop = threading.Event()
+
+    def stop(self, *args):
+        self._stop.set()
+
+    def run(self):
+        """Run until SIGINT/SIGTERM, finishing the jobs in hand first."""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        threads = [threading.Thread(target=self._loop, name=f'worker-{i}') for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_once(self):
+        """Run due jobs until none are left; returns how many were attempted."""
+        count = 0
+        with self.app.app_context():
+            worker_id = worker_name()
+            try:
+                while (job_id := claim_next(worker_id)) is not None:
+                    run_job(job_id, worker_id)
+                    count += 1
+            finally:
+                db.session.remove()
+        return count
+
+    def _loop(self):
+        worker_id = worker_name()
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    job_id = claim_next(worker_id)
+                    if job_id is not None:
+                        run_job(job_id, worker_id)
+                except Exception:
+                    self.app.logger.exception('Job worker error')
+                    job_id = None
+                finally:
+                    db.session.remove()
+            if job_id is None:
+                self._stop.wait(self.poll_interval)
+
+
+class JobQueue:
+    """Flask extension wiring the configured broker into commits.
+
+    ``JOBS_BROKER`` is ``database`` (jobs wait for a worker process) or
+    ``memory`` (see :class:`MemoryBroker`).
+    """
+
+    def init_app(self, app):
+        broker = app.config['JOBS_BROKER']
+        if broker not in ('database', 'memory'):
+            raise ValueError(f'Unknown JOBS_BROKER {broker!r}')
+        app.extensions['jobs'] = MemoryBroker(app) if broker == 'memory' else None
+        app.cli.add_command(jobs_cli)
+
+    def broker(self):
+        return current_app.extensions.get('jobs')
+
+
+job_queue = JobQueue()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_job_ids(session, flush_context):
+    job_ids = [obj.id for obj in session.new if isinstance(obj, Job)]
+    if job_ids:
+        session.info.setdefault('job_ids', []).extend(job_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_jobs(session):
+    session.info.pop('job_keys', None)
+    job_ids = session.info.pop('job_ids', None)
+    if job_ids and has_app_context():
+        broker = job_queue.broker()
+        if broker is not None:
+            broker.dispatch(job_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_jobs(session):
+    session.info.pop('job_keys', None)
+    session.info.pop('job_ids', None)
+
+
+jobs_cli = AppGroup('jobs', help='Run and maintain background jobs.')
+
+
+@jobs_cli.command('work')
+@click.option('--threads', type=int, default=None, help='Jobs to run at once (JOBS_WORKER_THREADS).')
+@click.option('--once', is_flag=True, help='Run the jobs due now, then exit.')
+def work_command(threads, once):
+    """Run background jobs from the job table."""
+    worker = Worker(current_app._get_current_object(), threads=threads)
+    if once:
+        click.echo(f'Ran {worker.run_once()} job(s).')
+    else:
+        worker.run()
+
+
+@jobs_cli.command('purge')
+@click.option('--days', type=int, default=None, help='Keep jobs finished this recently (JOBS_RETENTION_DAYS).')
+def purge_command(days):
+    """Delete completed jobs older than the retention period."""
+    days = days if days is not None else current_app.config['JOBS_RETENTION_DAYS']
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    result = db.session.execute(delete(Job).where(Job.status == 'done', Job.updated_at < cutoff))
+    db.session.commit()
+    click.echo(f'Purged {result.rowcount} job(s).')
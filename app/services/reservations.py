@@ -0,0 +1,76 @@
+import time
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, select, update
+from app import db
+from app.models.models import Reservation, ReservationItem
+from app.services.inventory import release_stock
+
+
+def claim(reservation_id, status, unexpired=True):
+    """Move a held reservation to ``status``; True if this caller won it.
+
+    The transition is a single guarded UPDATE, so a confirm racing the
+    sweeper (or a second confirm) settles on exactly one winner. With
+    ``unexpired`` a hold past its expiry can no longer be claimed even if
+    the sweeper has not reached it yet.
+    """
+    guards = [Reservation.id == reservation_id, Reservation.status == 'held']
+    if unexpired:
+        guards.append(Reservation.expires_at > datetime.utcnow())
+    result = db.session.execute(
+        update(Reservation).where(*guards).values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def expire_reservations(now=None, limit=None):
+    """Expire held reservations past their deadline and free their stock.
+
+    Handles at most ``limit`` (``RESERVATION_SWEEP_BATCH``) reservations,
+    oldest deadline first, in the caller's transaction; the caller
+    commits. Returns how many were expired.
+    """
+    now = now or datetime.utcnow()
+    limit = limit or current_app.config['RESERVATION_SWEEP_BATCH']
+    due = db.session.scalars(
+        select(Reservation.id)
+        .where(Reservation.status == 'held', Reservation.expires_at <= now)
+        .order_by(Reservation.expires_at)
+        .limit(limit)
+    ).all()
+    expired = [reservation_id for reservation_id in due if claim(reservation_id, 'expired', unexpired=False)]
+    if not expired:
+        return 0
+    held = db.session.execute(
+        select(ReservationItem.product_id, func.sum(ReservationItem.quantity))
+        .where(ReservationItem.reservation_id.in_(expired))
+        .group_by(ReservationItem.product_id)
+    ).all()
+    release_stock({product_id: quantity for product_id, quantity in held})
+    return len(expired)
+
+
+reservations_cli = AppGroup('reservations', help='Manage stock reservations.')
+
+
+@reservations_cli.command('sweep')
+@click.option('--interval', type=float, default=None,
+              help='Keep sweeping every INTERVAL seconds instead of exiting.')
+def sweep_command(interval):
+    """Expire overdue reservations and return their stock."""
+    while True:
+        total = 0
+        while True:
+            expired = expire_reservations()
+            db.session.commit()
+            total += expired
+            if expired < current_app.config['RESERVATION_SWEEP_BATCH']:
+                break
+        click.echo(f'Expired {total} reservation(s).')
+        if interval is None:
+            return
+        time.sleep(interval)
@@ -0,0 +1,299 @@
+import math
+import re
+import sqlite3
+import threading
+from bisect import bisect_left
+from collections import Counter
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from flask_sqlalchemy.session import Session
+from sqlalchemy import DDL, event, inspect, text
+from app import db
+from app.models.models import Product
+
+# Matches in the name count this much more than matches in the description
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(value):
+    return _TOKEN.findall((value or '').lower())
+
+
+def _fts5_available():
+    try:
+        sqlite3.connect(':memory:').execute('CREATE VIRTUAL TABLE t USING fts5(x)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+FTS5_AVAILABLE = _fts5_available()
+
+FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5("
+    "name, description, prefix='2 3', tokenize='unicode61')"
+)
+
+
+def _use_fts(ddl, target, bind, **kw):
+    return bind.dialect.name == 'sqlite' and FTS5_AVAILABLE
+
+
+# Keep the index's lifetime tied to the product table's; databases created
+# before search existed get it from `flask search rebuild`
+event.listen(Product.__table__, 'after_create', DDL(FTS_DDL).execute_if(callable_=_use_fts))
+event.listen(
+    Product.__table__, 'before_drop',
+    DDL('DROP TABLE IF EXISTS product_fts').execute_if(callable_=_use_fts)
+)
+
+
+class InvertedIndex:
+    """In-process inverted index over product names and descriptions.
+
+    The fallback when the database has no FTS5. Each process holds its own
+    copy, built from the product table on first use and then updated from
+    that process's commits, so it suits single-process deployments and
+    tests; multi-worker setups should use the FTS5 backend.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._docs = {}
+        self._terms = []
+        self._terms_dirty = False
+
+    def add(self, product_id, name, description):
+        with self._lock:
+            self._remove(product_id)
+            weights = Counter()
+            for term in tokenize(name):
+                weights[term] += NAME_WEIGHT
+            for term in tokenize(description):
+                weights[term] += DESCRIPTION_WEIGHT
+            self._docs[product_id] = weights
+            for term, weight in weights.items():
+                if term not in self._postings:
+                    self._postings[term] = {}
+                    self._terms_dirty = True
+                self._postings[term][product_id] = weight
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def _remove(self, product_id):
+        for term in self._docs.pop(product_id, ()):
+            postings = self._postings[term]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+                self._terms_dirty = True
+
+    def _expand(self, prefix):
+        if self._terms_dirty:
+            self._terms = sorted(self._postings)
+            self._terms_dirty = False
+        i = bisect_left(self._terms, prefix)
+        while i < len(self._terms) and self._terms[i].startswith(prefix):
+            yield self._terms[i]
+            i += 1
+
+    def search(self, terms, limit, offset):
+        """Return ``(product_id, score)`` pairs matching every term prefix."""
+        with self._lock:
+            total = len(self._docs) or 1
+            scores = None
+            for prefix in terms:
+                matched = {}
+                for term in self._expand(prefix):
+                    postings = self._postings[term]
+                    idf = math.log(1 + total / len(postings))
+                    for product_id, weight in postings.items():
+                        matched[product_id] = matched.get(product_id, 0.0) + idf * weight
+                if scores is None:
+                    scores = matched
+                else:
+                    scores = {pid: score + matched[pid] for pid, score in scores.items() if pid in matched}
+                if not scores:
+                    return []
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+            return ranked[offset:offset + limit]
+
+
+class ProductSearch:
+    """Full-text product search, maintained incrementally from commits.
+
+    Uses an FTS5 table (``product_fts``) when the database is SQLite with
+    FTS5, otherwise an :class:`InvertedIndex`; ``SEARCH_BACKEND`` forces
+    one (``fts5`` or ``memory``). Both support ranking and prefix matches.
+    """
+
+    def init_app(self, app):
+        app.extensions['product_search'] = {'backend': None, 'index': None}
+        app.cli.add_command(search_cli)
+
+    def _state(self):
+        return current_app.extensions['product_search']
+
+    def backend(self, connection=None):
+        state = self._state()
+        if state['backend'] is None:
+            configured = current_app.config['SEARCH_BACKEND']
+            if configured in ('auto', 'fts5'):
+                use_fts = db.engine.dialect.name == 'sqlite' and FTS5_AVAILABLE
+                if use_fts:
+                    connection = connection if connection is not None else db.session.connection()
+                    use_fts = connection.execute(text(
+                        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_fts'"
+                    )).first() is not None
+                if configured == 'fts5' and not use_fts:
+                    current_app.logger.warning(
+                        'FTS5 index missing or unsupported; run `flask search rebuild`. '
+                        'Falling back to the in-memory search index.'
+                    )
+                configured = 'fts5' if use_fts else 'memory'
+            state['backend'] = configured
+        return state['backend']
+
+    def _memory_index(self):
+        state = self._state()
+        if state['index'] is None:
+            index = InvertedIndex()
+            rows = db.session.query(Product.id, Product.name, Product.description)
+            for row in rows.execution_options(yield_per=1000):
+                index.add(row.id, row.name, row.description)
+            state['index'] = index
+        return state['index']
+
+    def search(self, query, limit, offset=0):
+        """Return ranked ``(product_id, score)`` pairs for ``query``."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        if self.backend() == 'memory':
+            return self._memory_index().search(terms, limit, offset)
+        match = ' '.join(f'"{term}"*' for term in terms)
+        rows = db.session.execute(text(
+            'SELECT rowid, bm25(product_fts, :name_weight, :description_weight) AS rank '
+            'FROM product_fts WHERE product_fts MATCH :match '
+            'ORDER BY rank, rowid LIMIT :limit OFFSET :offset'
+        ), {
+            'match': match,
+            'name_weight': NAME_WEIGHT,
+            'description_weight': DESCRIPTION_WEIGHT,
+            'limit': limit,
+            'offset': offset,
+        })
+        # bm25() is "lower is better"; flip it so scores read naturally
+        return [(row.rowid, -row.rank) for row in rows]
+
+    def index_products(self, connection, rows):
+        """Reindex ``(id, name, description)`` rows written outside the ORM.
+
+        For FTS5 this runs on ``connection`` so it commits (or rolls back)
+        with the write itself; the in-memory index is updated immediately.
+        """
+        if not rows:
+            return
+        if self.backend(connection) == 'memory':
+            index = self._state()['index']
+            if index is not None:
+                for product_id, name, description in rows:
+                    index.add(product_id, name, description)
+            return
+        params = [{'id': r[0], 'name': r[1], 'description': r[2]} for r in rows]
+        connection.execute(text('DELETE FROM product_fts WHERE rowid = :id'), params)
+        connection.execute(text(
+            'INSERT INTO product_fts (rowid, name, description) VALUES (:id, :name, :description)'
+        ), params)
+
+    def unindex_products(self, connection, product_ids):
+        if not product_ids:
+            return
+        if self.backend(connection) == 'memory':
+            index = self._state()['index']
+            if index is not None:
+                for product_id in product_ids:
+                    index.remove(product_id)
+            return
+        connection.execute(
+            text('DELETE FROM product_fts WHERE rowid = :id'),
+            [{'id': product_id} for product_id in product_ids]
+        )
+
+    def rebuild(self):
+        state = self._state()
+        state['backend'] = state['index'] = None
+        configured = current_app.config['SEARCH_BACKEND']
+        if configured != 'memory' and db.engine.dialect.name == 'sqlite' and FTS5_AVAILABLE:
+            with db.engine.begin() as conn:
+                conn.execute(text('DROP TABLE IF EXISTS product_fts'))
+                conn.execute(text(FTS_DDL))
+                conn.execute(text(
+                    'INSERT INTO product_fts (rowid, name, description) '
+                    'SELECT id, name, description FROM product'
+                ))
+        if self.backend() == 'memory':
+            self._memory_index()
+
+
+product_search = ProductSearch()
+
+
+def _text_changed(product):
+    state = inspect(product)
+    return state.attrs.name.history.has_changes() or state.attrs.description.history.has_changes()
+
+
+def reindex_on_commit(session, rows, deletes=()):
+    """Reindex ``(id, name, description)`` rows and drop ``deletes`` as ``session`` commits.
+
+    FTS5 is written in the session's own transaction; the in-memory index
+    is only touched once the commit has happened.
+    """
+    connection = session.connection()
+    if product_search.backend(connection) == 'fts5':
+        # Same connection and transaction as the write itself
+        product_search.unindex_products(connection, deletes)
+        product_search.index_products(connection, rows)
+    else:
+        pending = session.info.setdefault('search_updates', [])
+        pending.append((rows, deletes))
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_search_updates(session, flush_context):
+    updates = [p for p in list(session.new) + list(session.dirty)
+               if isinstance(p, Product) and (p in session.new or _text_changed(p))]
+    deletes = [p.id for p in session.deleted if isinstance(p, Product)]
+    if not updates and not deletes:
+        return
+    reindex_on_commit(session, [(p.id, p.name, p.description) for p in updates], deletes)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_search_updates(session):
+    for rows, deletes in session.info.pop('search_updates', ()):
+        product_search.unindex_products(None, deletes)
+        product_search.index_products(None, rows)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_search_updates(session):
+    session.info.pop('search_updates', None)
+
+
+search_cli = AppGroup('search', help='Manage the product search index.')
+
+
+@search_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild the product search index from the product table."""
+    product_search.rebuild()
+    click.echo(f'Search index rebuilt ({product_search.backend()} backend).')
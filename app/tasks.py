@@ -0,0 +1,31 @@
+from flask import current_app
+from app import db
+from app.models.models import Order
+from app.services.analytics import apply_orders
+from app.services.jobs import enqueue_many, task
+
+# Handlers for background jobs; see app.services.jobs. Each receives the
+# JSON payload given to enqueue().
+
+
+@task('order.created')
+def order_created(payload):
+    """Post-checkout work for a new order, off the request path."""
+    order = db.session.get(Order, payload['order_id'])
+    if order is None:
+        # Deleted before the job ran; nothing left to do
+        return
+    current_app.logger.info(
+        'Order %s created for customer %s (total %.2f)', order.id, order.customer_id, order.total_amount
+    )
+    # Counted in the same transaction that marks the job done
+    apply_orders([order.id])
+
+
+def enqueue_order_created(*order_ids):
+    """Queue post-checkout work for ``order_ids`` in the current transaction."""
+    enqueue_many(
+        'order.created',
+        [{'order_id': order_id} for order_id in order_ids],
+        [f'order.created:{order_id}' for order_id in order_ids]
+    )
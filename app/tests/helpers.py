@@ -0,0 +1,33 @@
+import atexit
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from sqlalchemy import event
+from app import db
+from config import Config
+
+DATABASE_DIR = tempfile.mkdtemp(prefix='ecommerce-tests-')
+atexit.register(shutil.rmtree, DATABASE_DIR, ignore_errors=True)
+
+class TestingConfig(Config):
+    """The app config on a scratch SQLite file, so tests never touch ecommerce.db."""
+    SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(DATABASE_DIR, 'test.db')}"
+
+@contextmanager
+def count_queries():
+    """Collect every SQL statement sent to the database inside the block.
+
+    Must be used inside an app context. Yields the (growing) list of
+    statements so tests can assert on ``len()``.
+    """
+    statements = []
+    
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
@@ -0,0 +1,132 @@
+import unittest
+from datetime import datetime
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert
+from app import create_app, db
+from app.models.models import Customer, Order, OrderItem, Product, ProductSales, RolledUpOrder
+from app.services.jobs import Worker
+from app.tests.helpers import TestingConfig
+
+class AnalyticsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_class=TestingConfig)
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+            db.session.add_all([
+                Customer(id=1, name='Ada', email='ada@example.com'),
+                Customer(id=2, name='Grace', email='grace@example.com'),
+                Product(id=1, name='Widget', price=5.0, stock=100),
+                Product(id=2, name='Gadget', price=20.0, stock=3),
+            ])
+            db.session.commit()
+            admin_token = create_access_token(identity=1, additional_claims={'is_admin': True})
+            self.tokens = {
+                customer_id: create_access_token(identity=customer_id, additional_claims={'is_admin': False})
+                for customer_id in (1, 2)
+            }
+        self.admin = {'Authorization': f'Bearer {admin_token}'}
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def order(self, customer_id, *items):
+        response = self.client.post('/orders', json={'items': [
+            {'product_id': product_id, 'quantity': quantity} for product_id, quantity in items
+        ]}, headers={'Authorization': f'Bearer {self.tokens[customer_id]}'})
+        self.assertEqual(response.status_code, 201)
+
+    def get(self, path):
+        response = self.client.get(path, headers=self.admin)
+        self.assertEqual(response.status_code, 200, response.get_json())
+        return response.get_json()
+
+    def insert_orders(self, day):
+        """Write orders straight to the tables, as an import would, with no job."""
+        with self.app.app_context():
+            db.session.execute(insert(Order), [
+                {'id': 100, 'customer_id': 1, 'order_date': day, 'total_amount': 10.0, 'status': 'pending'},
+                {'id': 101, 'customer_id': 2, 'order_date': day, 'total_amount': 60.0, 'status': 'pending'},
+            ])
+            db.session.execute(insert(OrderItem), [
+                {'order_id': 100, 'product_id': 1, 'quantity': 2, 'price': 5.0},
+                {'order_id': 101, 'product_id': 2, 'quantity': 3, 'price': 20.0},
+            ])
+            db.session.commit()
+
+class TestAnalytics(AnalyticsTestCase):
+    def test_orders_are_rolled_up_by_their_job(self):
+        """Test the order.created job folds each order into every rollup"""
+        self.order(1, (1, 2), (2, 1))
+        self.order(2, (1, 3))
+        self.assertEqual(self.get('/analytics/top-products')['products'], [])
+
+        self.assertEqual(Worker(self.app).run_once(), 2)
+        products = self.get('/analytics/top-products')['products']
+        self.assertEqual([(p['product_id'], p['name'], p['orders'], p['units'], p['revenue']) for p in products], [
+            (1, 'Widget', 2, 5, 25.0), (2, 'Gadget', 1, 1, 20.0)
+        ])
+        by_revenue = self.get('/analytics/top-products?by=revenue&limit=1')['products']
+        self.assertEqual([p['product_id'] for p in by_revenue], [1])
+
+        today = datetime.utcnow().date().isoformat()
+        revenue = self.get(f'/analytics/revenue?since={today}&until={today}')
+        self.assertEqual(revenue['days'], [{'day': today, 'orders': 2, 'units': 6, 'revenue': 45.0}])
+        self.assertEqual(revenue['totals'], {'orders': 2, 'units': 6, 'revenue': 45.0})
+        ranged = self.get(f'/analytics/top-products?since={today}')['products']
+        self.assertEqual([(p['product_id'], p['units']) for p in ranged], [(1, 5), (2, 1)])
+        self.assertEqual(self.get('/analytics/top-products?until=2000-01-01')['products'], [])
+
+        customers = self.get('/analytics/customers/top')['customers']
+        self.assertEqual([(c['customer_id'], c['orders'], c['revenue']) for c in customers], [(1, 1, 30.0), (2, 1, 15.0)])
+        self.assertIsNotNone(self.get('/analytics/customers/2')['first_order_at'])
+
+    def test_low_stock_and_customer_without_orders(self):
+        """Test low stock lists products by availability and unknown customers 404"""
+        products = self.get('/analytics/low-stock')['products']
+        self.assertEqual([(p['id'], p['available']) for p in products], [(2, 3)])
+        self.assertEqual(len(self.get('/analytics/low-stock?threshold=1000')['products']), 2)
+
+        self.assertEqual(self.get('/analytics/customers/2')['orders'], 0)
+        self.assertEqual(self.client.get('/analytics/customers/99', headers=self.admin).status_code, 404)
+
+    def test_backfill_counts_each_order_once(self):
+        """Test the backfill CLI rolls up missing orders and the job then adds nothing"""
+        self.order(1, (1, 1))
+        self.insert_orders(datetime(2024, 1, 15, 12))
+
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['analytics', 'backfill', '--chunk-size', '2'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Rolled up 3 order(s).', result.output)
+
+        # The job for the API order finds it already counted
+        self.assertEqual(Worker(self.app).run_once(), 1)
+        with self.app.app_context():
+            self.assertEqual(db.session.get(ProductSales, 1).units, 3)
+            self.assertEqual(RolledUpOrder.query.count(), 3)
+        self.assertIn('Rolled up 0 order(s).', runner.invoke(args=['analytics', 'backfill']).output)
+
+        # A rebuild starts over and lands on the same figures
+        before = self.get('/analytics/revenue')
+        result = runner.invoke(args=['analytics', 'backfill', '--rebuild'])
+        self.assertIn('Rolled up 3 order(s).', result.output)
+        self.assertEqual(self.get('/analytics/revenue'), before)
+        self.assertEqual(before['days'][0], {'day': '2024-01-15', 'orders': 2, 'units': 5, 'revenue': 70.0})
+
+    def test_requires_admin(self):
+        """Test the reports are for admins only and validate their parameters"""
+        headers = {'Authorization': f'Bearer {self.tokens[1]}'}
+        for path in ('/analytics/top-products', '/analytics/revenue', '/analytics/low-stock',
+                     '/analytics/customers/top', '/analytics/customers/1'):
+            self.assertEqual(self.client.get(path, headers=headers).status_code, 403)
+        self.assertEqual(self.client.get('/analytics/revenue').status_code, 401)
+        self.assertEqual(self.client.get('/analytics/top-products?by=price', headers=self.admin).status_code, 400)
+        self.assertEqual(self.client.get('/analytics/revenue?since=yesterday', headers=self.admin).status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
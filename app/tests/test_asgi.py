@@ -0,0 +1,118 @@
+import asyncio
+import json
+import threading
+import unittest
+from unittest.mock import patch
+from flask_jwt_extended import create_access_token
+from app import db
+from app.models.models import Order, OrderItem, Product
+from app.tests.helpers import TestingConfig
+
+try:
+    import aiosqlite  # noqa: F401
+    from app.asgi import check_auth, create_asgi_app
+except ImportError:
+    create_asgi_app = None
+
+@unittest.skipIf(create_asgi_app is None, 'aiosqlite and asgiref are required for the ASGI app')
+class TestAsgi(unittest.TestCase):
+    def setUp(self):
+        self.asgi = create_asgi_app(TestingConfig)
+        self.app = self.asgi.app
+        self.app.config['TESTING'] = True
+
+        with self.app.app_context():
+            db.create_all()
+            products = [Product(name=f'Widget {i}', price=float(i), stock=5) for i in range(1, 4)]
+            order = Order(customer_id=1, total_amount=3.0)
+            db.session.add_all(products + [order])
+            db.session.add(OrderItem(order=order, product=products[0], quantity=3, price=1.0))
+            db.session.commit()
+            self.product_id, self.order_id = products[0].id, order.id
+            token = create_access_token(identity=1)
+            other_token = create_access_token(identity=2)
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.other_headers = {'Authorization': f'Bearer {other_token}'}
+
+    def tearDown(self):
+        asyncio.run(self.asgi.engine.dispose())
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def request(self, method, path, query='', headers=None, body=b''):
+        headers = {**(headers or {}), 'Content-Length': str(len(body))} if body else headers
+        scope = {
+            'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+            'headers': [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+            'http_version': '1.1', 'scheme': 'http', 'root_path': '',
+            'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(self.asgi(scope, receive, send))
+        headers = {k.decode(): v.decode() for k, v in messages[0]['headers']}
+        return messages[0]['status'], headers, b''.join(m.get('body', b'') for m in messages[1:])
+
+    def test_reads_match_the_wsgi_app(self):
+        """Test the async reads answer exactly like the Flask views"""
+        client = self.app.test_client()
+        for path, query in ((f'/products/{self.product_id}', ''), ('/products', 'limit=2'),
+                            ('/products', 'sort=-price&min_price=2'), (f'/orders/{self.order_id}', '')):
+            status, headers, body = self.request('GET', path, query, self.headers)
+            expected = client.get(f'{path}?{query}', headers=self.headers)
+            self.assertEqual((status, json.loads(body)), (expected.status_code, expected.get_json()))
+            self.assertEqual(headers.get('etag'), expected.headers.get('ETag'))
+        self.assertNotIn('x-next-after', headers)
+
+        _, headers, _ = self.request('GET', '/products', 'limit=2', self.headers)
+        self.assertEqual(headers['x-next-after'], '2')
+
+    def test_auth_ownership_and_revalidation(self):
+        """Test token errors, other callers' orders, 404s and 304s"""
+        self.assertEqual(self.request('GET', f'/products/{self.product_id}')[0], 401)
+        self.assertEqual(self.request('GET', f'/orders/{self.order_id}', headers=self.other_headers)[0], 403)
+        self.assertEqual(self.request('GET', '/products/999', headers=self.headers)[0], 404)
+        self.assertEqual(self.request('GET', '/products', 'sort=bogus', self.headers)[0], 400)
+
+        _, headers, _ = self.request('GET', f'/products/{self.product_id}', headers=self.headers)
+        status, _, body = self.request('GET', f'/products/{self.product_id}',
+                                       headers={**self.headers, 'If-None-Match': headers['etag']})
+        self.assertEqual((status, body), (304, b''))
+
+    def test_blocking_hooks_run_off_the_event_loop(self):
+        """Test the token check and Flask hooks run on the thread pool, not the loop"""
+        threads = []
+
+        def record(fn):
+            def wrapper(*args):
+                threads.append(threading.get_ident())
+                return fn(*args)
+            return wrapper
+
+        with patch('app.asgi.check_auth', record(check_auth)), \
+                patch.object(self.app, 'preprocess_request', record(self.app.preprocess_request)):
+            status = self.request('GET', f'/products/{self.product_id}', headers=self.headers)[0]
+        self.assertEqual(status, 200)
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def test_other_requests_fall_back_to_wsgi(self):
+        """Test writes and the remaining routes are served by the Flask app"""
+        body = json.dumps({'items': [{'product_id': self.product_id, 'quantity': 1}]}).encode()
+        status, _, response = self.request(
+            'POST', '/orders', headers={**self.headers, 'Content-Type': 'application/json'}, body=body
+        )
+        self.assertEqual(status, 201)
+        self.assertIn('id', json.loads(response))
+        status, headers, _ = self.request('GET', '/products', 'stream=ndjson', self.headers)
+        self.assertEqual((status, headers['content-type']), (200, 'application/x-ndjson'))
+
+if __name__ == '__main__':
+    unittest.main()
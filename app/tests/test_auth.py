@@ -0,0 +1,85 @@
+import time
+import unittest
+from datetime import timedelta
+from unittest.mock import patch
+from flask_jwt_extended import create_access_token, create_refresh_token
+from app import create_app, db
+from app.models.models import Product
+from app.utils import auth
+from app.utils.auth import TokenCache
+from app.tests.helpers import TestingConfig
+
+class TestAuth(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_class=TestingConfig)
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+            product = Product(name='Widget', price=5.0, stock=5)
+            db.session.add(product)
+            db.session.commit()
+            self.product_id = product.id
+            self.token = create_access_token(identity=1)
+            self.admin_token = create_access_token(identity=2, additional_claims={'is_admin': True})
+            self.refresh_token = create_refresh_token(identity=1)
+            self.expired_token = create_access_token(identity=1, expires_delta=timedelta(seconds=-1))
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def get(self, path, token):
+        return self.client.get(path, headers={'Authorization': f'Bearer {token}'} if token else {})
+
+    def test_token_verified_once(self):
+        """Test a token is verified once, then served from the cache"""
+        with patch.object(auth, 'decode_token', wraps=auth.decode_token) as decode:
+            self.assertEqual(self.get(f'/products/{self.product_id}', self.token).status_code, 200)
+            self.assertEqual(self.get('/products', self.token).status_code, 200)
+            self.assertEqual(self.get('/me/orders', self.token).status_code, 200)
+        self.assertEqual(decode.call_count, 1)
+
+    def test_invalid_tokens_rejected(self):
+        """Test missing, tampered, expired and refresh tokens are refused as before"""
+        path = f'/products/{self.product_id}'
+        self.assertEqual(self.get(path, None).status_code, 401)
+        self.assertEqual(self.get(path, self.token[:-2] + 'xx').status_code, 422)
+        self.assertEqual(self.get(path, self.expired_token).status_code, 401)
+        self.assertEqual(self.get(path, self.refresh_token).status_code, 422)
+        self.assertEqual(len(self.app.extensions['token_cache']), 0)
+
+    def test_cached_token_rejected_once_expired(self):
+        """Test a token served from the cache is refused as soon as its exp passes"""
+        path = f'/products/{self.product_id}'
+        with self.app.app_context():
+            token = create_access_token(identity=1, expires_delta=timedelta(seconds=2))
+        self.assertEqual(self.get(path, token).status_code, 200)
+        self.assertEqual(len(self.app.extensions['token_cache']), 1)
+
+        exp = self.app.extensions['token_cache'].get(token)[1]['exp']
+        time.sleep(max(0, exp - time.time()) + 0.1)
+        self.assertEqual(self.get(path, token).status_code, 401)
+        self.assertEqual(len(self.app.extensions['token_cache']), 0)
+
+    def test_admin_claim_checked(self):
+        """Test admin routes read the role from the verified claims"""
+        self.assertEqual(self.get('/customers/1', self.token).status_code, 403)
+        self.assertEqual(self.get('/customers/1', self.admin_token).status_code, 404)
+
+    def test_cache_drops_expired_and_least_recent(self):
+        """Test cached tokens expire with their exp and the cache stays bounded"""
+        tokens = TokenCache(2)
+        with self.app.app_context():
+            tokens.put('a', {}, {'exp': 100})
+            tokens.put('b', {}, {'exp': 200})
+            self.assertIsNotNone(tokens.get('a', now=50))
+            tokens.put('c', {}, {'exp': 200})
+        self.assertIsNone(tokens.get('b', now=50))
+        self.assertIsNone(tokens.get('a', now=100))
+        self.assertEqual(tokens.get('c', now=100), ({}, {'exp': 200}))
+
+if __name__ == '__main__':
+    unittest.main()
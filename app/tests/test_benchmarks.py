@@ -0,0 +1,41 @@
+import json
+import os
+import tempfile
+import unittest
+from app import db
+from benchmarks.compare import compare
+from benchmarks.run import SCENARIOS, benchmark, benchmark_app
+from benchmarks.seed import seed
+
+class TestBenchmarks(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.app = benchmark_app(f'sqlite:///{self.path}', BCRYPT_LOG_ROUNDS=4, PASSWORD_HASH_WORKERS=0)
+        with self.app.app_context():
+            seed(products=50, customers=5, orders=20)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_every_scenario_runs_cleanly(self):
+        """Test the seeded data drives every scenario without errors"""
+        results = benchmark(self.app, drivers=('client', 'server'), requests=10, concurrency=2, warmup=2)
+        self.assertEqual(set(results), set(SCENARIOS))
+        for drivers in results.values():
+            for result in drivers.values():
+                self.assertEqual((result['requests'], result['errors']), (10, 0))
+                self.assertIsNotNone(result['queries_per_request'])
+        json.dumps(results)
+
+        # A run compared with itself shows no regressions
+        report = {'results': results}
+        self.assertFalse(any(row[-1] for row in compare(report, report, 0.2)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import threading
+import time
+import unittest
+from app import create_app, cache
+from app.utils.cache import get_or_compute, invalidate, tag_versions
+from app.tests.helpers import TestingConfig
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_class=TestingConfig)
+        self.app.config['TESTING'] = True
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        cache.clear()
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def test_concurrent_misses_compute_once(self):
+        """Test concurrent misses for one key are coalesced into a single computation"""
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        def worker():
+            with self.app.app_context():
+                results.append(get_or_compute('hot-key', compute, 60))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 8)
+
+    def test_slow_holder_keeps_the_next_lock(self):
+        """Test a computation outliving its lock does not release the next holder's"""
+        def compute():
+            # Our lock timed out and another request took it meanwhile
+            cache.set('lock:slow-key', 'next-holder')
+            return 'value'
+
+        self.assertEqual(get_or_compute('slow-key', compute, 60), 'value')
+        self.assertEqual(cache.get('lock:slow-key'), 'next-holder')
+
+    def test_uncacheable_result_is_not_stored(self):
+        """Test a compute function returning None is re-run on the next call"""
+        calls = []
+
+        def compute():
+            calls.append(1)
+
+        get_or_compute('key', compute, 60)
+        get_or_compute('key', compute, 60)
+
+        self.assertEqual(len(calls), 2)
+
+    def test_invalidate_replaces_tag_version(self):
+        """Test invalidating a tag mints a fresh version token"""
+        before, = tag_versions(['product:1'])
+        self.assertEqual(tag_versions(['product:1']), [before])
+
+        invalidate('product:1', 'never-cached')
+
+        self.assertNotEqual(tag_versions(['product:1']), [before])
+
+if __name__ == '__main__':
+    unittest.main()
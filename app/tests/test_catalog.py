@@ -0,0 +1,123 @@
+import json
+import unittest
+from sqlalchemy import event
+from flask_jwt_extended import create_access_token
+from app import create_app, db
+from app.models.models import Product
+from app.services.catalog import UPDATE_PRODUCT
+from app.tests.helpers import TestingConfig
+
+class CatalogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_class=TestingConfig)
+        self.app.config['TESTING'] = True
+        self.app.config['CATALOG_IMPORT_CHUNK'] = 2
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(Product(id=1, name='Widget', description='Small', price=5.0, stock=10, reserved=4))
+            db.session.commit()
+            admin_token = create_access_token(identity=1, additional_claims={'is_admin': True})
+            user_token = create_access_token(identity=2, additional_claims={'is_admin': False})
+        self.admin = {'Authorization': f'Bearer {admin_token}'}
+        self.user = {'Authorization': f'Bearer {user_token}'}
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def products(self):
+        with self.app.app_context():
+            return [(p.id, p.name, p.description, p.price, p.stock) for p in Product.query.order_by(Product.id)]
+
+    def upload(self, body, content_type, **query):
+        return self.client.post('/products/import', data=body, content_type=content_type,
+                                query_string=query, headers=self.admin)
+
+class TestCatalog(CatalogTestCase):
+    def test_csv_import_upserts_in_chunks(self):
+        """Test CSV records update by id, insert the rest and report bad rows"""
+        body = (
+            'id,name,description,price,stock\n'
+            '1,Widget v2,,6.5,\n'
+            ',Gadget,"Shiny, new",20,3\n'
+            '50,Gizmo,,1.25,7\n'
+            ',Nameless,,3,1\n'
+            '1,,,,2\n'
+            ',Doohickey,,cheap,1\n'
+        )
+        response = self.upload(body, 'text/csv')
+        self.assertEqual(response.status_code, 200)
+        report = response.get_json()
+        self.assertEqual((report['inserted'], report['updated'], report['rejected']), (3, 1, 2))
+        errors = sorted((e['line'], e['message']) for e in report['errors'])
+        self.assertEqual([line for line, _ in errors], [6, 7])
+        self.assertIn('units on hold', errors[0][1])
+
+        self.assertEqual(self.products(), [
+            (1, 'Widget v2', 'Small', 6.5, 10), (2, 'Gadget', 'Shiny, new', 20.0, 3),
+            (50, 'Gizmo', '', 1.25, 7), (51, 'Nameless', '', 3.0, 1),
+        ])
+        found = self.client.get('/products/search?q=shiny', headers=self.admin).get_json()
+        self.assertEqual([p['id'] for p in found], [2])
+
+    def test_ndjson_import_evicts_cached_products(self):
+        """Test NDJSON imports evict cached product views and report bad lines"""
+        self.assertEqual(self.client.get('/products/1', headers=self.admin).get_json()['price'], 5.0)
+        body = '\n'.join([
+            json.dumps({'id': 1, 'price': 7.0}),
+            'not json',
+            json.dumps({'name': 'Gadget', 'price': 2, 'stock': 1.5}),
+            json.dumps({'name': 'Gadget', 'price': 2}),
+        ])
+        report = self.upload(body, 'application/x-ndjson').get_json()
+        self.assertEqual((report['inserted'], report['updated'], report['rejected']), (1, 1, 2))
+        self.assertEqual(self.client.get('/products/1', headers=self.admin).get_json()['price'], 7.0)
+
+    def test_update_skipped_by_the_guard_is_rejected(self):
+        """Test a hold placed after the chunk was read makes its stock update a rejection"""
+        def reserve_first(conn, statement, *args):
+            if statement is UPDATE_PRODUCT:
+                conn.exec_driver_sql('UPDATE product SET reserved = 8 WHERE id = 1')
+
+        with self.app.app_context():
+            event.listen(db.engine, 'before_execute', reserve_first)
+            try:
+                report = self.upload('id,name,description,price,stock\n1,Widget v2,,,6\n', 'text/csv').get_json()
+            finally:
+                event.remove(db.engine, 'before_execute', reserve_first)
+        self.assertEqual((report['inserted'], report['updated'], report['rejected']), (0, 0, 1))
+        self.assertEqual(report['errors'], [{'line': 2, 'message': 'stock cannot drop below the 8 units on hold'}])
+        self.assertEqual(self.products(), [(1, 'Widget', 'Small', 5.0, 10)])
+
+    def test_export_round_trips_through_the_cli(self):
+        """Test the CLI export is accepted back by the CLI import unchanged"""
+        self.upload('id,name,description,price,stock\n,Gadget,"Two\nlines",20,3\n', 'text/csv', format='csv')
+        before = self.products()
+
+        runner = self.app.test_cli_runner()
+        for fmt in ('csv', 'ndjson'):
+            exported = self.client.get(f'/products/export?format={fmt}', headers=self.admin)
+            self.assertEqual(exported.status_code, 200)
+            self.assertEqual(exported.mimetype, 'text/csv' if fmt == 'csv' else 'application/x-ndjson')
+
+            result = runner.invoke(args=['catalog', 'export', '--format', fmt])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertEqual(result.stdout_bytes, exported.get_data())
+            result = runner.invoke(args=['catalog', 'import', '--format', fmt, '-'], input=exported.get_data())
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertIn('Inserted 0, updated 2, rejected 0 product(s).', result.output)
+            self.assertEqual(self.products(), before)
+
+    def test_requires_admin(self):
+        """Test bulk import and export are for admins only and check the format"""
+        self.assertEqual(self.client.get('/products/export', headers=self.user).status_code, 403)
+        response = self.client.post('/products/import', data='', content_type='text/csv', headers=self.user)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.upload('{}', 'application/json').status_code, 400)
+        self.assertEqual(self.client.get('/products/export?format=xml', headers=self.admin).status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import text
+from app import create_app, db
+from app.models.models import Product
+from app.utils.database import engine_options, replica_engine
+from config import Config, normalize_database_url
+
+class TestDatabaseConfig(unittest.TestCase):
+    def test_postgres_scheme_is_normalized(self):
+        """Test the legacy postgres:// scheme is rewritten for SQLAlchemy"""
+        self.assertEqual(normalize_database_url('postgres://u:p@db/shop'), 'postgresql://u:p@db/shop')
+        self.assertEqual(normalize_database_url('sqlite:///x.db'), 'sqlite:///x.db')
+        self.assertIsNone(normalize_database_url(None))
+
+    def test_pool_options_skip_sqlite(self):
+        """Test pool sizing only applies to server databases"""
+        config = {key: getattr(Config, key) for key in dir(Config) if key.startswith('DB_')}
+        self.assertNotIn('pool_size', engine_options('sqlite:///x.db', config))
+        options = engine_options('postgresql://u:p@db/shop', config)
+        self.assertEqual(options['pool_size'], Config.DB_POOL_SIZE)
+        self.assertTrue(options['pool_pre_ping'])
+
+class TestReadReplica(unittest.TestCase):
+    def setUp(self):
+        self.paths = []
+        for _ in range(2):
+            fd, path = tempfile.mkstemp(suffix='.db')
+            os.close(fd)
+            self.paths.append(path)
+        primary, replica = self.paths
+
+        class ReplicaConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{primary}'
+            DATABASE_REPLICA_URL = f'sqlite:///{replica}'
+            TESTING = True
+
+        self.app = create_app(config_class=ReplicaConfig)
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            db.metadata.create_all(replica_engine())
+            token = create_access_token(identity=1)
+        self.headers = {'Authorization': f'Bearer {token}'}
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            for engine in [*db.engines.values(), replica_engine()]:
+                engine.dispose()
+        for path in self.paths:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    def test_reads_use_replica_and_writes_use_primary(self):
+        """Test GET requests read from the replica while POSTs write to the primary"""
+        with self.app.app_context():
+            with replica_engine().begin() as conn:
+                conn.execute(text(
+                    "INSERT INTO product (id, name, price, stock) VALUES (1, 'Replica Only', 1.0, 1)"
+                ))
+
+        response = self.client.get('/products?stream=ndjson', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Replica Only', response.get_data())
+
+        response = self.client.post('/products', json={
+            'name': 'Primary Product', 'price': 2.0, 'stock': 1
+        }, headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        with self.app.app_context():
+            names = [p.name for p in db.session.query(Product)]
+        self.assertEqual(names, ['Primary Product'])
+
+    def test_cached_reads_use_primary(self):
+        """Test cached views and ETag checks never read a lagging replica"""
+        response = self.client.post('/products', json={'name': 'Fresh', 'price': 2.0, 'stock': 1},
+                                    headers=self.headers)
+        product_id = response.get_json()['id']
+        with self.app.app_context():
+            with replica_engine().begin() as conn:
+                conn.execute(text(
+                    "INSERT INTO product (id, name, price, stock, version_id) VALUES (:id, 'Stale', 1.0, 1, 1)"
+                ), {'id': product_id})
+
+        response = self.client.get(f'/products/{product_id}', headers=self.headers)
+        self.assertEqual(response.get_json()['name'], 'Fresh')
+        response = self.client.get(f'/products/{product_id}',
+                                   headers={**self.headers, 'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_sqlite_connections_use_wal(self):
+        """Test SQLite connections are opened in WAL mode"""
+        with self.app.app_context():
+            mode = db.session.execute(text('PRAGMA journal_mode')).scalar()
+        self.assertEqual(mode, 'wal')
+
+if __name__ == '__main__':
+    unittest.main()
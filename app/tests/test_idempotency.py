@@ -0,0 +1,166 @@
+import hashlib
+import json
+import threading
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+from app import create_app, db
+from app.models.models import IdempotencyRecord, Order, Product
+from app.services.inventory import load_products
+from app.tests.helpers import TestingConfig
+
+class TestIdempotency(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_class=TestingConfig)
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+            product = Product(name='Widget', price=5.0, stock=5)
+            db.session.add(product)
+            db.session.commit()
+            self.product_id = product.id
+            token = create_access_token(identity=1)
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.body = json.dumps({'items': [{'product_id': self.product_id, 'quantity': 1}]}).encode()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def order(self, key, body=None, query=''):
+        return self.client.post('/orders' + query, data=body or self.body, content_type='application/json',
+                                headers={**self.headers, 'Idempotency-Key': key})
+
+    def counts(self):
+        with self.app.app_context():
+            return Order.query.count(), db.session.get(Product, self.product_id).stock
+
+    def store_in_progress(self, key, **values):
+        with self.app.app_context():
+            record = IdempotencyRecord(
+                principal='user:1',
+                key=key,
+                request_hash=hashlib.sha256(b'POST /orders\n' + self.body).hexdigest(),
+                created_at=datetime.utcnow(),
+                expires_at=datetime.utcnow() + timedelta(hours=1),
+                **values
+            )
+            db.session.add(record)
+            db.session.commit()
+            return record.id
+
+    def test_order_and_record_commit_together(self):
+        """Test a failure after the view leaves no order behind for the retry to repeat"""
+        with patch('app.utils.idempotency.make_response', side_effect=RuntimeError('worker died')):
+            with self.assertRaises(RuntimeError):
+                self.order('abc')
+        self.assertEqual(self.counts(), (0, 5))
+
+        self.assertEqual(self.order('abc').status_code, 201)
+        self.assertEqual(self.order('abc').headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.counts(), (1, 4))
+
+    def test_retry_replays_first_response(self):
+        """Test a retried order returns the stored response without reordering"""
+        first = self.order('abc')
+        second = self.order('abc')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((second.status_code, second.get_json()), (201, first.get_json()))
+        self.assertEqual(second.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.counts(), (1, 4))
+
+        self.assertEqual(self.order('def').status_code, 201)
+        self.assertEqual(self.counts(), (2, 3))
+
+    def test_key_reuse_with_different_body(self):
+        """Test a key cannot be replayed for a different request"""
+        self.order('abc')
+        other = json.dumps({'items': [{'product_id': self.product_id, 'quantity': 2}]}).encode()
+        self.assertEqual(self.order('abc', other).status_code, 422)
+        self.assertEqual(self.counts(), (1, 4))
+
+    def test_key_reuse_with_different_query(self):
+        """Test a key cannot be replayed for the same body with other query parameters"""
+        self.order('abc')
+        self.assertEqual(self.order('abc', query='?dry_run=1').status_code, 422)
+        self.assertEqual(self.counts(), (1, 4))
+
+    def test_original_leaves_taken_over_record_alone(self):
+        """Test an original finishing after a takeover does not complete the new owner's record"""
+        def taken_over(*args):
+            # Another attempt discarded this one's record and inserted its own
+            with db.engine.begin() as conn:
+                conn.execute(update(IdempotencyRecord).values(token='other'))
+            return load_products(*args)
+        with patch('app.routes.order_routes.load_products', side_effect=taken_over):
+            self.assertEqual(self.order('abc').status_code, 201)
+
+        with self.app.app_context():
+            record = IdempotencyRecord.query.one()
+            self.assertEqual((record.token, record.status), ('other', 'in_progress'))
+            self.assertIsNone(record.response_body)
+
+    def test_failed_completion_discards_record(self):
+        """Test a failed final commit frees the key instead of leaving it in progress"""
+        def fail_completion(session):
+            if any(isinstance(obj, IdempotencyRecord) for obj in session.dirty):
+                raise RuntimeError('database went away')
+        event.listen(Session, 'before_commit', fail_completion)
+        try:
+            with self.assertRaises(RuntimeError):
+                self.order('abc')
+        finally:
+            event.remove(Session, 'before_commit', fail_completion)
+        self.assertEqual(self.counts(), (0, 5))
+
+        with self.app.app_context():
+            self.assertEqual(IdempotencyRecord.query.count(), 0)
+        self.assertEqual(self.order('abc').status_code, 201)
+
+    def test_duplicate_waits_for_in_flight_original(self):
+        """Test a duplicate arriving mid-request gets the original's response"""
+        record_id = self.store_in_progress('abc')
+
+        def finish():
+            with self.app.app_context():
+                record = db.session.get(IdempotencyRecord, record_id)
+                record.status = 'completed'
+                record.response_status = 201
+                record.response_headers = [['Content-Type', 'application/json']]
+                record.response_body = b'{"id":42}'
+                db.session.commit()
+        timer = threading.Timer(0.2, finish)
+        timer.start()
+        response = self.order('abc')
+        timer.join()
+
+        self.assertEqual((response.status_code, response.get_json()), (201, {'id': 42}))
+        self.assertEqual(self.counts(), (0, 5))
+
+    def test_duplicate_gives_up_waiting(self):
+        """Test a duplicate is told to retry if the original takes too long"""
+        self.app.config['IDEMPOTENCY_WAIT'] = 0.1
+        self.store_in_progress('abc')
+        response = self.order('abc')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.counts(), (0, 5))
+
+    def test_expired_record_runs_again(self):
+        """Test a key past its TTL is treated as new"""
+        self.store_in_progress('abc', status='completed', response_status=201,
+                               response_headers=[], response_body=b'{}')
+        with self.app.app_context():
+            IdempotencyRecord.query.update({IdempotencyRecord.expires_at: datetime.utcnow()})
+            db.session.commit()
+        self.assertEqual(self.order('abc').status_code, 201)
+        self.assertEqual(self.counts(), (1, 4))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+from datetime import datetime, timedelta
+from flask_jwt_extended import create_access_token
+from app import create_app, db
+from app.models.models import Job, Product
+from app.services.jobs import Worker, claim, enqueue, task
+from app.tests.helpers import TestingConfig
+
+calls = []
+
+@task('test.flaky', max_attempts=2)
+def flaky(payload):
+    calls.append(payload)
+    if payload.get('fail_times', 0) >= len(calls):
+        raise RuntimeError('downstream unavailable')
+
+@task('test.exclusive', concurrency=1)
+def exclusive(payload):
+    calls.append(payload)
+
+class JobsTestCase(unittest.TestCase):
+    config = TestingConfig
+
+    def setUp(self):
+        self.app = create_app(config_class=self.config)
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        calls.clear()
+
+        with self.app.app_context():
+            db.create_all()
+            product = Product(name='Widget', price=5.0, stock=1)
+            db.session.add(product)
+            db.session.commit()
+            self.product_id = product.id
+            token = create_access_token(identity=1)
+        self.headers = {'Authorization': f'Bearer {token}'}
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def jobs(self):
+        with self.app.app_context():
+            return [(job.name, job.status, job.attempts) for job in Job.query.order_by(Job.id)]
+
+    def order(self):
+        return self.client.post('/orders', json={'items': [
+            {'product_id': self.product_id, 'quantity': 1}
+        ]}, headers=self.headers)
+
+class TestJobs(JobsTestCase):
+    def test_order_commit_enqueues_job(self):
+        """Test a committed order queues its job and a rolled-back one does not"""
+        self.assertEqual(self.order().status_code, 201)
+        self.assertEqual(self.order().status_code, 400)
+        self.assertEqual(self.jobs(), [('order.created', 'pending', 0)])
+
+        self.assertEqual(Worker(self.app).run_once(), 1)
+        self.assertEqual(self.jobs(), [('order.created', 'done', 1)])
+
+    def test_failed_jobs_are_retried_then_given_up(self):
+        """Test failures back off and retry until max_attempts runs out"""
+        with self.app.app_context():
+            enqueue('test.flaky', {'fail_times': 1})
+            enqueue('test.flaky', {'fail_times': 5})
+            db.session.commit()
+        worker = Worker(self.app)
+        self.assertEqual(worker.run_once(), 2)
+        self.assertEqual(self.jobs(), [('test.flaky', 'pending', 1), ('test.flaky', 'pending', 1)])
+
+        # Nothing is due until the backoff has passed
+        self.assertEqual(worker.run_once(), 0)
+        with self.app.app_context():
+            Job.query.update({Job.run_at: datetime.utcnow() - timedelta(seconds=1)})
+            db.session.commit()
+        self.assertEqual(worker.run_once(), 2)
+        self.assertEqual(self.jobs(), [('test.flaky', 'done', 2), ('test.flaky', 'failed', 2)])
+
+    def test_idempotency_key_dedupes(self):
+        """Test a job key is only ever queued once"""
+        with self.app.app_context():
+            self.assertIsNotNone(enqueue('test.flaky', key='k'))
+            self.assertIsNone(enqueue('test.flaky', key='k'))
+            db.session.commit()
+            self.assertIsNone(enqueue('test.flaky', key='k'))
+            db.session.commit()
+        self.assertEqual(len(self.jobs()), 1)
+
+    def test_concurrency_limit(self):
+        """Test a task's concurrency limit holds across workers"""
+        with self.app.app_context():
+            first, second = enqueue('test.exclusive'), enqueue('test.exclusive')
+            db.session.commit()
+            self.assertTrue(claim(first.id, 'worker-a'))
+            db.session.commit()
+            self.assertFalse(claim(second.id, 'worker-b'))
+            db.session.rollback()
+
+class MemoryBrokerConfig(TestingConfig):
+    JOBS_BROKER = 'memory'
+    JOBS_WORKER_THREADS = 1
+
+class TestMemoryBroker(JobsTestCase):
+    config = MemoryBrokerConfig
+
+    def test_order_commit_enqueues_job(self):
+        """Test committed jobs run in-process without a worker"""
+        self.assertEqual(self.order().status_code, 201)
+        self.app.extensions['jobs'].join()
+        self.assertEqual(self.jobs(), [('order.created', 'done', 1)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+from flask_jwt_extended import create_access_token
+from app import create_app, db
+from app.models.models import Product
+from app.tests.helpers import TestingConfig
+
+class ProfilingConfig(TestingConfig):
+    METRICS_PROFILING = True
+    METRICS_PROFILE_DIR = tempfile.mkdtemp()
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_class=ProfilingConfig)
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        self.metrics = self.app.extensions['metrics']
+
+        with self.app.app_context():
+            db.create_all()
+            product = Product(name='Widget', price=5.0, stock=5)
+            db.session.add(product)
+            db.session.commit()
+            self.product_id = product.id
+            token = create_access_token(identity=1)
+        self.headers = {'Authorization': f'Bearer {token}'}
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def get_product(self, **headers):
+        return self.client.get(f'/products/{self.product_id}', headers={**self.headers, **headers})
+
+    def test_request_metrics(self):
+        """Test latency, SQL, cache and rate limiter figures are recorded"""
+        endpoint = 'product.get_product'
+        requests = self.metrics.requests.value(endpoint, 'GET', 200)
+        timed = self.metrics.latency.count(endpoint, 'GET')
+        queries = self.metrics.sql_queries.value(endpoint)
+        hits = self.metrics.cache_requests.value('hit')
+        checks = self.metrics.ratelimit_seconds.count()
+
+        self.get_product()
+        self.get_product()
+
+        self.assertEqual(self.metrics.requests.value(endpoint, 'GET', 200), requests + 2)
+        self.assertEqual(self.metrics.latency.count(endpoint, 'GET'), timed + 2)
+        self.assertGreater(self.metrics.sql_queries.value(endpoint), queries)
+        self.assertEqual(self.metrics.cache_requests.value('hit'), hits + 1)
+        self.assertGreaterEqual(self.metrics.ratelimit_seconds.count(), checks + 2)
+
+    def test_prometheus_endpoint(self):
+        """Test /metrics serves the text exposition format"""
+        self.get_product()
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        body = response.get_data(as_text=True)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_request_duration_seconds_bucket{endpoint="product.get_product",method="GET",le="+Inf"}', body)
+        self.assertIn('sql_queries_total{endpoint="product.get_product"}', body)
+        self.assertIn('cache_requests_total{result="miss"}', body)
+
+    def test_profile_header(self):
+        """Test a request asking for a profile gets a folded stack file"""
+        self.assertNotIn('X-Profile-File', self.get_product().headers)
+        response = self.get_product(**{'X-Profile': '1'})
+        name = response.headers['X-Profile-File']
+        with open(os.path.join(ProfilingConfig.METRICS_PROFILE_DIR, name)) as f:
+            lines = f.read().splitlines()
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(int(count) > 0 and stack)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+from flask_jwt_extended import create_access_token
+from limits import parse
+from limits.strategies import FixedWindowRateLimiter, SlidingWindowCounterRateLimiter
+from limits.storage import storage_from_string
+from app import create_app
+from app.utils.ratelimit import SQLiteStorage, rate_limit_key
+from app.tests.helpers import TestingConfig
+
+class TestSQLiteStorage(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.storage = storage_from_string(f'sqlite:///{self.path}')
+
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_registered_for_sqlite_scheme(self):
+        """Test sqlite:// URIs resolve to the shared SQLite storage"""
+        self.assertIsInstance(self.storage, SQLiteStorage)
+        self.assertTrue(self.storage.check())
+
+    def test_fixed_window_is_shared_between_instances(self):
+        """Test two workers' storages enforce one shared counter"""
+        limit = parse('3 per minute')
+        first = FixedWindowRateLimiter(self.storage)
+        second = FixedWindowRateLimiter(storage_from_string(f'sqlite:///{self.path}'))
+
+        self.assertTrue(first.hit(limit, 'user:1'))
+        self.assertTrue(second.hit(limit, 'user:1'))
+        self.assertTrue(first.hit(limit, 'user:1'))
+        self.assertFalse(second.hit(limit, 'user:1'))
+        self.assertTrue(second.hit(limit, 'user:2'))
+
+    def test_sliding_window_counter(self):
+        """Test the sliding window counter strategy refuses hits over the limit"""
+        limit = parse('2 per minute')
+        limiter = SlidingWindowCounterRateLimiter(self.storage)
+
+        self.assertTrue(limiter.hit(limit, 'user:1'))
+        self.assertTrue(limiter.hit(limit, 'user:1'))
+        self.assertFalse(limiter.hit(limit, 'user:1'))
+        self.assertEqual(limiter.get_window_stats(limit, 'user:1').remaining, 0)
+
+class TestRateLimitKey(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_class=TestingConfig)
+        self.app.config['TESTING'] = True
+
+    def test_key_uses_jwt_identity(self):
+        """Test authenticated requests are limited per identity"""
+        with self.app.app_context():
+            token = create_access_token(identity=7)
+        with self.app.test_request_context(headers={'Authorization': f'Bearer {token}'}):
+            self.assertEqual(rate_limit_key(), 'user:7')
+
+    def test_key_falls_back_to_address(self):
+        """Test anonymous or invalid-token requests are limited per address"""
+        with self.app.test_request_context(environ_base={'REMOTE_ADDR': '10.0.0.1'}):
+            self.assertEqual(rate_limit_key(), 'ip:10.0.0.1')
+        with self.app.test_request_context(
+            headers={'Authorization': 'Bearer not-a-token'},
+            environ_base={'REMOTE_ADDR': '10.0.0.1'}
+        ):
+            self.assertEqual(rate_limit_key(), 'ip:10.0.0.1')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from flask_jwt_extended import create_access_token
+from app import create_app, db
+from app.models.models import Order, Product, Reservation
+from app.tests.helpers import TestingConfig
+
+class TestReservations(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_class=TestingConfig)
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+            product = Product(name='Widget', price=5.0, stock=5)
+            db.session.add(product)
+            db.session.commit()
+            self.product_id = product.id
+            token = create_access_token(identity=1)
+            other_token = create_access_token(identity=2)
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.other_headers = {'Authorization': f'Bearer {other_token}'}
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def reserve(self, quantity, headers=None):
+        return self.client.post('/reservations', json={'items': [
+            {'product_id': self.product_id, 'quantity': quantity}
+        ]}, headers=headers or self.headers)
+
+    def product(self):
+        with self.app.app_context():
+            product = db.session.get(Product, self.product_id)
+            return product.stock, product.reserved
+
+    def expire(self, reservation_id):
+        with self.app.app_context():
+            db.session.get(Reservation, reservation_id).expires_at = datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+
+    def test_hold_reduces_available_stock(self):
+        """Test held units are unavailable to other checkouts and orders"""
+        response = self.reserve(4)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.product(), (5, 4))
+
+        self.assertEqual(self.reserve(2, self.other_headers).status_code, 400)
+        response = self.client.post('/orders', json={'items': [
+            {'product_id': self.product_id, 'quantity': 2}
+        ]}, headers=self.other_headers)
+        self.assertEqual(response.status_code, 400)
+
+        product = self.client.get(f'/products/{self.product_id}', headers=self.headers).get_json()
+        self.assertEqual((product['stock'], product['available']), (5, 1))
+
+    def test_confirm_creates_order_at_held_price(self):
+        """Test confirming turns the hold into an order exactly once"""
+        reservation_id = self.reserve(2).get_json()['id']
+        self.client.put(f'/products/{self.product_id}', json={'price': 9.0}, headers=self.headers)
+
+        self.assertEqual(
+            self.client.post(f'/reservations/{reservation_id}/confirm', headers=self.other_headers).status_code,
+            403
+        )
+        response = self.client.post(f'/reservations/{reservation_id}/confirm', headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        order_id = response.get_json()['id']
+        self.assertEqual(self.client.post(f'/reservations/{reservation_id}/confirm', headers=self.headers).status_code, 409)
+
+        self.assertEqual(self.product(), (3, 0))
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Order, order_id).total_amount, 10.0)
+        body = self.client.get(f'/reservations/{reservation_id}', headers=self.headers).get_json()
+        self.assertEqual((body['status'], body['order_id']), ('confirmed', order_id))
+
+    def test_release_returns_stock(self):
+        """Test releasing a hold makes its units available again"""
+        reservation_id = self.reserve(3).get_json()['id']
+        self.assertEqual(self.client.delete(f'/reservations/{reservation_id}', headers=self.headers).status_code, 200)
+        self.assertEqual(self.product(), (5, 0))
+        self.assertEqual(self.client.delete(f'/reservations/{reservation_id}', headers=self.headers).status_code, 409)
+
+    def test_expired_holds_are_swept(self):
+        """Test expired holds cannot be confirmed and the sweeper frees them"""
+        reservation_id = self.reserve(3).get_json()['id']
+        self.expire(reservation_id)
+
+        response = self.client.post(f'/reservations/{reservation_id}/confirm', headers=self.headers)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()['message'], 'Reservation is expired')
+
+        result = self.app.test_cli_runner().invoke(args=['reservations', 'sweep'])
+        self.assertIn('Expired 1 reservation(s).', result.output)
+        self.assertEqual(self.product(), (5, 0))
+
+    def test_short_hold_sweeps_expired_first(self):
+        """Test a hold that only fits once expired holds are freed succeeds"""
+        self.expire(self.reserve(4).get_json()['id'])
+        self.assertEqual(self.reserve(3, self.other_headers).status_code, 201)
+        self.assertEqual(self.product(), (5, 3))
+
+    def test_stock_freed_during_failed_hold_asks_for_retry(self):
+        """Test a hold that fails while stock is freed again answers 409, not 500"""
+        with patch('app.routes.reservation_routes.reserve_stock', return_value=False):
+            response = self.reserve(2)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.product(), (5, 0))
+
+if __name__ == '__main__':
+    unittest.main()
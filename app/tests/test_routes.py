@@ -1,12 +1,17 @@
+import json
 import unittest
 from unittest.mock import patch
-from app import create_app, db
+from app import create_app, db, passwords
+from datetime import datetime, timedelta
 from app.models.models import Customer, CustomerAccount, Product, Order
 from flask_jwt_extended import create_access_token
+from sqlalchemy import update
+from app.tests.helpers import TestingConfig, count_queries
+from app.utils.database import insert_ids
 
 class TestRoutes(unittest.TestCase):
     def setUp(self):
-        self.app = create_app()
+        self.app = create_app(config_class=TestingConfig)
         self.app.config['TESTING'] = True
         self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
         self.client = self.app.test_client()
@@ -109,5 +114,451 @@ class TestRoutes(unittest.TestCase):
         self.assertEqual(response.status_code, 201)
         self.assertIn('Order created successfully', response.get_json()['message'])
 
+    def test_list_products_keyset_pagination(self):
+        """Test list products returns keyset pages with a next cursor"""
+        with self.app.app_context():
+            db.session.add_all([Product(name=f'P{i}', price=1.0, stock=1) for i in range(5)])
+            db.session.commit()
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        
+        response = self.client.get('/products?limit=2', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['name'] for p in response.get_json()], ['P0', 'P1'])
+        after = response.headers['X-Next-After']
+        self.assertIn('rel="next"', response.headers['Link'])
+        
+        response = self.client.get(f'/products?limit=2&after={after}', headers=headers)
+        self.assertEqual([p['name'] for p in response.get_json()], ['P2', 'P3'])
+        
+        response = self.client.get(f'/products?limit=10&after={after}', headers=headers)
+        self.assertEqual(len(response.get_json()), 3)
+        self.assertNotIn('X-Next-After', response.headers)
+    
+    def test_list_products_stream_ndjson(self):
+        """Test streaming every product as NDJSON"""
+        with self.app.app_context():
+            db.session.add_all([Product(name=f'P{i}', price=1.0, stock=1) for i in range(3)])
+            db.session.commit()
+        
+        response = self.client.get(
+            '/products?stream=ndjson',
+            headers={'Authorization': f'Bearer {self.admin_token}'}
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line)['name'] for line in lines], ['P0', 'P1', 'P2'])
+
+    def test_create_order_decrements_stock_once_per_product(self):
+        """Test duplicate line items are merged and stock is decremented atomically"""
+        with self.app.app_context():
+            product = Product(name='Widget', price=5.0, stock=5)
+            db.session.add(product)
+            db.session.commit()
+            product_id = product.id
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        
+        response = self.client.post('/orders', json={'items': [
+            {'product_id': product_id, 'quantity': 2},
+            {'product_id': product_id, 'quantity': 2}
+        ]}, headers=headers)
+        self.assertEqual(response.status_code, 201)
+        
+        response = self.client.post('/orders', json={'items': [
+            {'product_id': product_id, 'quantity': 2}
+        ]}, headers=headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Insufficient stock', response.get_json()['message'])
+        
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Product, product_id).stock, 1)
+            self.assertEqual(Order.query.count(), 1)
+    
+    def test_create_order_unknown_product(self):
+        """Test ordering a missing product returns 404"""
+        response = self.client.post(
+            '/orders',
+            json={'items': [{'product_id': 999, 'quantity': 1}]},
+            headers={'Authorization': f'Bearer {self.admin_token}'}
+        )
+        
+        self.assertEqual(response.status_code, 404)
+
+    def test_concurrent_checkouts_do_not_conflict(self):
+        """Test checkouts racing for one product only retry when stock runs short"""
+        from app.services import inventory
+        with self.app.app_context():
+            product = Product(name='Widget', price=5.0, stock=5)
+            db.session.add(product)
+            db.session.commit()
+            product_id = product.id
+        self.app.config['ORDER_RETRY_BACKOFF'] = 0
+        reads = []
+        
+        def racing_read(product_ids):
+            products = inventory.load_products(product_ids)
+            reads.append(products)
+            if len(reads) <= 2:
+                # Another checkout commits between our read and our write
+                with db.engine.begin() as conn:
+                    conn.execute(update(Product).where(Product.id == product_id).values(stock=Product.stock - len(reads)))
+            return products
+        
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        with patch('app.routes.order_routes.load_products', side_effect=racing_read):
+            response = self.client.post('/orders', json={'items': [
+                {'product_id': product_id, 'quantity': 2}
+            ]}, headers=headers)
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(reads), 1)
+            
+            # 4 - 2 = 2 left, then the racing checkout takes both; the retry
+            # sees the shortage
+            response = self.client.post('/orders', json={'items': [
+                {'product_id': product_id, 'quantity': 1}
+            ]}, headers=headers)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(len(reads), 3)
+        
+        with self.app.app_context():
+            product = db.session.get(Product, product_id)
+            self.assertEqual(product.stock, 0)
+            # Stock movements are not edits of the product
+            self.assertEqual(product.version_id, 1)
+    
+    def test_checkout_charges_price_edited_during_it(self):
+        """Test a price edit landing between the read and the write re-prices the order"""
+        from app.services import inventory
+        with self.app.app_context():
+            product = Product(name='Widget', price=5.0, stock=5)
+            db.session.add(product)
+            db.session.commit()
+            product_id = product.id
+        self.app.config['ORDER_RETRY_BACKOFF'] = 0
+        reads = []
+        
+        def racing_read(product_ids):
+            products = inventory.load_products(product_ids)
+            reads.append(products)
+            if len(reads) == 1:
+                with db.engine.begin() as conn:
+                    conn.execute(update(Product).where(Product.id == product_id).values(price=7.0))
+            return products
+        
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        with patch('app.routes.order_routes.load_products', side_effect=racing_read):
+            response = self.client.post('/orders', json={'items': [
+                {'product_id': product_id, 'quantity': 2}
+            ]}, headers=headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(reads), 2)
+        with self.app.app_context():
+            order = db.session.get(Order, response.get_json()['id'])
+            self.assertEqual((order.total_amount, order.items[0].price), (14.0, 7.0))
+            self.assertEqual(db.session.get(Product, product_id).stock, 3)
+    
+    def test_update_product_preconditions(self):
+        """Test If-Match guards updates and concurrent writes are refused"""
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        with self.app.app_context():
+            product = Product(name='Widget', price=1.0, stock=5)
+            db.session.add(product)
+            db.session.commit()
+            product_id = product.id
+        url = f'/products/{product_id}'
+        etag = self.client.get(url, headers=headers).headers['ETag']
+        
+        response = self.client.put(url, json={'price': 2.0}, headers={**headers, 'If-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.put(url, json={'price': 3.0}, headers={**headers, 'If-Match': etag})
+        self.assertEqual(response.status_code, 412)
+        response = self.client.delete(url, headers={**headers, 'If-Match': etag})
+        self.assertEqual(response.status_code, 412)
+        
+        def concurrent_write(etag):
+            db.session.execute(
+                update(Product).where(Product.id == product_id)
+                .values(version_id=Product.version_id + 1)
+                .execution_options(synchronize_session=False)
+            )
+            return False
+        
+        with patch('app.routes.product_routes.precondition_failed', side_effect=concurrent_write):
+            response = self.client.put(url, json={'price': 4.0}, headers=headers)
+        self.assertEqual(response.status_code, 409)
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Product, product_id).price, 2.0)
+    
+    def test_update_product_keeps_concurrent_stock_moves(self):
+        """Test a stock edit read before a checkout and hold lands never overwrites them"""
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        with self.app.app_context():
+            product = Product(name='Widget', price=1.0, stock=10)
+            db.session.add(product)
+            db.session.commit()
+            product_id = product.id
+        url = f'/products/{product_id}'
+        etag = self.client.get(url, headers=headers).headers['ETag']
+        
+        def checkout_and_hold(version):
+            # Committed by another request after this one read the product
+            with db.engine.begin() as conn:
+                conn.execute(update(Product).where(Product.id == product_id).values(stock=6, reserved=5))
+            return False
+        
+        for extra in ({'If-Match': etag}, {}):
+            with patch('app.routes.product_routes.precondition_failed', side_effect=checkout_and_hold):
+                response = self.client.put(url, json={'stock': 3}, headers={**headers, **extra})
+            self.assertEqual(response.status_code, 400)
+            with self.app.app_context():
+                product = db.session.get(Product, product_id)
+                self.assertEqual((product.stock, product.reserved), (6, 5))
+        
+        response = self.client.put(url, json={'stock': 7}, headers={**headers, 'If-Match': etag})
+        self.assertEqual(response.status_code, 412)
+        response = self.client.put(url, json={'name': 'Gadget'}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        with self.app.app_context():
+            product = db.session.get(Product, product_id)
+            self.assertEqual((product.name, product.stock, product.reserved), ('Gadget', 6, 5))
+
+    def test_create_orders_batch(self):
+        """Test batch order ingestion validates stock across the whole batch"""
+        with self.app.app_context():
+            product = Product(name='Widget', price=2.5, stock=3)
+            db.session.add(product)
+            db.session.commit()
+            product_id = product.id
+        
+        response = self.client.post('/orders/batch', json={'orders': [
+            {'items': [{'product_id': product_id, 'quantity': 2}]},
+            {'items': [{'product_id': product_id, 'quantity': 2}]},
+            {'items': [{'product_id': 999, 'quantity': 1}]},
+            {'items': [{'product_id': product_id, 'quantity': 1}]}
+        ]}, headers={'Authorization': f'Bearer {self.admin_token}'})
+        
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual((body['created'], body['rejected']), (2, 2))
+        self.assertEqual([r['status'] for r in body['results']], ['created', 'rejected', 'rejected', 'created'])
+        self.assertIn('Insufficient stock', body['results'][1]['message'])
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Product, product_id).stock, 0)
+            order = db.session.get(Order, body['results'][0]['id'])
+            self.assertEqual(order.total_amount, 5.0)
+            self.assertEqual(len(order.items), 1)
+        
+        # Admins may order for others, but only for customers that exist
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        for customer_id in (999, '1', True):
+            response = self.client.post('/orders/batch', json={'orders': [
+                {'customer_id': customer_id, 'items': [{'product_id': product_id, 'quantity': 1}]}
+            ]}, headers=headers)
+            self.assertEqual(response.status_code, 400)
+    
+    def test_insert_ids_without_executemany_returning(self):
+        """Test bulk inserts fall back to one INSERT per row without RETURNING support"""
+        with self.app.app_context():
+            rows = [{'customer_id': 1, 'total_amount': amount} for amount in (1.0, 2.0)]
+            with patch.object(db.engine.dialect, 'insert_executemany_returning', False):
+                ids = insert_ids(db.session, Order.__table__, rows)
+            db.session.commit()
+            self.assertEqual([db.session.get(Order, i).total_amount for i in ids], [1.0, 2.0])
+
+    def test_product_cache_evicted_on_update(self):
+        """Test cached product and list pages are evicted when the product changes"""
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        product_id = self.client.post(
+            '/products',
+            json={'name': 'Widget', 'price': 1.0, 'stock': 5},
+            headers=headers
+        ).get_json()['id']
+        
+        self.assertEqual(self.client.get(f'/products/{product_id}', headers=headers).get_json()['price'], 1.0)
+        self.assertEqual(self.client.get('/products', headers=headers).get_json()[0]['price'], 1.0)
+        
+        self.client.put(f'/products/{product_id}', json={'price': 2.0}, headers=headers)
+        self.assertEqual(self.client.get(f'/products/{product_id}', headers=headers).get_json()['price'], 2.0)
+        self.assertEqual(self.client.get('/products', headers=headers).get_json()[0]['price'], 2.0)
+        
+        # Stock taken by a Core UPDATE during checkout evicts too
+        self.client.post('/orders', json={'items': [{'product_id': product_id, 'quantity': 2}]}, headers=headers)
+        self.assertEqual(self.client.get(f'/products/{product_id}', headers=headers).get_json()['stock'], 3)
+        self.assertEqual(self.client.get('/products', headers=headers).get_json()[0]['stock'], 3)
+    
+    def test_customer_cache_evicted_on_update(self):
+        """Test cached customer details are evicted when the customer changes"""
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        
+        self.assertEqual(self.client.get('/customers/1', headers=headers).get_json()['name'], 'Admin')
+        self.client.put('/customers/1', json={'name': 'Root'}, headers=headers)
+        self.assertEqual(self.client.get('/customers/1', headers=headers).get_json()['name'], 'Root')
+
+    def test_get_order_cache_is_per_principal(self):
+        """Test a cached order is never served to another customer"""
+        with self.app.app_context():
+            product = Product(name='Widget', price=1.0, stock=5)
+            db.session.add(product)
+            db.session.commit()
+            product_id = product.id
+            other_token = create_access_token(identity=2, additional_claims={'is_admin': False})
+        owner = {'Authorization': f'Bearer {self.admin_token}'}
+        other = {'Authorization': f'Bearer {other_token}'}
+        order_id = self.client.post(
+            '/orders',
+            json={'items': [{'product_id': product_id, 'quantity': 1}]},
+            headers=owner
+        ).get_json()['id']
+        
+        self.assertEqual(self.client.get(f'/orders/{order_id}', headers=other).status_code, 403)
+        response = self.client.get(f'/orders/{order_id}', headers=owner)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Authorization', response.headers['Vary'])
+        self.assertIn('private', response.headers['Cache-Control'])
+        self.assertEqual(self.client.get(f'/orders/{order_id}', headers=other).status_code, 403)
+        self.assertEqual(self.client.get(f'/orders/{order_id}', headers=owner).get_json()['id'], order_id)
+
+    def test_get_order_query_count_is_constant(self):
+        """Test order detail costs the same number of queries for 1 or 20 lines"""
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        with self.app.app_context():
+            products = [Product(name=f'P{i}', price=1.0, stock=10) for i in range(20)]
+            db.session.add_all(products)
+            db.session.commit()
+            product_ids = [p.id for p in products]
+        small = self.client.post('/orders', json={'items': [
+            {'product_id': product_ids[0], 'quantity': 1}
+        ]}, headers=headers).get_json()['id']
+        large = self.client.post('/orders', json={'items': [
+            {'product_id': product_id, 'quantity': 1} for product_id in product_ids
+        ]}, headers=headers).get_json()['id']
+        
+        with self.app.app_context():
+            with count_queries() as small_queries:
+                response = self.client.get(f'/orders/{small}', headers=headers)
+            self.assertEqual(len(response.get_json()['items']), 1)
+            with count_queries() as large_queries:
+                response = self.client.get(f'/orders/{large}', headers=headers)
+            self.assertEqual(len(response.get_json()['items']), 20)
+        
+        self.assertEqual(len(small_queries), len(large_queries))
+        self.assertLessEqual(len(large_queries), 2)
+
+    def test_customer_order_history(self):
+        """Test order history pages newest first, filters and summarizes"""
+        start = datetime(2024, 1, 1)
+        with self.app.app_context():
+            db.session.add_all([Order(
+                customer_id=1,
+                order_date=start + timedelta(days=i),
+                total_amount=10.0 * (i + 1),
+                status='shipped' if i % 2 else 'pending'
+            ) for i in range(5)])
+            db.session.add(Order(customer_id=2, order_date=start, total_amount=99.0))
+            db.session.commit()
+            other_token = create_access_token(identity=2, additional_claims={'is_admin': False})
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        
+        response = self.client.get('/me/orders?limit=3', headers=headers)
+        self.assertEqual([o['total_amount'] for o in response.get_json()], [50.0, 40.0, 30.0])
+        after = response.headers['X-Next-After']
+        response = self.client.get(f'/me/orders?limit=3&after={after}', headers=headers)
+        self.assertEqual([o['total_amount'] for o in response.get_json()], [20.0, 10.0])
+        self.assertNotIn('X-Next-After', response.headers)
+        
+        response = self.client.get('/customers/1/orders?status=shipped&since=2024-01-03', headers=headers)
+        self.assertEqual([o['total_amount'] for o in response.get_json()], [40.0])
+        
+        summary = self.client.get('/customers/1/orders?summary=1', headers=headers).get_json()
+        self.assertEqual((summary['order_count'], summary['total_amount']), (5, 150.0))
+        self.assertEqual(summary['by_status']['shipped'], {'order_count': 2, 'total_amount': 60.0})
+        self.assertEqual(summary['last_order_date'], '2024-01-05T00:00:00')
+        
+        response = self.client.get('/customers/1/orders', headers={'Authorization': f'Bearer {other_token}'})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get('/me/orders?after=bogus', headers=headers).status_code, 400)
+
+    def test_login_rehashes_on_cost_change(self):
+        """Test login verifies on the hashing pool and upgrades outdated hashes"""
+        self.app.config['PASSWORD_HASH_WORKERS'] = 1
+        with self.app.app_context():
+            self.app.config['BCRYPT_LOG_ROUNDS'] = 4
+            account = CustomerAccount.query.filter_by(username='admin').first()
+            account.password = passwords.hash('secret')
+            db.session.commit()
+        self.app.config['BCRYPT_LOG_ROUNDS'] = 5
+        
+        response = self.client.post('/login', json={'username': 'admin', 'password': 'secret'})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access_token', response.get_json())
+        with self.app.app_context():
+            stored = CustomerAccount.query.filter_by(username='admin').first().password
+            self.assertTrue(stored.startswith('$2b$05$'))
+    
+    def test_login_rejects_bad_credentials(self):
+        """Test wrong passwords and unknown usernames both get 401"""
+        self.app.config['PASSWORD_HASH_WORKERS'] = 0
+        self.app.config['BCRYPT_LOG_ROUNDS'] = 4
+        
+        for username, password in (('admin', 'wrong'), ('nobody', 'secret')):
+            response = self.client.post('/login', json={'username': username, 'password': password})
+            self.assertEqual(response.status_code, 401)
+
+    def test_list_products_filters_and_sort(self):
+        """Test price/stock/date filters and keyset pages over a sort column"""
+        with self.app.app_context():
+            db.session.add_all([
+                Product(name='A', price=30.0, stock=0, created_at=datetime(2024, 1, 1)),
+                Product(name='B', price=10.0, stock=5, created_at=datetime(2024, 2, 1)),
+                Product(name='C', price=20.0, stock=5, created_at=datetime(2024, 3, 1)),
+                Product(name='D', price=20.0, stock=1, created_at=datetime(2024, 4, 1))
+            ])
+            db.session.commit()
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        
+        def names(query):
+            response = self.client.get(f'/products?{query}', headers=headers)
+            self.assertEqual(response.status_code, 200)
+            return [p['name'] for p in response.get_json()], response.headers.get('X-Next-After')
+        
+        self.assertEqual(names('min_price=15&in_stock=true')[0], ['C', 'D'])
+        self.assertEqual(names('created_since=2024-02-15&max_price=25')[0], ['C', 'D'])
+        
+        page, after = names('sort=-price&limit=2')
+        self.assertEqual(page, ['A', 'D'])
+        self.assertEqual(names(f'sort=-price&limit=2&after={after}'), (['C', 'B'], None))
+        self.assertEqual(names('sort=price')[0], ['B', 'C', 'D', 'A'])
+        
+        # The cursor carries the sort value, so the next page survives the
+        # last product changing
+        page, after = names('sort=created_at&limit=2')
+        self.assertEqual(page, ['A', 'B'])
+        with self.app.app_context():
+            db.session.query(Product).filter(Product.name == 'B').delete()
+            db.session.commit()
+        self.assertEqual(names(f'sort=created_at&limit=2&after={after}'), (['C', 'D'], None))
+        for query in ('after=abc', 'sort=price&after=2', 'sort=price&after=bogus', 'sort=created_at&after=WzEsIDJd'):
+            self.assertEqual(self.client.get(f'/products?{query}', headers=headers).status_code, 400)
+        
+        self.assertEqual(self.client.get('/products?sort=name', headers=headers).status_code, 400)
+        self.assertEqual(self.client.get('/products?min_price=cheap', headers=headers).status_code, 400)
+    
+    def test_list_products_equivalent_filters_share_cache(self):
+        """Test equivalent filter spellings are served from one cache entry"""
+        with self.app.app_context():
+            db.session.add(Product(name='A', price=10.0, stock=1))
+            db.session.commit()
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        
+        self.client.get('/products?min_price=5&in_stock=1&sort=id', headers=headers)
+        with self.app.app_context():
+            with count_queries() as queries:
+                response = self.client.get('/products?in_stock=true&min_price=5.0', headers=headers)
+        
+        self.assertEqual(response.get_json()[0]['name'], 'A')
+        self.assertEqual(queries, [])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+from app import create_app, db
+from app.models.models import Product
+from app.services.search import product_search
+from app.tests.helpers import TestingConfig
+from flask_jwt_extended import create_access_token
+
+class TestProductSearch(unittest.TestCase):
+    backend = 'auto'
+
+    def setUp(self):
+        self.app = create_app(config_class=TestingConfig)
+        self.app.config['TESTING'] = True
+        self.app.config['SEARCH_BACKEND'] = self.backend
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+            db.session.add_all([
+                Product(name='Blue Widget', description='A small widget', price=1.0, stock=1),
+                Product(name='Red Gadget', description='Pairs well with any widget', price=2.0, stock=1),
+                Product(name='Green Gizmo', description='Nothing to see here', price=3.0, stock=1)
+            ])
+            db.session.commit()
+            token = create_access_token(identity=1)
+        self.headers = {'Authorization': f'Bearer {token}'}
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def search(self, q):
+        response = self.client.get(f'/products/search?q={q}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return [p['name'] for p in response.get_json()]
+
+    def test_ranks_name_matches_first(self):
+        """Test name matches outrank description matches"""
+        self.assertEqual(self.search('widget'), ['Blue Widget', 'Red Gadget'])
+
+    def test_prefix_and_all_terms(self):
+        """Test every term must match, each as a prefix"""
+        self.assertEqual(self.search('gad pair'), ['Red Gadget'])
+        self.assertEqual(self.search('giz'), ['Green Gizmo'])
+        self.assertEqual(self.search('gizmo widget'), [])
+
+    def test_index_follows_commits(self):
+        """Test inserts, renames and deletes are reflected incrementally"""
+        self.assertEqual(self.search('gizmo'), ['Green Gizmo'])
+        with self.app.app_context():
+            gizmo = Product.query.filter_by(name='Green Gizmo').first()
+            gizmo.name = 'Green Doohickey'
+            db.session.add(Product(name='Yellow Gizmo', price=4.0, stock=1))
+            db.session.delete(Product.query.filter_by(name='Blue Widget').first())
+            db.session.commit()
+
+        self.assertEqual(self.search('gizmo'), ['Yellow Gizmo'])
+        self.assertEqual(self.search('doohickey'), ['Green Doohickey'])
+        self.assertEqual(self.search('widget'), ['Red Gadget'])
+
+    def test_requires_query(self):
+        """Test a missing query is rejected"""
+        response = self.client.get('/products/search?q=', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_backend_selection(self):
+        """Test the configured backend is the one in use"""
+        with self.app.app_context():
+            self.assertEqual(product_search.backend(), 'memory' if self.backend == 'memory' else 'fts5')
+
+class TestInMemoryProductSearch(TestProductSearch):
+    backend = 'memory'
+
+if __name__ == '__main__':
+    unittest.main()
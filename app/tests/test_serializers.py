@@ -0,0 +1,149 @@
+import unittest
+from datetime import datetime
+from decimal import Decimal
+from flask.json.provider import DefaultJSONProvider
+from flask_jwt_extended import create_access_token
+from sqlalchemy import update
+from app import create_app, db
+from app.models.models import Order, OrderItem, Product
+from app.tests.helpers import TestingConfig, count_queries
+from app.utils.serializers import ORDER_SUMMARY_FIELDS, OrjsonProvider, orjson
+
+class TestFieldPlan(unittest.TestCase):
+    def test_dump_renders_datetimes(self):
+        """Test rows map onto column keys with ISO 8601 datetimes"""
+        row = (7, datetime(2024, 1, 2, 3, 4, 5), 9.5, 'pending')
+        self.assertEqual(ORDER_SUMMARY_FIELDS.dump(row), {
+            'id': 7, 'order_date': '2024-01-02T03:04:05', 'total_amount': 9.5, 'status': 'pending'
+        })
+        self.assertIsNone(ORDER_SUMMARY_FIELDS.dump((7, None, 9.5, 'pending'))['order_date'])
+
+@unittest.skipIf(orjson is None, 'orjson is not installed')
+class TestOrjsonProvider(unittest.TestCase):
+    def test_matches_default_provider(self):
+        """Test orjson output is byte-for-byte what the default provider produces"""
+        app = create_app(config_class=TestingConfig)
+        payload = {'b': [1, 2.5, None, 'x'], 'a': datetime(2024, 1, 2), 'c': Decimal('1.10'), 'd': True}
+        with app.app_context():
+            expected = DefaultJSONProvider(app).response(payload).get_data()
+            actual = OrjsonProvider(app).response(payload).get_data()
+        self.assertEqual(actual, expected)
+
+class TestETags(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(config_class=TestingConfig)
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            product = Product(name='Widget', price=1.0, stock=1)
+            order = Order(customer_id=1, total_amount=1.0)
+            db.session.add_all([product, order])
+            db.session.commit()
+            self.product_id, self.order_id = product.id, order.id
+            token = create_access_token(identity=1)
+            other_token = create_access_token(identity=2)
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.other_headers = {'Authorization': f'Bearer {other_token}'}
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_revalidation_returns_not_modified(self):
+        """Test a matching If-None-Match gets a 304, fresh or from the cache"""
+        for url in (f'/products/{self.product_id}', '/products', '/me/orders'):
+            response = self.client.get(url, headers=self.headers)
+            etag = response.headers['ETag']
+
+            response = self.client.get(url, headers={**self.headers, 'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.get_data(), b'')
+
+    def test_etag_changes_with_content(self):
+        """Test the ETag follows the serialized document"""
+        url = f'/products/{self.product_id}'
+        etag = self.client.get(url, headers=self.headers).headers['ETag']
+        self.client.put(url, json={'price': 2.0}, headers=self.headers)
+
+        response = self.client.get(url, headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_version_validators_skip_the_view(self):
+        """Test a current row version is answered with one column lookup"""
+        url = f'/products/{self.product_id}'
+        response = self.client.get(url, headers=self.headers)
+        etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+        self.client.get(url, headers={**self.headers, 'If-None-Match': etag})
+
+        with self.app.app_context():
+            with count_queries() as queries:
+                response = self.client.get(url, headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('version_id', queries[0])
+
+        response = self.client.get(url, headers={**self.headers, 'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+    def test_order_validator_respects_ownership(self):
+        """Test another customer's conditional request is still refused"""
+        url = f'/orders/{self.order_id}'
+        etag = self.client.get(url, headers=self.headers).headers['ETag']
+
+        response = self.client.get(url, headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, headers={**self.other_headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 403)
+
+    def test_order_follows_its_product_names(self):
+        """Test renaming a product changes the ETag and cached body of orders naming it"""
+        with self.app.app_context():
+            db.session.add(OrderItem(order_id=self.order_id, product_id=self.product_id, quantity=1, price=1.0))
+            db.session.commit()
+        url = f'/orders/{self.order_id}'
+        etag = self.client.get(url, headers=self.headers).headers['ETag']
+        self.assertEqual(self.client.get(url, headers={**self.headers, 'If-None-Match': etag}).status_code, 304)
+
+        self.client.put(f'/products/{self.product_id}', json={'name': 'Gadget'}, headers=self.headers)
+        response = self.client.get(url, headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['items'][0]['product_name'], 'Gadget')
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_etag_follows_versions_not_timestamps(self):
+        """Test ETags change within one timestamp tick and survive a NULL updated_at"""
+        url = f'/products/{self.product_id}'
+        with self.app.app_context():
+            # A row from before updated_at existed
+            db.session.execute(update(Product).values(updated_at=None).execution_options(synchronize_session=False))
+            db.session.commit()
+        response = self.client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        response = self.client.put(url, json={'price': 2.0}, headers={**self.headers, 'If-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        with self.app.app_context():
+            # Both writes land on the same (second-precision) timestamp
+            db.session.execute(update(Product).values(updated_at=datetime(2024, 1, 1)))
+            db.session.commit()
+        etag = self.client.get(url, headers=self.headers).headers['ETag']
+        self.client.put(url, json={'price': 3.0}, headers=self.headers)
+        with self.app.app_context():
+            db.session.execute(update(Product).values(updated_at=datetime(2024, 1, 1)))
+            db.session.commit()
+        response = self.client.put(url, json={'price': 4.0}, headers={**self.headers, 'If-Match': etag})
+        self.assertEqual(response.status_code, 412)
+
+        # Stock movements don't bump version_id but still change the document
+        etag = self.client.get(url, headers=self.headers).headers['ETag']
+        self.client.post('/orders', json={'items': [{'product_id': self.product_id, 'quantity': 1}]},
+                         headers=self.headers)
+        response = self.client.get(url, headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
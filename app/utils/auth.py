@@ -0,0 +1,160 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, g, jsonify, request
+from flask_jwt_extended import decode_token, get_jwt
+from flask_jwt_extended.config import config
+from flask_jwt_extended.exceptions import (
+    InvalidHeaderError, JWTExtendedException, NoAuthorizationError, WrongTokenError
+)
+from flask_jwt_extended.utils import get_unverified_jwt_headers
+from jwt import PyJWTError
+
+# Every request's token is checked once, in a before_request hook, and the
+# result parked where flask_jwt_extended keeps it, so get_jwt() and
+# get_jwt_identity() work as usual. Views declare what they need with
+# auth_required(); the rate limiter and the cache read the same claims.
+#
+# flask_jwt_extended has no public hook for supplying claims verified
+# elsewhere (verify_jwt_in_request() always decodes), so _authenticate()
+# writes the g._jwt_extended_* attributes its accessors read. They are
+# private: the library is pinned in requirements.txt and test_auth covers
+# the accessors, so check both before upgrading it.
+
+
+class TokenCache:
+    """A bounded LRU of verified tokens and their claims.
+
+    Entries are dropped once the token's ``exp`` passes, so a cached token
+    is never accepted after it would have failed verification. Keyed by
+    the whole encoded token: only the exact bytes that were verified hit.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token, now=None):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires_at, header, claims = entry
+            if expires_at is not None and expires_at <= (time.time() if now is None else now):
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return header, claims
+
+    def put(self, token, header, claims):
+        if self.maxsize <= 0:
+            return
+        expires_at = claims.get('exp')
+        if expires_at is not None:
+            expires_at += config.leeway
+        with self._lock:
+            self._entries[token] = (expires_at, header, claims)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _encoded_token():
+    value = request.headers.get(config.header_name, '').strip()
+    if not value:
+        raise NoAuthorizationError(f'Missing {config.header_name} Header')
+    parts = value.split()
+    if config.header_type:
+        if parts[0] != config.header_type:
+            raise NoAuthorizationError(
+                f"Missing '{config.header_type}' type in '{config.header_name}' header. "
+                f"Expected '{config.header_name}: {config.header_type} <JWT>'"
+            )
+        parts = parts[1:]
+    if len(parts) != 1:
+        raise InvalidHeaderError(f'Bad {config.header_name} header')
+    return parts[0]
+
+
+def verify_token(token):
+    """Return ``(header, claims)`` for an access token, verifying it at most once while cached."""
+    tokens = current_app.extensions['token_cache']
+    cached = tokens.get(token)
+    if cached is not None:
+        return cached
+    claims = decode_token(token)
+    if claims.get('type') != 'access':
+        raise WrongTokenError('Only access tokens are allowed')
+    header = get_unverified_jwt_headers(token)
+    tokens.put(token, header, claims)
+    return header, claims
+
+
+def _authenticate():
+    g.auth_error = None
+    header, claims = {}, {}
+    if request.method not in config.exempt_methods:
+        try:
+            header, claims = verify_token(_encoded_token())
+        except (JWTExtendedException, PyJWTError) as e:
+            # Reported by auth_required(); routes without it ignore the token
+            g.auth_error = e
+    g._jwt_extended_jwt_header = header
+    g._jwt_extended_jwt = claims
+    g._jwt_extended_jwt_user = {'loaded_user': None}
+    g._jwt_extended_jwt_location = 'headers' if claims else None
+
+
+def _authenticated():
+    # Usually done by the hook already; also covers callers that run
+    # before it, or in a bare test_request_context
+    if 'auth_error' not in g:
+        _authenticate()
+    return g.auth_error
+
+
+def current_identity():
+    """The verified caller's identity, or None."""
+    _authenticated()
+    return g._jwt_extended_jwt.get(config.identity_claim_key)
+
+
+def check_auth(admin=False):
+    """Raise the request's token error, if any; a 403 response for non-admins.
+
+    Missing or invalid tokens raise the same errors ``jwt_required``
+    would, so the JWT error handlers answer 401/422 as before.
+    """
+    error = _authenticated()
+    if error is not None:
+        raise error
+    if admin and not get_jwt().get('is_admin', False):
+        return jsonify({'message': 'Admin access required'}), 403
+    return None
+
+
+def auth_required(admin=False):
+    """Require the valid access token checked before the request.
+
+    With ``admin=True`` callers without the ``is_admin`` claim get 403.
+    """
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            denied = check_auth(admin)
+            if denied is not None:
+                return denied
+            return fn(*args, **kwargs)
+        return decorator
+    return wrapper
+
+
+def init_auth(app):
+    """Verify each request's token before any other hook (the rate limiter's included) runs."""
+    app.extensions['token_cache'] = TokenCache(app.config['AUTH_TOKEN_CACHE_SIZE'])
+    app.before_request(_authenticate)
@@ -0,0 +1,220 @@
+import hashlib
+import math
+import random
+import time
+import uuid
+from functools import wraps
+from itertools import chain
+from flask import current_app, make_response, request
+from flask_jwt_extended import get_jwt
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from app import cache
+from app.utils.database import primary_reads
+from app.utils.metrics import record_cache
+
+# Cached views are keyed by the current version token of every tag they
+# depend on (e.g. ``product:42`` or ``products``). Evicting a tag deletes
+# its token, so every entry built on it -- whatever its query string --
+# becomes unreachable at once and simply ages out of the backend.
+
+
+def entity_tag(kind, id):
+    return f'{kind}:{id}'
+
+
+def _tag_key(tag):
+    return f'tag:{tag}'
+
+
+def tag_versions(tags):
+    keys = [_tag_key(tag) for tag in tags]
+    versions = list(cache.get_many(*keys)) if keys else []
+    for i, version in enumerate(versions):
+        if version is None:
+            # add() loses to a concurrent reader that minted a token first
+            cache.add(keys[i], uuid.uuid4().hex, timeout=0)
+            versions[i] = cache.get(keys[i])
+    return versions
+
+
+def invalidate(*tags):
+    # Not delete_many(): Flask-Caching's generic version stops at the first
+    # key that is already gone.
+    for tag in tags:
+        cache.delete(_tag_key(tag))
+
+
+def mark_stale(session, *tags):
+    """Queue ``tags`` for eviction when ``session`` commits.
+
+    Needed for Core ``UPDATE``/``INSERT`` statements, which bypass the ORM
+    flush events that normally collect tags.
+    """
+    session.info.setdefault('cache_tags', set()).update(tags)
+
+
+# Per-blueprint list of request dimensions that cached entries vary on,
+# see vary_cache_on()
+_vary_policies = {}
+
+_VARY_DIMENSIONS = {
+    'identity': lambda claims: f"sub={claims.get('sub')}",
+    'roles': lambda claims: 'admin' if claims.get('is_admin', False) else 'user',
+}
+
+
+def vary_cache_on(blueprint, *dimensions):
+    """Make cached views of ``blueprint`` vary on the caller's JWT claims.
+
+    ``dimensions`` is any of ``'identity'`` and ``'roles'``. Responses of
+    the blueprint also advertise ``Vary: Authorization`` and are marked
+    private so shared HTTP caches never serve one caller's copy to another.
+    """
+    unknown = set(dimensions) - set(_VARY_DIMENSIONS)
+    if unknown:
+        raise ValueError(f'Unknown cache vary dimensions: {sorted(unknown)}')
+    _vary_policies[blueprint.name] = dimensions
+
+    @blueprint.after_request
+    def add_vary_headers(response):
+        response.vary.add('Authorization')
+        if 'identity' in dimensions:
+            response.cache_control.private = True
+        return response
+
+
+def _principal_fingerprint():
+    dimensions = _vary_policies.get(request.blueprint, ())
+    if not dimensions:
+        return None
+    claims = get_jwt()
+    return ','.join(_VARY_DIMENSIONS[dimension](claims) for dimension in dimensions)
+
+
+def _query_fingerprint():
+    args = sorted(request.args.items(multi=True))
+    return hashlib.md5(repr(args).encode()).hexdigest()
+
+
+def _refresh_early(delta, expires_at):
+    # "Optimal probabilistic cache stampede prevention" (XFetch): the
+    # closer an entry is to expiry, and the slower it was to compute, the
+    # more likely a reader volunteers to recompute it ahead of time.
+    beta = current_app.config['CACHE_EARLY_REFRESH_BETA']
+    if beta <= 0:
+        return False
+    return time.time() - delta * beta * math.log(1.0 - random.random()) >= expires_at
+
+
+def get_or_compute(key, compute, timeout):
+    """Return the cached value for ``key``, computing it at most once.
+
+    Concurrent misses are coalesced: one caller takes a short-lived lock in
+    the cache backend and computes, the others wait for its result (or,
+    while an entry is being refreshed early, keep serving the old value).
+    ``compute`` may return None to signal the result must not be cached.
+    """
+    entry = cache.get(key)
+    record_cache(entry is not None)
+    stale = None
+    if entry is not None:
+        value, delta, expires_at = entry
+        if not _refresh_early(delta, expires_at):
+            return value
+        stale = value
+
+    lock_key = f'lock:{key}'
+    token = uuid.uuid4().hex
+    if not cache.add(lock_key, token, timeout=current_app.config['CACHE_LOCK_TIMEOUT']):
+        if stale is not None:
+            return stale
+        deadline = time.monotonic() + current_app.config['CACHE_LOCK_WAIT']
+        while time.monotonic() < deadline:
+            time.sleep(0.025)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0]
+        # The lock holder is too slow (or died); don't queue behind it
+        return compute()
+
+    try:
+        started = time.monotonic()
+        value = compute()
+        if value is not None:
+            delta = time.monotonic() - started
+            cache.set(key, (value, delta, time.time() + timeout), timeout=timeout)
+        return value
+    finally:
+        # Past CACHE_LOCK_TIMEOUT the lock may be someone else's by now;
+        # only release our own (the backends offer no compare-and-delete,
+        # which leaves just the instant between these two calls)
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def cached_view(tags, timeout=None, query_string=False, variant=None, unless=None):
+    """Cache a view's successful responses under the versions of ``tags``.
+
+    ``tags`` is called with the view arguments and returns the tags the
+    response depends on. The key also includes the caller's claims when
+    the view's blueprint has a :func:`vary_cache_on` policy, and either the
+    raw query string or, when given, the string returned by ``variant()``
+    -- a normalized form of the arguments, so equivalent requests share one
+    entry. Misses go
+    through :func:`get_or_compute`, so a hot entry going cold reaches the
+    database once rather than once per worker, and read the primary.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if unless is not None and unless():
+                return fn(*args, **kwargs)
+            view_tags = tags(**kwargs)
+            parts = [request.endpoint]
+            parts += [f'{tag}@{version}' for tag, version in zip(view_tags, tag_versions(view_tags))]
+            principal = _principal_fingerprint()
+            if principal is not None:
+                parts.append(principal)
+            if variant is not None:
+                parts.append(hashlib.md5(variant().encode()).hexdigest())
+            elif query_string:
+                parts.append(_query_fingerprint())
+            key = 'view:' + '|'.join(parts)
+
+            computed = []
+
+            def render():
+                # Cached for a long time, so never from a lagging replica
+                with primary_reads():
+                    response = make_response(fn(*args, **kwargs))
+                computed.append(response)
+                if response.status_code == 200 and not response.is_streamed:
+                    return response.get_data(), 200, list(response.headers)
+                return None
+
+            ttl = timeout if timeout is not None else current_app.config['CACHE_ENTITY_TIMEOUT']
+            cached = get_or_compute(key, render, ttl)
+            if computed:
+                return computed[0]
+            body, status, headers = cached
+            return current_app.response_class(body, status, headers)
+        return wrapper
+    return decorator
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_cache_tags(session, flush_context):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if hasattr(obj, 'cache_tags'):
+            mark_stale(session, *obj.cache_tags())
+
+
+@event.listens_for(Session, 'after_commit')
+def _evict_cache_tags(session):
+    invalidate(*session.info.pop('cache_tags', ()))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_cache_tags(session):
+    session.info.pop('cache_tags', None)
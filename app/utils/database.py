@@ -0,0 +1,145 @@
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.engine import make_url
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+def _is_sqlite(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def engine_options(url, config):
+    """Pool settings for ``url``; SQLite's file/static pools take none."""
+    options = {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+    if not _is_sqlite(url):
+        options.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+        )
+    return options
+
+
+def configure_database(app):
+    """Fill in engine options before db.init_app() and open the replica.
+
+    Explicit ``SQLALCHEMY_ENGINE_OPTIONS`` entries win over the pool
+    settings derived from the ``DB_POOL_*`` config. The replica engine is
+    kept in ``app.extensions`` rather than ``SQLALCHEMY_BINDS`` so that
+    ``create_all()``/``drop_all()`` never touch it.
+    """
+    config = app.config
+    url = config['SQLALCHEMY_DATABASE_URI']
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        **engine_options(url, config),
+        **config.get('SQLALCHEMY_ENGINE_OPTIONS', {}),
+    }
+    replica_url = config.get('DATABASE_REPLICA_URL')
+    app.extensions['database_replica'] = (
+        create_engine(replica_url, **engine_options(replica_url, config)) if replica_url else None
+    )
+
+
+def replica_engine():
+    return current_app.extensions.get('database_replica')
+
+
+def install_sqlite_pragmas(app, engines):
+    """Tune every SQLite connection as it is opened.
+
+    WAL lets readers proceed while an order is being written, NORMAL
+    synchronous is durable across application crashes in WAL mode, the
+    busy timeout makes writers queue instead of failing with "database is
+    locked", and mmap serves reads straight from the page cache.
+    """
+    config = app.config
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}")
+        cursor.execute('PRAGMA journal_mode = WAL')
+        cursor.execute('PRAGMA synchronous = NORMAL')
+        cursor.execute(f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}")
+        cursor.close()
+
+    for engine in engines:
+        if engine is not None and engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', set_pragmas)
+
+
+def insert_ids(session, table, rows):
+    """Insert ``rows`` into ``table`` and return their new ids, in order.
+
+    One executemany with RETURNING where the driver supports it, else an
+    INSERT per row.
+    """
+    if not rows:
+        return []
+    if session.get_bind().dialect.insert_executemany_returning:
+        return list(session.scalars(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows))
+    return [session.execute(insert(table), row).inserted_primary_key[0] for row in rows]
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block, even while serving a GET.
+
+    For reads whose result outlives the request -- cached views, ETag
+    validators -- which must not capture a lagging replica's old rows:
+    a commit evicts the cache, and a replica read right after it would
+    put the old row straight back for the entry's whole lifetime.
+    """
+    previous = g.get('read_primary', False)
+    g.read_primary = True
+    try:
+        yield
+    finally:
+        g.read_primary = previous
+
+
+@contextmanager
+def deferred_commits(session):
+    """Make ``session.commit()`` only flush inside the block.
+
+    Yields a callable telling whether changes flushed that way are still
+    pending (committed, and not rolled back since); the caller then commits
+    them itself, together with writes of its own, in one transaction.
+    """
+    session.info['commit_deferred'] = False
+    try:
+        yield lambda: session.info['commit_deferred']
+    finally:
+        session.info.pop('commit_deferred', None)
+
+
+class RoutingSession(Session):
+    """Send reads made while serving GET/HEAD requests to the replica bind.
+
+    Only applies when ``DATABASE_REPLICA_URL`` is set, the model has no
+    bind key of its own and the read is not inside :func:`primary_reads`;
+    flushes always go to the primary. Also honours :func:`deferred_commits`.
+    """
+
+    def commit(self):
+        if 'commit_deferred' in self.info:
+            self.flush()
+            self.info['commit_deferred'] = True
+            return
+        super().commit()
+
+    def rollback(self):
+        if 'commit_deferred' in self.info:
+            self.info['commit_deferred'] = False
+        super().rollback()
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() \
+                and request.method in READ_METHODS and not g.get('read_primary', False):
+            replica = replica_engine()
+            if replica is not None and getattr(mapper, '__bind_key__', None) is None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,169 @@
+import hashlib
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+import click
+from flask import current_app, jsonify, make_response, request
+from flask.cli import AppGroup
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.models import IdempotencyRecord
+from app.utils.database import deferred_commits
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# Replayed responses never carry these over from the original
+_SKIPPED_HEADERS = {'content-length', 'set-cookie'}
+
+# Answers that invite a retry are not stored, so the retry runs for real
+_RETRYABLE_STATUSES = {409, 429}
+
+
+def _request_hash():
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}'.encode())
+    if request.query_string:
+        digest.update(b'?' + request.query_string)
+    digest.update(b'\n')
+    digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def _start(principal, key, request_hash):
+    """Insert the in-progress record; returns its token, or None if one already exists."""
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    db.session.add(IdempotencyRecord(
+        principal=principal,
+        key=key,
+        request_hash=request_hash,
+        token=token,
+        created_at=now,
+        expires_at=now + timedelta(seconds=current_app.config['IDEMPOTENCY_TTL'])
+    ))
+    try:
+        db.session.commit()
+        return token
+    except IntegrityError:
+        db.session.rollback()
+        return None
+
+
+def _existing(principal, key):
+    # Always a fresh transaction, so a waiter sees the first request's commit
+    db.session.rollback()
+    return IdempotencyRecord.query.filter_by(principal=principal, key=key).first()
+
+
+def _replay(record):
+    headers = [(name, value) for name, value in record.response_headers
+               if name.lower() not in _SKIPPED_HEADERS]
+    response = current_app.response_class(record.response_body, record.response_status, headers)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _discard(principal, key, token):
+    # Only the attempt holding ``token``: a record taken over since is left alone
+    db.session.execute(delete(IdempotencyRecord).where(
+        IdempotencyRecord.principal == principal, IdempotencyRecord.key == key,
+        IdempotencyRecord.token == token
+    ))
+    db.session.commit()
+
+
+def idempotent(fn):
+    """Make a POST view safe to retry with an ``Idempotency-Key`` header.
+
+    The first request with a key runs the view and stores its response
+    against the caller and key for ``IDEMPOTENCY_TTL`` seconds; repeats
+    get that response back (marked ``Idempotent-Replayed: true``) without
+    the view running again. A repeat that arrives while the first is still
+    running waits up to ``IDEMPOTENCY_WAIT`` seconds for its result. Reusing
+    a key for a different request body is refused with 422. Server errors,
+    409 and 429 are not stored, so those can be retried. Requests without
+    the header are unaffected. Must sit below ``auth_required``.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return fn(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'message': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+        principal = f'user:{get_jwt_identity()}'
+        request_hash = _request_hash()
+        config = current_app.config
+
+        deadline = time.monotonic() + config['IDEMPOTENCY_WAIT']
+        while (token := _start(principal, key, request_hash)) is None:
+            record = _existing(principal, key)
+            if record is None:
+                # Purged between our insert and our read; try again
+                continue
+            now = datetime.utcnow()
+            stalled = record.status == 'in_progress' and \
+                record.created_at + timedelta(seconds=config['IDEMPOTENCY_LOCK_TIMEOUT']) <= now
+            if record.expires_at <= now or stalled:
+                # Expired, or the first request died before storing a
+                # response: this one takes over
+                _discard(principal, key, record.token)
+                continue
+            if record.request_hash != request_hash:
+                return jsonify({'message': f'{HEADER} was already used for a different request'}), 422
+            if record.status == 'completed':
+                return _replay(record)
+            if time.monotonic() >= deadline:
+                return jsonify({
+                    'message': f'A request with this {HEADER} is still being processed'
+                }), 409, {'Retry-After': '1'}
+            time.sleep(config['IDEMPOTENCY_POLL_INTERVAL'])
+
+        # The view's commit is held back and made together with the stored
+        # response, so a crash in between can't leave its writes without a
+        # record for the retry to replay
+        try:
+            with deferred_commits(db.session) as pending:
+                response = make_response(fn(*args, **kwargs))
+                committed = pending()
+        except Exception:
+            db.session.rollback()
+            _discard(principal, key, token)
+            raise
+        if not committed:
+            db.session.rollback()
+        if response.status_code >= 500 or response.status_code in _RETRYABLE_STATUSES \
+                or response.is_streamed:
+            _discard(principal, key, token)
+            return response
+        # None when another attempt took over after the lock timeout; its
+        # record is its own to complete
+        record = IdempotencyRecord.query.filter_by(principal=principal, key=key, token=token).first()
+        if record is not None:
+            record.status = 'completed'
+            record.response_status = response.status_code
+            record.response_headers = [list(header) for header in response.headers]
+            record.response_body = response.get_data()
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            _discard(principal, key, token)
+            raise
+        return response
+    return wrapper
+
+
+idempotency_cli = AppGroup('idempotency', help='Maintain stored idempotent responses.')
+
+
+@idempotency_cli.command('purge')
+def purge_command():
+    """Delete idempotency records past their TTL."""
+    result = db.session.execute(delete(IdempotencyRecord).where(IdempotencyRecord.expires_at <= datetime.utcnow()))
+    db.session.commit()
+    click.echo(f'Purged {result.rowcount} idempotency record(s).')
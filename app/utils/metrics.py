@@ -0,0 +1,284 @@
+import collections
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from flask import Response, current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+OVERHEAD_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+
+PROFILE_HEADER = 'X-Profile'
+
+# Queries run outside a request (job workers, CLI commands) are labelled so
+BACKGROUND = 'background'
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield self.name, _labels(self.labels, labels), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            counts, total = self._values.get(labels) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[labels] = (counts, total + value)
+
+    def count(self, *labels):
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        names = self.labels + ('le',)
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', _labels(names, labels + (_number(bound),)), cumulative
+            yield f'{self.name}_sum', _labels(self.labels, labels), total
+            yield f'{self.name}_count', _labels(self.labels, labels), cumulative
+
+
+class Registry:
+    """The metric families of one process, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name}{labels} {_number(value)}' for name, labels, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """Samples one thread's stack every ``interval`` seconds.
+
+    Runs on its own daemon thread, so the profiled code is not traced and
+    pays only for the GIL hand-offs. :meth:`stop` returns the samples in
+    the folded format (``outer;inner;leaf count`` per line) read by
+    flamegraph.pl, speedscope and inferno.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def _metrics():
+    return current_app.extensions.get('metrics') if has_app_context() else None
+
+
+def _endpoint():
+    return (request.endpoint or 'unmatched') if has_request_context() else BACKGROUND
+
+
+def record_cache(hit):
+    """Count one cache lookup as a hit or a miss."""
+    metrics = _metrics()
+    if metrics is not None:
+        metrics.cache_requests.inc('hit' if hit else 'miss')
+
+
+def record_ratelimit(seconds):
+    """Record the time spent evaluating the rate limits of one request."""
+    metrics = _metrics()
+    if metrics is not None:
+        metrics.ratelimit_seconds.observe(seconds)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    metrics = _metrics()
+    if metrics is None:
+        return
+    endpoint = _endpoint()
+    metrics.sql_queries.inc(endpoint)
+    metrics.sql_seconds.inc(endpoint, amount=elapsed)
+    if endpoint != BACKGROUND:
+        g.sql_queries = g.get('sql_queries', 0) + 1
+
+
+class Metrics:
+    """Per-endpoint latency, SQL, cache and rate limiter metrics.
+
+    Request latency, the number and total time of SQL statements (from
+    cursor events on every engine, the read replica included), cache hits
+    and misses of :func:`~app.utils.cache.get_or_compute` and the time the
+    rate limiter spends per check are served at ``/metrics`` in the
+    Prometheus text format. Values are kept per process, so scrape every
+    worker (or let each report under its own instance label).
+
+    With ``METRICS_PROFILING`` on, a request carrying ``X-Profile: 1`` is
+    also sampled by a :class:`SamplingProfiler`; the folded stacks are
+    written to ``METRICS_PROFILE_DIR`` and named in the response's
+    ``X-Profile-File`` header.
+    """
+
+    def __init__(self, app=None):
+        self.registry = Registry()
+        self.requests = self.registry.counter(
+            'http_requests_total', 'Requests handled.', ('endpoint', 'method', 'status')
+        )
+        self.latency = self.registry.histogram(
+            'http_request_duration_seconds', 'Time to handle a request.', ('endpoint', 'method')
+        )
+        self.sql_queries = self.registry.counter(
+            'sql_queries_total', 'SQL statements executed.', ('endpoint',)
+        )
+        self.sql_seconds = self.registry.counter(
+            'sql_query_seconds_total', 'Time spent executing SQL statements.', ('endpoint',)
+        )
+        self.sql_per_request = self.registry.histogram(
+            'sql_queries_per_request', 'SQL statements executed per request.', ('endpoint',),
+            buckets=QUERY_COUNT_BUCKETS
+        )
+        self.cache_requests = self.registry.counter(
+            'cache_requests_total', 'Cached view lookups by result.', ('result',)
+        )
+        self.ratelimit_seconds = self.registry.histogram(
+            'ratelimit_check_duration_seconds', 'Time spent evaluating rate limits.',
+            buckets=OVERHEAD_BUCKETS
+        )
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['metrics'] = self
+        # Registered before the other extensions' hooks, so their
+        # before_request work (the rate limiter's included) is timed too
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        if app.config['METRICS_ENABLED']:
+            from app import limiter
+            app.add_url_rule('/metrics', 'metrics', limiter.exempt(self.export))
+
+    def _before_request(self):
+        g.request_started = time.perf_counter()
+        config = current_app.config
+        if config['METRICS_PROFILING'] and request.headers.get(PROFILE_HEADER) == '1':
+            g.profiler = SamplingProfiler(threading.get_ident(), config['METRICS_PROFILE_INTERVAL']).start()
+
+    def _after_request(self, response):
+        endpoint = _endpoint()
+        self.requests.inc(endpoint, request.method, response.status_code)
+        if 'request_started' in g:
+            self.latency.observe(time.perf_counter() - g.request_started, endpoint, request.method)
+        self.sql_per_request.observe(g.get('sql_queries', 0), endpoint)
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            response.headers['X-Profile-File'] = self._dump_profile(endpoint, profiler.stop())
+        return response
+
+    def _dump_profile(self, endpoint, folded):
+        directory = current_app.config['METRICS_PROFILE_DIR']
+        os.makedirs(directory, exist_ok=True)
+        name = f'{endpoint}-{time.strftime("%Y%m%dT%H%M%S")}-{os.getpid()}-{threading.get_ident()}.folded'
+        with open(os.path.join(directory, name), 'w') as f:
+            f.write(folded)
+        return name
+
+    def export(self):
+        """
+        Prometheus metrics for this worker process
+        ---
+        tags:
+          - Monitoring
+        produces:
+          - text/plain
+        responses:
+          200:
+            description: Metrics in the Prometheus text exposition format
+        """
+        return Response(self.registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,67 @@
+import base64
+import json
+from datetime import datetime
+from urllib.parse import urlencode
+
+from flask import request, current_app
+from sqlalchemy import tuple_
+
+
+def page_args():
+    """Read the ``limit``/``after`` keyset parameters from the query string.
+
+    ``after`` comes back as the raw token, or None, for the view to decode
+    and reject with a 400 when malformed.
+    """
+    default = current_app.config['PAGE_SIZE_DEFAULT']
+    maximum = current_app.config['PAGE_SIZE_MAX']
+    limit = request.args.get('limit', default, type=int)
+    after = request.args.get('after') or None
+    return max(1, min(limit, maximum)), after
+
+
+def encode_cursor(*values):
+    """Pack a row's sort key into an opaque, URL-safe ``after`` token."""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Unpack an ``encode_cursor`` token; raises ValueError when malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError('Malformed cursor') from e
+    if not isinstance(values, list):
+        raise ValueError('Malformed cursor')
+    return values
+
+
+def keyset_page(query, columns, after, limit, descending=False):
+    """Bound, order and limit ``query`` (a Query or a ``select()``) to one page.
+
+    ``after`` holds the values of ``columns`` for the last row of the
+    previous page. One extra row is asked for, so that :func:`split_page`
+    can tell whether another page exists without a ``COUNT(*)``.
+    """
+    if after is not None:
+        key, bound = tuple_(*columns), tuple_(*after)
+        query = query.filter(key < bound if descending else key > bound)
+    order = [column.desc() for column in columns] if descending else columns
+    return query.order_by(*order).limit(limit + 1)
+
+
+def split_page(rows, limit):
+    return rows[:limit], len(rows) > limit
+
+
+def keyset_rows(query, columns, after, limit, descending=False):
+    """Return one page of ``query`` ordered by ``columns`` and a more-flag."""
+    return split_page(keyset_page(query, columns, after, limit, descending).all(), limit)
+
+
+def next_link(next_after, limit):
+    args = request.args.to_dict()
+    args.update(after=next_after, limit=limit)
+    return f'<{request.base_url}?{urlencode(args)}>; rel="next"'
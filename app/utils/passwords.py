@@ -0,0 +1,104 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+from flask import current_app
+
+# bcrypt only looks at the first 72 bytes; newer releases raise instead of
+# truncating, so truncate explicitly to keep existing hashes verifiable.
+_MAX_PASSWORD_BYTES = 72
+
+
+def _encode(password):
+    return password.encode('utf-8')[:_MAX_PASSWORD_BYTES]
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(hashed, password):
+    try:
+        return bcrypt.checkpw(_encode(password), hashed.encode('utf-8'))
+    except ValueError:
+        # Not a bcrypt hash at all
+        return False
+
+
+def hash_rounds(hashed):
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool's queue is full; callers answer 503."""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded process pool instead of the request thread.
+
+    ``PASSWORD_HASH_WORKERS`` processes do the hashing (0 hashes inline);
+    at most ``PASSWORD_HASH_MAX_PENDING`` jobs may be queued or running,
+    and a request that cannot get a slot within
+    ``PASSWORD_HASH_QUEUE_TIMEOUT`` seconds gets :exc:`PasswordHasherBusy`
+    rather than piling up behind a credential-stuffing burst. The cost
+    factor is ``BCRYPT_LOG_ROUNDS``.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self._dummy_hashes = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['password_hasher'] = self
+
+    def _pool(self, config):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the web worker is multi-threaded
+                self._executor = ProcessPoolExecutor(
+                    max_workers=config['PASSWORD_HASH_WORKERS'],
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+                self._slots = threading.BoundedSemaphore(config['PASSWORD_HASH_MAX_PENDING'])
+            return self._executor
+
+    def _run(self, fn, *args):
+        config = current_app.config
+        if not config['PASSWORD_HASH_WORKERS']:
+            return fn(*args)
+        executor = self._pool(config)
+        if not self._slots.acquire(timeout=config['PASSWORD_HASH_QUEUE_TIMEOUT']):
+            raise PasswordHasherBusy()
+        try:
+            return executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, password, current_app.config['BCRYPT_LOG_ROUNDS'])
+
+    def verify(self, hashed, password):
+        return self._run(_check, hashed, password)
+
+    def verify_unknown(self, password):
+        """Burn one verification for a username that does not exist.
+
+        Checks against a dummy hash at the current cost, computed once per
+        cost setting, so unknown and known usernames take the same time.
+        """
+        rounds = current_app.config['BCRYPT_LOG_ROUNDS']
+        dummy = self._dummy_hashes.get(rounds)
+        if dummy is None:
+            dummy = self._dummy_hashes.setdefault(rounds, self._run(_hash, 'dummy-password', rounds))
+        self._run(_check, dummy, password)
+        return False
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) != current_app.config['BCRYPT_LOG_ROUNDS']
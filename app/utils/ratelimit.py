@@ -0,0 +1,167 @@
+import math
+import random
+import sqlite3
+import threading
+import time
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from limits.storage import Storage
+from limits.storage.base import SlidingWindowCounterSupport, TimestampedSlidingWindow
+from app.utils.auth import current_identity
+from app.utils.metrics import record_ratelimit
+
+
+def rate_limit_key():
+    """Limit authenticated callers per identity, everyone else per address.
+
+    Limits declared with ``@limiter.limit`` are already scoped per route,
+    so this yields per-route, per-principal buckets. Behind a load balancer
+    set ``PROXY_FIX_X_FOR`` so the fallback address is the client's. The
+    token was already verified before the request; an invalid one counts
+    as anonymous here and is reported by the view's ``auth_required()``.
+    """
+    identity = current_identity()
+    if identity is not None:
+        return f'user:{identity}'
+    return f'ip:{get_remote_address()}'
+
+
+class InstrumentedLimiter(Limiter):
+    """A :class:`Limiter` that reports how long each check takes.
+
+    Every check -- the application-wide one in ``before_request`` and the
+    one run by each ``@limiter.limit`` decorator -- goes through
+    ``_check_request_limit``, which includes resolving the key and the
+    storage round trips.
+    """
+
+    def _check_request_limit(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super()._check_request_limit(*args, **kwargs)
+        finally:
+            record_ratelimit(time.perf_counter() - started)
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """Rate limit counters in a SQLite file shared by every local worker.
+
+    A stand-in for Redis on single-host deployments and tests: each hit is
+    one atomic upsert (or one immediate transaction for the sliding window
+    counter), and counters survive restarts. Use ``sqlite:///path.db``.
+    """
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        path = uri.split('://', 1)[1][1:] or ':memory:'
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS ratelimit ('
+            ' key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL)'
+        )
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def incr(self, key, expiry, amount=1):
+        now = time.time()
+        if random.random() < 0.01:
+            self._execute('DELETE FROM ratelimit WHERE expires_at <= ?', (now,))
+        row = self._execute(
+            'INSERT INTO ratelimit (key, count, expires_at) VALUES (:key, :amount, :now + :expiry)'
+            ' ON CONFLICT(key) DO UPDATE SET'
+            '  count = CASE WHEN expires_at <= :now THEN :amount ELSE count + :amount END,'
+            '  expires_at = CASE WHEN expires_at <= :now THEN :now + :expiry ELSE expires_at END'
+            ' RETURNING count',
+            {'key': key, 'amount': amount, 'now': now, 'expiry': expiry},
+        )
+        return row[0]
+
+    def decr(self, key, amount=1):
+        row = self._execute(
+            'UPDATE ratelimit SET count = MAX(count - ?, 0) WHERE key = ? RETURNING count',
+            (amount, key),
+        )
+        return row[0] if row else 0
+
+    def get(self, key):
+        row = self._execute(
+            'SELECT count FROM ratelimit WHERE key = ? AND expires_at > ?', (key, time.time())
+        )
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        now = time.time()
+        row = self._execute(
+            'SELECT expires_at FROM ratelimit WHERE key = ? AND expires_at > ?', (key, now)
+        )
+        return row[0] if row else now
+
+    def check(self):
+        try:
+            self._execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        with self._lock:
+            return self._conn.execute('DELETE FROM ratelimit').rowcount
+
+    def clear(self, key):
+        self._execute('DELETE FROM ratelimit WHERE key = ?', (key,))
+
+    def _window(self, previous_key, current_key, expiry, now):
+        counts = dict(self._conn.execute(
+            'SELECT key, count FROM ratelimit WHERE key IN (?, ?) AND expires_at > ?',
+            (previous_key, current_key, now),
+        ).fetchall())
+        previous_count = counts.get(previous_key, 0)
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, counts.get(current_key, 0), current_ttl
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        with self._lock:
+            # Read, check and increment inside one write transaction so that
+            # concurrent workers cannot both take the last slot
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                previous_count, previous_ttl, current_count, _ = self._window(
+                    previous_key, current_key, expiry, now
+                )
+                weighted = previous_count * previous_ttl / expiry + current_count
+                if math.floor(weighted) + amount > limit:
+                    return False
+                self._conn.execute(
+                    'INSERT INTO ratelimit (key, count, expires_at) VALUES (?, ?, ?)'
+                    ' ON CONFLICT(key) DO UPDATE SET count = count + excluded.count',
+                    (current_key, amount, now + 2 * expiry),
+                )
+                return True
+            finally:
+                self._conn.execute('COMMIT')
+
+    def get_sliding_window(self, key, expiry):
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        with self._lock:
+            return self._window(previous_key, current_key, expiry, now)
+
+    def clear_sliding_window(self, key, expiry):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        self._execute('DELETE FROM ratelimit WHERE key IN (?, ?)', (previous_key, current_key))
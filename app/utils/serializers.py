@@ -0,0 +1,226 @@
+import hashlib
+from functools import wraps
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+from app.utils.database import primary_reads
+from sqlalchemy import Date, DateTime, func
+from app.models.models import (
+    Customer, CustomerAccount, CustomerValue, DailySales, Order, OrderItem, Product, ProductSales,
+    ProductSalesDaily, Reservation, ReservationItem
+)
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used instead
+    orjson = None
+
+
+class FieldPlan:
+    """Precompiled mapping from a tuple of columns to a JSON-ready dict.
+
+    Queries select ``plan.columns`` and pass the resulting rows to
+    :meth:`dump`, so no ORM instances are built just to be serialized.
+    Output keys are the column keys (or labels); date and datetime columns
+    are rendered with ``isoformat()``. Rows may carry extra columns after
+    ``plan.columns`` (such as the versions an ETag is built from); they
+    are left out.
+    """
+
+    def __init__(self, *columns):
+        self.columns = columns
+        self.names = tuple(column.key for column in columns)
+        self._datetimes = tuple(
+            i for i, column in enumerate(columns) if isinstance(column.type, (Date, DateTime))
+        )
+
+    def dump(self, row):
+        if not self._datetimes:
+            return dict(zip(self.names, row))
+        values = list(row)
+        for i in self._datetimes:
+            if values[i] is not None:
+                values[i] = values[i].isoformat()
+        return dict(zip(self.names, values))
+
+    def dump_many(self, rows):
+        return [self.dump(row) for row in rows]
+
+
+PRODUCT_FIELDS = FieldPlan(
+    Product.id, Product.name, Product.description, Product.price, Product.stock,
+    (Product.stock - Product.reserved).label('available'), Product.updated_at
+)
+CUSTOMER_FIELDS = FieldPlan(
+    Customer.id, Customer.name, Customer.email, Customer.phone, CustomerAccount.username, Customer.updated_at
+)
+ORDER_FIELDS = FieldPlan(
+    Order.id, Order.customer_id, Order.order_date, Order.total_amount, Order.status, Order.updated_at
+)
+# Selected after PRODUCT_FIELDS / ORDER_FIELDS for product_etag() / order_etag()
+PRODUCT_VERSION_COLUMNS = (Product.version_id, Product.reserved)
+ORDER_VERSION_COLUMNS = (Order.version_id,)
+ORDER_SUMMARY_FIELDS = FieldPlan(Order.id, Order.order_date, Order.total_amount, Order.status)
+ORDER_ITEM_FIELDS = FieldPlan(
+    OrderItem.product_id, Product.name.label('product_name'), OrderItem.quantity, OrderItem.price
+)
+# The embedded product names change with the product's version
+ORDER_ITEM_VERSION_COLUMNS = (Product.version_id.label('product_version'),)
+RESERVATION_FIELDS = FieldPlan(
+    Reservation.id, Reservation.customer_id, Reservation.status, Reservation.created_at,
+    Reservation.expires_at, Reservation.order_id
+)
+RESERVATION_ITEM_FIELDS = FieldPlan(ReservationItem.product_id, ReservationItem.quantity, ReservationItem.price)
+# The columns bulk import accepts and export writes, in file order
+CATALOG_FIELDS = FieldPlan(Product.id, Product.name, Product.description, Product.price, Product.stock)
+PRODUCT_SALES_FIELDS = FieldPlan(
+    ProductSales.product_id, Product.name, ProductSales.orders, ProductSales.units, ProductSales.revenue
+)
+PRODUCT_SALES_RANGE_FIELDS = FieldPlan(
+    ProductSalesDaily.product_id, Product.name, func.sum(ProductSalesDaily.orders).label('orders'),
+    func.sum(ProductSalesDaily.units).label('units'), func.sum(ProductSalesDaily.revenue).label('revenue')
+)
+DAILY_SALES_FIELDS = FieldPlan(DailySales.day, DailySales.orders, DailySales.units, DailySales.revenue)
+CUSTOMER_VALUE_FIELDS = FieldPlan(
+    CustomerValue.customer_id, Customer.name, CustomerValue.orders, CustomerValue.revenue,
+    CustomerValue.first_order_at, CustomerValue.last_order_at
+)
+LOW_STOCK_FIELDS = FieldPlan(
+    Product.id, Product.name, Product.stock, Product.reserved, (Product.stock - Product.reserved).label('available')
+)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson.
+
+    Produces the same documents as the default provider: keys are sorted,
+    and dates, decimals, UUIDs and dataclasses are handed back to
+    :meth:`DefaultJSONProvider.default` so they render exactly as before.
+    The one difference is that non-ASCII text is sent as UTF-8 rather than
+    ``\\u`` escapes.
+    """
+
+    def _options(self, indent=False):
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Callers asking for stdlib options (indent, separators, ...)
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent=pretty))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+def version_etag(*versions):
+    """A strong ETag from the values that change whenever a document does.
+
+    ``versions`` are ``version_id`` counters and any columns edited without
+    bumping one (stock levels, ``updated_at``); None is allowed.
+    """
+    return hashlib.md5('|'.join(str(version) for version in versions).encode()).hexdigest()
+
+
+def product_etag(product):
+    """The ETag of a product document, from a Product or a row with PRODUCT_VERSION_COLUMNS."""
+    # Stock movements leave version_id alone, so stock and holds count too
+    return version_etag(product.version_id, product.stock, product.reserved, product.updated_at)
+
+
+def order_etag(order, items):
+    """The ETag of an order document, from its row and item rows with the version columns.
+
+    The products' versions count too: the document embeds their names.
+    """
+    return version_etag(order.version_id, order.updated_at, *(item.product_version for item in items))
+
+
+def json_response(payload, status=200, etag=None, last_modified=None):
+    """Serialize ``payload`` with the app's provider and tag it with an ETag.
+
+    With ``etag`` (a :func:`version_etag` of the rows the document is built
+    from) the response carries that, matching what :func:`conditional`
+    checks, and ``last_modified`` if given; otherwise the ETag is a hash of
+    the serialized bytes, so identical documents get identical tags however
+    they were produced (fresh or from the cache).
+    """
+    response = current_app.json.response(payload)
+    response.status_code = status
+    if status == 200:
+        if etag is not None:
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+        else:
+            response.add_etag()
+    return response
+
+
+def precondition_failed(etag):
+    """True when the request's ``If-Match`` does not name this version."""
+    return bool(request.if_match) and not request.if_match.contains(etag)
+
+
+def conditional(validator):
+    """Answer conditional GETs from the row versions alone.
+
+    ``validator`` is called with the view arguments and returns the
+    resource's ``(etag, last_modified)`` -- a single indexed lookup -- or
+    None when it cannot vouch for the resource (missing, not the
+    caller's, ...), in which case the view runs as usual. When the
+    client's ``If-None-Match`` (or, without one, ``If-Modified-Since``)
+    still matches, the 304 goes out without the view, its cache entry or
+    any serialization being touched.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if request.if_none_match or request.if_modified_since:
+                # The primary's version, matching the cached body it vouches for
+                with primary_reads():
+                    version = validator(**kwargs)
+                if version is not None:
+                    etag, last_modified = version
+                    response = current_app.response_class()
+                    response.set_etag(etag)
+                    if last_modified is not None:
+                        response.last_modified = last_modified
+                    response.make_conditional(request)
+                    if response.status_code == 304:
+                        return response
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _conditional(response):
+    if request.method in ('GET', 'HEAD') and response.status_code == 200 and response.get_etag()[0]:
+        response.make_conditional(request)
+    return response
+
+
+def init_json(app):
+    """Install the configured JSON provider and ETag revalidation.
+
+    ``JSON_PROVIDER`` is ``orjson``, ``default`` (the stdlib encoder) or
+    ``auto``, which picks orjson when it is installed.
+    """
+    configured = app.config['JSON_PROVIDER']
+    if configured == 'orjson' and orjson is None:
+        app.logger.warning('JSON_PROVIDER is orjson but orjson is not installed; using the default provider.')
+    if configured in ('auto', 'orjson') and orjson is not None:
+        app.json = OrjsonProvider(app)
+    app.after_request(_conditional)
@@ -0,0 +1,44 @@
+import argparse
+import json
+import sys
+
+
+def compare(baseline, current, threshold):
+    """Yield ``(scenario, driver, metric, before, after, regressed)`` for shared results."""
+    for name, drivers in current['results'].items():
+        for driver, after in drivers.items():
+            before = baseline['results'].get(name, {}).get(driver)
+            if before is None:
+                continue
+            # Lower is better for latency, higher for throughput
+            for metric, worse in (('p50_ms', 1), ('p99_ms', 1), ('throughput_rps', -1)):
+                change = (after[metric] - before[metric]) / before[metric] if before[metric] else 0.0
+                yield name, driver, metric, before[metric], after[metric], change * worse > threshold
+            if before['queries_per_request'] is not None and after['queries_per_request'] is not None:
+                yield (name, driver, 'queries_per_request', before['queries_per_request'],
+                       after['queries_per_request'], after['queries_per_request'] > before['queries_per_request'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files.')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative change that counts as a regression (default 0.2)')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    regressions = 0
+    print(f'{baseline.get("commit")} -> {current.get("commit")}')
+    for name, driver, metric, before, after, regressed in compare(baseline, current, args.threshold):
+        regressions += regressed
+        print(f'{name:14} {driver:6} {metric:20} {before:10} -> {after:10}{"  REGRESSION" if regressed else ""}')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+from flask_jwt_extended import create_access_token
+from werkzeug.serving import WSGIRequestHandler, make_server
+from app import create_app, db
+from app.models.models import CustomerAccount, Order, Product
+from benchmarks.seed import PASSWORD, username
+from config import Config
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+# Callers the benchmark authenticates as (customer ids 1..TOKEN_POOL)
+TOKEN_POOL = 100
+
+
+def benchmark_app(database, **overrides):
+    """The application as deployed, pointed at ``database``, without rate limits."""
+    config = type('BenchmarkConfig', (Config,), {
+        'SQLALCHEMY_DATABASE_URI': database,
+        'RATELIMIT_ENABLED': False,
+        **overrides,
+    })
+    return create_app(config_class=config)
+
+
+class Context:
+    """Ids and tokens the scenarios draw their requests from."""
+
+    def __init__(self, app):
+        with app.app_context():
+            self.max_product_id = db.session.query(db.func.max(Product.id)).scalar() or 0
+            callers = min(TOKEN_POOL, CustomerAccount.query.count())
+            self.tokens = {
+                customer_id: create_access_token(identity=customer_id, additional_claims={'is_admin': False})
+                for customer_id in range(1, callers + 1)
+            }
+            self.orders = db.session.query(Order.id, Order.customer_id).filter(
+                Order.customer_id.in_(self.tokens)
+            ).limit(10000).all()
+        if not self.max_product_id or not self.orders:
+            raise SystemExit('The benchmark database is empty; run python -m benchmarks.seed first')
+
+    def auth(self, rng, customer_id=None):
+        if customer_id is None:
+            customer_id = rng.randint(1, len(self.tokens))
+        return {'Authorization': f'Bearer {self.tokens[customer_id]}'}
+
+
+def list_products(ctx, rng):
+    return 'GET', f'/products?limit=20&after={rng.randint(0, ctx.max_product_id)}', None, ctx.auth(rng)
+
+
+def get_product(ctx, rng):
+    return 'GET', f'/products/{rng.randint(1, ctx.max_product_id)}', None, ctx.auth(rng)
+
+
+def create_order(ctx, rng):
+    items = [{'product_id': rng.randint(1, ctx.max_product_id), 'quantity': 1} for _ in range(rng.randint(1, 3))]
+    return 'POST', '/orders', {'items': items}, ctx.auth(rng)
+
+
+def get_order(ctx, rng):
+    order_id, customer_id = rng.choice(ctx.orders)
+    return 'GET', f'/orders/{order_id}', None, ctx.auth(rng, customer_id)
+
+
+def login(ctx, rng):
+    return 'POST', '/login', {'username': username(rng.randint(1, len(ctx.tokens))), 'password': PASSWORD}, {}
+
+
+# Scenario name -> (request builder, Flask endpoint it exercises)
+SCENARIOS = {
+    'list_products': (list_products, 'product.list_products'),
+    'get_product': (get_product, 'product.get_product'),
+    'create_order': (create_order, 'order.create_order'),
+    'get_order': (get_order, 'order.get_order'),
+    'login': (login, 'auth.login'),
+}
+
+
+class ClientDriver:
+    """Requests through the Flask test client: the app's own overhead only."""
+
+    name = 'client'
+
+    def __init__(self, app):
+        self.app = app
+
+    def connect(self):
+        client = self.app.test_client()
+
+        def call(method, path, body, headers):
+            return client.open(path, method=method, json=body, headers=headers).status_code
+        return call
+
+    def close(self):
+        pass
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class ServerDriver:
+    """Requests over HTTP to a threaded WSGI server (started here unless ``url`` is given)."""
+
+    name = 'server'
+
+    def __init__(self, app, url=None):
+        self._server = None
+        if url is None:
+            self._server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            url = f'http://127.0.0.1:{self._server.server_port}'
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+
+    def connect(self):
+        connection = [http.client.HTTPConnection(self.host, self.port, timeout=30)]
+
+        def call(method, path, body, headers):
+            headers = dict(headers)
+            payload = None
+            if body is not None:
+                payload = json.dumps(body)
+                headers['Content-Type'] = 'application/json'
+            for attempt in range(2):
+                try:
+                    connection[0].request(method, path, payload, headers)
+                    response = connection[0].getresponse()
+                    response.read()
+                    return response.status
+                except (http.client.HTTPException, ConnectionError):
+                    # The server closed the keep-alive connection; reconnect once
+                    connection[0].close()
+                    connection[0] = http.client.HTTPConnection(self.host, self.port, timeout=30)
+                    if attempt:
+                        raise
+        return call
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(driver, ctx, build, requests, concurrency, seed):
+    """Send ``requests`` requests from ``concurrency`` threads; return latencies and errors."""
+    remaining = [requests]
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        call = driver.connect()
+        mine = []
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            request = build(ctx, rng)
+            started = time.perf_counter()
+            try:
+                failed = call(*request) >= 400
+            except Exception:
+                failed = True
+            mine.append(time.perf_counter() - started)
+            if failed:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, sorted(latencies), errors[0]
+
+
+def benchmark(app, scenarios=None, drivers=('client', 'server'), requests=1000, concurrency=8,
+              warmup=50, url=None, seed=42):
+    """Run each scenario through each driver and summarize the measurements.
+
+    Queries per request come from the app's metrics, so they are only
+    reported when the server runs in this process.
+    """
+    ctx = Context(app)
+    metrics = app.extensions['metrics']
+    results = {}
+    for driver_name in drivers:
+        driver = ClientDriver(app) if driver_name == 'client' else ServerDriver(app, url)
+        try:
+            for name in scenarios or SCENARIOS:
+                build, endpoint = SCENARIOS[name]
+                run_scenario(driver, ctx, build, warmup, concurrency, seed)
+                queries_before = metrics.sql_queries.value(endpoint)
+                elapsed, latencies, errors = run_scenario(driver, ctx, build, requests, concurrency, seed)
+                queries = metrics.sql_queries.value(endpoint) - queries_before
+                results.setdefault(name, {})[driver_name] = {
+                    'requests': len(latencies),
+                    'errors': errors,
+                    'seconds': round(elapsed, 4),
+                    'throughput_rps': round(len(latencies) / elapsed, 2),
+                    'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+                    'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+                    'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+                    'queries_per_request': None if url else round(queries / len(latencies), 2),
+                }
+        finally:
+            driver.close()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__)
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the API hot paths.')
+    parser.add_argument('--database', default='sqlite:///benchmark.db')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='Run only this scenario (repeatable)')
+    parser.add_argument('--driver', action='append', choices=['client', 'server'],
+                        help='Run only through this driver (repeatable)')
+    parser.add_argument('--url', help='Benchmark an already running server instead of an in-process one')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/<time>-<commit>.json)')
+    args = parser.parse_args()
+
+    app = benchmark_app(args.database)
+    started = datetime.utcnow()
+    results = benchmark(app, args.scenario, args.driver or ('client', 'server'), args.requests,
+                        args.concurrency, args.warmup, args.url)
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'started_at': started.isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'database': args.database,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'results': results,
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f'{started.strftime("%Y%m%dT%H%M%S")}-{commit or "unknown"}.json'
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    for name, drivers in results.items():
+        for driver_name, r in drivers.items():
+            print(f'{name:14} {driver_name:6} {r["throughput_rps"]:9.1f} req/s  '
+                  f'p50 {r["p50_ms"]:8.2f} ms  p99 {r["p99_ms"]:8.2f} ms  '
+                  f'{r["queries_per_request"]} queries/req  {r["errors"]} errors')
+    print(f'Saved {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app import db, passwords
+from app.models.models import Customer, CustomerAccount, Order, OrderItem, Product
+
+# Every seeded account logs in with this password
+PASSWORD = 'benchmark-password'
+
+# Rows per INSERT statement; large enough to amortize the round trips,
+# small enough to keep SQLite's bound parameter count in range
+CHUNK_SIZE = 5000
+
+STATUSES = ('pending', 'paid', 'shipped', 'delivered', 'cancelled')
+
+
+def username(customer_id):
+    return f'bench{customer_id}'
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(insert(model), rows[start:start + CHUNK_SIZE])
+
+
+def _chunks(count, build):
+    """Build and insert ``count`` rows a chunk at a time (1M rows never sit in memory)."""
+    for start in range(0, count, CHUNK_SIZE):
+        yield [build(i) for i in range(start + 1, min(start + CHUNK_SIZE, count) + 1)]
+
+
+def seed(products=10000, customers=1000, orders=10000, items_per_order=3, random_seed=42):
+    """Fill an empty database with a synthetic catalog and order history.
+
+    Rows go in through multi-row Core INSERTs, so a million of them take
+    seconds rather than hours. Account ``n`` belongs to customer ``n``
+    (the ids JWTs carry), every account shares one password hash at the
+    configured cost, and stock is large enough that the order benchmark
+    never runs out. Must run inside an app context.
+    """
+    rng = random.Random(random_seed)
+    now = datetime.utcnow()
+    started = time.perf_counter()
+
+    db.create_all()
+    for rows in _chunks(products, lambda i: {
+        'id': i,
+        'name': f'Product {i}',
+        'description': f'Synthetic product {i} in category {i % 50}',
+        'price': round(rng.uniform(1, 500), 2),
+        'stock': 1_000_000,
+        'reserved': 0,
+        'created_at': now - timedelta(minutes=products - i),
+        'updated_at': now,
+        'version_id': 1,
+    }):
+        _insert(Product, rows)
+
+    password = passwords.hash(PASSWORD)
+    for rows in _chunks(customers, lambda i: {
+        'id': i,
+        'name': f'Customer {i}',
+        'email': f'customer{i}@example.com',
+        'phone': f'555{i:07d}',
+        'created_at': now,
+        'updated_at': now,
+    }):
+        _insert(Customer, rows)
+        _insert(CustomerAccount, [{
+            'id': row['id'],
+            'username': username(row['id']),
+            'password': password,
+            'customer_id': row['id'],
+            'is_admin': False,
+            'created_at': now,
+        } for row in rows])
+
+    item_id = 0
+    for start in range(0, orders, CHUNK_SIZE):
+        order_rows, item_rows = [], []
+        for order_id in range(start + 1, min(start + CHUNK_SIZE, orders) + 1):
+            items = []
+            for product_id in rng.sample(range(1, products + 1), min(items_per_order, products)):
+                item_id += 1
+                items.append({
+                    'id': item_id,
+                    'order_id': order_id,
+                    'product_id': product_id,
+                    'quantity': rng.randint(1, 3),
+                    'price': round(rng.uniform(1, 500), 2),
+                })
+            item_rows += items
+            order_rows.append({
+                'id': order_id,
+                'customer_id': rng.randint(1, customers),
+                'order_date': now - timedelta(minutes=rng.randint(0, 525600)),
+                'total_amount': round(sum(i['price'] * i['quantity'] for i in items), 2),
+                'status': rng.choice(STATUSES),
+                'updated_at': now,
+                'version_id': 1,
+            })
+        _insert(Order, order_rows)
+        _insert(OrderItem, item_rows)
+    db.session.commit()
+
+    from app.services.search import product_search
+    product_search.rebuild()
+    return time.perf_counter() - started
+
+
+def main():
+    from benchmarks.run import benchmark_app
+
+    parser = argparse.ArgumentParser(description='Seed a benchmark database.')
+    parser.add_argument('--database', default='sqlite:///benchmark.db')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--items-per-order', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    app = benchmark_app(args.database)
+    with app.app_context():
+        db.drop_all()
+        elapsed = seed(args.products, args.customers, args.orders, args.items_per_order, args.seed)
+    print(f'Seeded {args.products} products, {args.customers} customers and '
+          f'{args.orders} orders in {elapsed:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,139 @@
 import os
+import tempfile
 from datetime import timedelta
 
+def normalize_database_url(url):
+    # Many hosts export DATABASE_URL with the postgres:// scheme, which
+    # SQLAlchemy no longer accepts
+    if url and url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev_key_123'
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///ecommerce.db'
+    SQLALCHEMY_DATABASE_URI = normalize_database_url(os.environ.get('DATABASE_URL')) or 'sqlite:///ecommerce.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # GET/HEAD requests read from this bind when set
+    DATABASE_REPLICA_URL = normalize_database_url(os.environ.get('DATABASE_REPLICA_URL'))
+    # asgi.py reads through an async engine; by default the replica (or
+    # primary) URL with its driver swapped, e.g. sqlite+aiosqlite://
+    ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL')
+    
+    # Connection pool (ignored for SQLite); explicit SQLALCHEMY_ENGINE_OPTIONS win
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+    
+    # SQLite connections run in WAL mode with synchronous=NORMAL
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
     
     # JWT Configuration
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-key-123'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
+    # Verified tokens kept (until they expire) so repeat callers skip the
+    # signature check; 0 verifies every request
+    AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 4096))
+    
+    # Password hashing: bcrypt cost (existing hashes are upgraded on the
+    # next successful login) and the process pool that runs it
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = 32
+    PASSWORD_HASH_QUEUE_TIMEOUT = 1.0
     
     # Cache Configuration
-    CACHE_TYPE = 'simple'
+    # SimpleCache is per process; point CACHE_REDIS_URL at a Redis-compatible
+    # server (requires the redis package) to share one cache between
+    # workers, or use CACHE_TYPE=FileSystemCache as a local shared stand-in.
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+    CACHE_TYPE = os.environ.get('CACHE_TYPE') or ('RedisCache' if CACHE_REDIS_URL else 'SimpleCache')
+    CACHE_DIR = os.environ.get('CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'ecommerce-cache')
+    CACHE_KEY_PREFIX = os.environ.get('CACHE_KEY_PREFIX') or 'ecommerce:'
     CACHE_DEFAULT_TIMEOUT = 300
+    # Entity views are evicted on commit, so they can live much longer
+    CACHE_ENTITY_TIMEOUT = 3600
+    # Stampede protection: single-flight lock lifetime and how long other
+    # requests wait for its holder, plus the XFetch early-refresh factor
+    CACHE_LOCK_TIMEOUT = 10
+    CACHE_LOCK_WAIT = 2.0
+    CACHE_EARLY_REFRESH_BETA = 1.0
+    
+    # Pagination
+    PAGE_SIZE_DEFAULT = 100
+    PAGE_SIZE_MAX = 1000
+    STREAM_BATCH_SIZE = 1000
+    
+    # JSON responses: auto uses orjson when installed; force with orjson
+    # or default (the stdlib encoder)
+    JSON_PROVIDER = os.environ.get('JSON_PROVIDER') or 'auto'
+    
+    # Product search: auto uses SQLite FTS5 when available, else an
+    # in-process inverted index; force either with fts5 or memory
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND') or 'auto'
+    
+    # Orders
+    ORDER_BATCH_MAX = 1000
+    # Checkouts that lose an optimistic-lock race are retried this many
+    # times, backing off exponentially (seconds) between attempts
+    ORDER_RETRY_ATTEMPTS = 3
+    ORDER_RETRY_BACKOFF = 0.01
+    ORDER_RETRY_BACKOFF_MAX = 0.2
+    
+    # Reservations: seconds a checkout may hold stock, and how many expired
+    # holds `flask reservations sweep` frees per transaction
+    RESERVATION_TTL = int(os.environ.get('RESERVATION_TTL', 900))
+    RESERVATION_SWEEP_BATCH = 500
+    
+    # Background jobs: database leaves them to `python worker.py` (or
+    # `flask jobs work`); memory runs them on threads in the web process
+    JOBS_BROKER = os.environ.get('JOBS_BROKER') or 'database'
+    JOBS_WORKER_THREADS = int(os.environ.get('JOBS_WORKER_THREADS', 4))
+    JOBS_POLL_INTERVAL = 1.0
+    JOBS_CLAIM_BATCH = 20
+    JOBS_LEASE_SECONDS = 300
+    JOBS_MAX_ATTEMPTS = 5
+    JOBS_RETRY_BACKOFF = 5
+    JOBS_RETRY_BACKOFF_MAX = 300
+    JOBS_RETENTION_DAYS = 7
+    
+    # Idempotency-Key: how long (seconds) responses are kept for replay,
+    # how long a duplicate waits for an in-flight original, and after how
+    # long an original that never finished is presumed dead
+    IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 86400))
+    IDEMPOTENCY_WAIT = 10.0
+    IDEMPOTENCY_POLL_INTERVAL = 0.05
+    IDEMPOTENCY_LOCK_TIMEOUT = 60
+    
+    # Bulk catalog import: products per upsert transaction, and how many
+    # rejected records an import reports back
+    CATALOG_IMPORT_CHUNK = 2000
+    CATALOG_IMPORT_MAX_ERRORS = 100
+    
+    # Analytics: orders per transaction for `flask analytics backfill`, and
+    # the available stock at or below which /analytics/low-stock lists a product
+    ANALYTICS_BACKFILL_CHUNK = 1000
+    ANALYTICS_LOW_STOCK_THRESHOLD = 5
+    
+    # Metrics: GET /metrics serves Prometheus text for this worker process.
+    # With profiling on, a request sent with "X-Profile: 1" is sampled every
+    # METRICS_PROFILE_INTERVAL seconds and its folded stacks written to
+    # METRICS_PROFILE_DIR (feed them to flamegraph.pl or speedscope).
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    METRICS_PROFILING = os.environ.get('METRICS_PROFILING', 'false').lower() in ('1', 'true', 'yes')
+    METRICS_PROFILE_INTERVAL = 0.001
+    METRICS_PROFILE_DIR = os.environ.get('METRICS_PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'ecommerce-profiles')
     
     # Rate Limiting
+    # memory:// counts per worker; use redis://... (atomic Lua scripts) or
+    # sqlite:///ratelimit.db to share counters between workers and restarts.
+    # fixed-window and sliding-window-counter cost one storage round trip
+    # per hit; response headers would add another, so they stay off.
     RATELIMIT_DEFAULT = "100 per day"
-    RATELIMIT_STORAGE_URL = "memory://"
+    RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI') or "memory://"
+    RATELIMIT_STRATEGY = os.environ.get('RATELIMIT_STRATEGY') or "fixed-window"
+    RATELIMIT_HEADERS_ENABLED = False
+    # Number of proxies in front of the app whose X-Forwarded-For to trust
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 0))